@@ -1,7 +1,9 @@
+import os
 import time
 import board
 from i2ctarget import I2CTarget
 import json
+import ledproto
 
 import rainbowio
 import adafruit_ticks
@@ -23,7 +25,6 @@ from adafruit_led_animation.color import (
     OLD_LACE,
     TEAL,
 )
-from adafruit_led_animation.group import AnimationGroup
 from adafruit_led_animation.animation.blink import Blink
 from adafruit_led_animation.animation.colorcycle import ColorCycle
 from adafruit_led_animation.animation.comet import Comet
@@ -42,8 +43,143 @@ from adafruit_led_animation.sequence import AnimationSequence
 from adafruit_led_animation.helper import PixelMap
 from adafruit_neopxl8 import NeoPxl8
 
+try:
+    from ulab import numpy as np
+except ImportError:
+    # builds without ulab map the strand bytes in python
+    np = None
+
 first_led_pin = board.NEOPIXEL0
 
+# animation name -> (constructor, the PixelStrand settings it takes as keyword args),
+# "color" is the first of the strand colors
+ANIMATIONS = {
+    "blink": (Blink, ("speed", "color")),
+    "colorcycle": (ColorCycle, ("speed", "colors")),
+    "comet": (Comet, ("speed", "color", "tail_length", "bounce")),
+    "chase": (Chase, ("speed", "size", "spacing", "color")),
+    "pulse": (Pulse, ("speed", "period", "color")),
+    "sparkle": (Sparkle, ("speed", "color", "num_sparkles")),
+    "solid": (Solid, ("color",)),
+    "rainbow": (Rainbow, ("speed", "period")),
+    "sparkle_pulse": (SparklePulse, ("speed", "period", "color")),
+    "rainbow_comet": (RainbowComet, ("speed", "tail_length", "bounce")),
+    "rainbow_chase": (RainbowChase, ("speed", "size", "spacing", "step")),
+    "rainbow_sparkle": (RainbowSparkle, ("speed", "num_sparkles")),
+    "custom_color_chase": (CustomColorChase, ("speed", "size", "spacing", "colors")),
+}
+# the animations that read their colors list while running, custom_color_chase copies
+# it when built
+LIVE_COLORS = ("colorcycle",)
+
+
+def set_live(animation, animation_name, speed, colors):
+    """Set speed and colors on a running animation, None leaves one as it is."""
+    if speed is not None:
+        animation.speed = speed
+    if colors is not None:
+        if animation_name in LIVE_COLORS:
+            animation.colors = colors
+        else:
+            animation.color = colors[0]
+
+
+def mix(start, end, t):
+    return (
+        int(start[0] + (end[0] - start[0]) * t),
+        int(start[1] + (end[1] - start[1]) * t),
+        int(start[2] + (end[2] - start[2]) * t),
+    )
+
+
+def runs_overlap(runs, others):
+    """Whether two lists of (strand, start, end) pixel runs share a pixel."""
+    for strand, start, end in runs:
+        for other, other_start, other_end in others:
+            if strand == other and start < other_end and other_start < end:
+                return True
+    return False
+
+
+class Tween:
+    """Moves a running animation's speed and colors to new values over a duration.
+
+    The values are set on the animation as it runs, so it keeps its phase instead of
+    starting over the way a newly built one would.
+    """
+
+    def __init__(self, animation, animation_name, duration, speed, colors) -> None:
+        self.animation = animation
+        self.animation_name = animation_name
+        self.started_ns = time.monotonic_ns()
+        self.duration_ns = int(duration * 1_000_000_000)
+        # (from, to) pairs, None for what the command does not change
+        self.speed = speed
+        self.colors = colors
+
+    def step(self, now) -> bool:
+        """Set the values for now, returns False once the new ones are reached."""
+        t = min((now - self.started_ns) / self.duration_ns, 1.0)
+        speed = None
+        if self.speed is not None:
+            speed = self.speed[0] + (self.speed[1] - self.speed[0]) * t
+        colors = None
+        if self.colors is not None:
+            start, end = self.colors
+            if len(start) == len(end):
+                colors = [mix(start[i], end[i], t) for i in range(len(end))]
+            else:
+                colors = end
+        set_live(self.animation, self.animation_name, speed, colors)
+        return t < 1.0
+
+
+class AnimationCache:
+    """Builds the animations of one strand and keeps the last few around.
+
+    An animation is looked up by its name and the values of the settings it takes, so
+    sending the same command again reuses the object instead of allocating a new one,
+    which keeps the gc from pausing the strands.
+    """
+
+    def __init__(self, strand, max_size=8) -> None:
+        self.strand = strand
+        self.max_size = max_size
+        self.cache = {}
+        # keys oldest first, the least recently built one is dropped when full
+        self.keys = []
+        self.built = 0
+        self.reused = 0
+
+    def forget(self, animation):
+        """Drop animation, its settings were changed while it ran so its key is wrong."""
+        for i in range(len(self.keys)):
+            if self.cache[self.keys[i]] is animation:
+                del self.cache[self.keys.pop(i)]
+                return
+
+    def get(self, animation_name, settings):
+        entry = ANIMATIONS.get(animation_name)
+        if entry is None:
+            raise ValueError("invalid animation name")
+        constructor, params = entry
+        values = [settings["colors"][0] if param == "color" else settings[param] for param in params]
+        key = (animation_name,) + tuple(
+            tuple(value) if isinstance(value, list) else value for value in values
+        )
+        animation = self.cache.get(key)
+        if animation is not None:
+            self.reused += 1
+            return animation
+        animation = constructor(self.strand, **dict(zip(params, values)))
+        self.built += 1
+        if len(self.keys) >= self.max_size:
+            del self.cache[self.keys.pop(0)]
+        self.cache[key] = animation
+        self.keys.append(key)
+        return animation
+
+
 class PixelStrand:
     # Animation settings
     speed: float = 0.1
@@ -57,22 +193,26 @@ class PixelStrand:
     step: int = 1
     animation_name = "comet"
 
-    def __init__(self, strand) -> None:
+    def __init__(self, strand, animation_name="rainbow_comet") -> None:
         self.strand = strand
-        self.active_animation = RainbowComet(
-                self.strand,
-                speed=self.speed,
-                tail_length=self.tail_length,
-                bounce=self.bounce,
-            )
+        self.animations = AnimationCache(strand)
+        # "" starts out showing nothing, like a segment before its first command
+        self.animation_name = animation_name
+        self.active_animation = None
+        if animation_name != "":
+            self.active_animation = self.animations.get(animation_name, self.settings())
+        # a live update still moving the animation's settings, see update_live
+        self.tween = None
 
     def handle_command(self, params: dict) -> None:
+        if self.takes_live(params):
+            self.update_live(params)
+            return
         should_set_anim = True
         anim_name = self.animation_name
         for name, args in params.items():
             if name == "set_animation":
                 self.strand.fill((0, 0, 0))
-                self.strand.show()
                 anim_name = args
             elif name == "speed":
                 self.speed = float(args)
@@ -103,114 +243,103 @@ class PixelStrand:
                 # clear active animation if we're explicitly setting pixel colors and zero all pixels if switching from animation to manual mode
                 if self.active_animation is not None:
                     self.strand.fill((0, 0, 0))
-                    self.strand.show()
                 self.active_animation = None
                 self.animation_name = ""
+                self.tween = None
                 self.set_pixel_colors(args)
+            elif name == "pixel_spans":
+                should_set_anim = False
+                if self.active_animation is not None:
+                    self.strand.fill((0, 0, 0))
+                self.active_animation = None
+                self.animation_name = ""
+                self.tween = None
+                ledproto.apply_pixel_spans(self.strand, args)
             elif name == "sequence":
                 should_set_anim = False
                 self.handle_sequence(args)
+            elif name in ("transition", "brightness"):
+                # transition is only used by live updates, a rebuilt animation starts at
+                # its new values. PixelDisplay handles the strand's brightness
+                pass
 
             else:
                 raise ValueError(f"invalid arg: {name}")
         if should_set_anim:
             self.set_animation(anim_name)
-        self.strand.show()
-    #TODO: refactor this to pass in all attributes as parameters
-    # something like self.active_animation = handleAnimationName()
-    # call this from handle sequence to make this easier, need to figure out
-    # classy parsing.
+
+    def stop(self) -> None:
+        """Stop animating, another strand or segment took over the pixels."""
+        self.active_animation = None
+        self.animation_name = ""
+        self.tween = None
+
+    def takes_live(self, params: dict) -> bool:
+        """Whether every arg can be set on the running animation instead of rebuilding it."""
+        entry = ANIMATIONS.get(self.animation_name)
+        if self.active_animation is None or entry is None:
+            return False
+        for name in params:
+            if name in ("transition", "brightness"):
+                continue
+            if name not in ledproto.LIVE_PARAMS or name not in entry[1]:
+                return False
+            if name == "colors" and self.animation_name not in LIVE_COLORS:
+                return False
+        return True
+
+    def update_live(self, params: dict) -> None:
+        animation = self.active_animation
+        # its settings no longer match the ones it is cached under
+        self.animations.forget(animation)
+        speed = None
+        if "speed" in params:
+            speed = (self.speed, float(params["speed"]))
+            self.speed = speed[1]
+        colors = None
+        if "colors" in params or "color" in params:
+            new_colors = self.parse_colors(params["colors"] if "colors" in params else [params["color"]])
+            colors = (self.colors, new_colors)
+            self.colors = new_colors
+        duration = float(params.get("transition", 0))
+        if duration > 0:
+            self.tween = Tween(animation, self.animation_name, duration, speed, colors)
+        else:
+            # no allocation beyond the decoded command, for dense sweeps from the host
+            self.tween = None
+            set_live(
+                animation,
+                self.animation_name,
+                None if speed is None else speed[1],
+                None if colors is None else colors[1],
+            )
+
+    def step_tween(self, now) -> None:
+        if not self.tween.step(now):
+            self.tween = None
+
+    def settings(self) -> dict:
+        """The current animation settings, by the keyword each animation constructor takes."""
+        return {
+            "speed": self.speed,
+            "colors": self.colors,
+            "tail_length": self.tail_length,
+            "bounce": self.bounce,
+            "size": self.size,
+            "spacing": self.spacing,
+            "period": self.period,
+            "num_sparkles": self.num_sparkles,
+            "step": self.step,
+        }
+
     def set_animation(self, animation_name: str):
         print(f"animation name: {animation_name}")
-        self.active_animation = self.handle_animation_name(
-            animation_name,
-            self.strand,
-            self.speed,
-            self.colors,
-            self.tail_length,
-            self.bounce,
-            self.size,
-            self.spacing,
-            self.period,
-            self.num_sparkles,
-            self.step
-        )
+        self.active_animation = self.animations.get(animation_name, self.settings())
+        self.tween = None
+        # a command restarts the animation, also when it is one built before
+        self.active_animation.reset()
         self.animation_name = animation_name
 
-    @classmethod
-    def handle_animation_name(cls, animation_name, strand, speed, colors, tail_length,
-                            bounce, size, spacing, period, num_sparkles, step):
-        if animation_name == "blink":
-            return Blink(strand, speed=speed, color=colors[0])
-        elif animation_name == "colorcycle":
-            return ColorCycle(strand, speed=speed, colors=colors)
-        elif animation_name == "comet":
-            return Comet(
-                strand,
-                speed=speed,
-                color=colors[0],
-                tail_length=tail_length,
-                bounce=bounce,
-            )
-        elif animation_name == "chase":
-            return Chase(
-                strand,
-                speed=speed,
-                size=size,
-                spacing=spacing,
-                color=colors[0],
-            )
-        elif animation_name == "pulse":
-            return Pulse(
-                strand, speed=speed, period=period, color=colors[0]
-            )
-        elif animation_name == "sparkle":
-            return Sparkle(
-                strand,
-                speed=speed,
-                color=colors[0],
-                num_sparkles=num_sparkles,
-            )
-        elif animation_name == "solid":
-            return Solid(strand, color=colors[0])
-        elif animation_name == "rainbow":
-            return Rainbow(
-                strand, speed=speed, period=period
-            )
-        elif animation_name == "sparkle_pulse":
-            return SparklePulse(
-                strand, speed=speed, period=period, color=colors[0]
-            )
-        elif animation_name == "rainbow_comet":
-            return RainbowComet(
-                strand,
-                speed=speed,
-                tail_length=tail_length,
-                bounce=bounce,
-            )
-        elif animation_name == "rainbow_chase":
-            return RainbowChase(
-                strand,
-                speed=speed,
-                size=size,
-                spacing=spacing,
-                step=step,
-            )
-        elif animation_name == "rainbow_sparkle":
-            return RainbowSparkle(
-                strand, speed=speed, num_sparkles=num_sparkles
-            )
-        elif animation_name == "custom_color_chase":
-            return CustomColorChase(
-                strand,
-                speed=speed,
-                size=size,
-                spacing=spacing,
-                colors=colors,
-            )
-        else:
-            raise ValueError("invalid animation name")
-
     def get_color(self, color: str) -> adafruit_led_animation.color:
         color_map = {
             "amber": AMBER,
@@ -248,7 +377,6 @@ class PixelStrand:
         for pixel, color in pixel_colors.items():
             # convert from floats to ints
             self.strand[int(pixel)] = [int(y) for y in color]
-        self.strand.show()
 
     def get_active_animation(self) -> Animation:
         return self.active_animation
@@ -257,28 +385,74 @@ class PixelStrand:
         print("handling sequence")
         animations = []
         for animation in sequence.get("animations", []):
-            animation_name = animation["set_animation"]
-            speed = float(animation.get("speed", self.speed))
-            tail_length = int(animation.get("tail_length", self.tail_length))
-            bounce = int(animation.get("bounce", self.bounce))
-            size = int(animation.get("size", self.size))
-            spacing = int(animation.get("spacing", self.spacing))
-            period = int(animation.get("period", self.period))
-            num_sparkles = int(animation.get("num_sparkles", self.num_sparkles))
-            step = int(animation.get("step", self.step))
-
+            settings = self.settings()
+            for name in ("tail_length", "bounce", "size", "spacing", "period", "num_sparkles", "step"):
+                if name in animation:
+                    settings[name] = int(animation[name])
+            if "speed" in animation:
+                settings["speed"] = float(animation["speed"])
             colors = animation.get("colors", [])
-            if len(colors) == 0:
-                colors = self.colors
-            else:
-                colors = self.parse_colors(colors)
-            animations.append(self.handle_animation_name(animation_name, self.strand, speed, colors, tail_length, bounce, size, spacing, period, num_sparkles, step))
+            if len(colors) > 0:
+                settings["colors"] = self.parse_colors(colors)
+            animations.append(self.animations.get(animation["set_animation"], settings))
 
         sequence = AnimationSequence(*animations, advance_interval=float(sequence.get("duration", 0)), auto_clear=True)
         self.active_animation = sequence
         self.animation_name = "sequence"
+        self.tween = None
 
 
+# levels a brightness fade steps through, and how many of their 256 byte tables are
+# kept, a few more than one fade from dark to full uses
+FADE_STEPS = 64
+MAX_LEVEL_TABLES = 80
+
+
+class StrandNeoPxl8(NeoPxl8):
+    """NeoPxl8 that maps every strand's bytes through its own 256 byte table on show.
+
+    The animations keep writing full colors and the tables, see ledproto.brightness_table,
+    are applied to the bytes on their way to the dma buffer. So dimming one strand
+    changes neither its pixels nor the other strands, and nothing is reallocated.
+    """
+
+    def __init__(self, *args, strand_bytes, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.strand_bytes = strand_bytes
+        # a table per strand, None for one sent as it is
+        self.tables = [None] * kwargs["num_strands"]
+        self.mapping = False
+        self.mapped = None
+
+    def set_table(self, strand, table) -> None:
+        self.tables[strand] = table
+        self.mapping = False
+        for t in self.tables:
+            if t is not None:
+                self.mapping = True
+
+    def _transmit(self, buffer):
+        if not self.mapping:
+            super()._transmit(buffer)
+            return
+        if self.mapped is None or len(self.mapped) != len(buffer):
+            self.mapped = bytearray(len(buffer))
+        mapped = memoryview(self.mapped)
+        source = memoryview(buffer)
+        size = self.strand_bytes
+        for strand in range(len(self.tables)):
+            table = self.tables[strand]
+            start = strand * size
+            end = start + size
+            if table is None:
+                mapped[start:end] = source[start:end]
+            elif np is not None:
+                values = np.frombuffer(buffer, dtype=np.uint8, count=size, offset=start)
+                mapped[start:end] = np.take(np.frombuffer(table, dtype=np.uint8), values).tobytes()
+            else:
+                for i in range(start, end):
+                    self.mapped[i] = table[buffer[i]]
+        super()._transmit(self.mapped)
 
 
 class PixelDisplay:
@@ -289,14 +463,46 @@ class PixelDisplay:
 
     pixels = None
     strand_list = []
-    has_active_animations = False
+    # the host renders every frame and streams it, the display only shows what it gets
+    host_render = False
+
+    # what each strand plays, by strand index, None for a strand showing pixels set by hand.
+    # a command swaps one entry, the others keep running without losing their timing
+    animations = []
+    # some pixel changed since the last show, all strands share one buffer so one show
+    # per loop pushes every change and a display with nothing animating stays idle
+    dirty = False
+    shows = 0
+
+    # logical strands numbered after the physical ones, the runs they were defined with
+    # and for every strand and segment the others sharing pixels with it, see define_segments
+    segments = []
+    overlaps = []
+    # which strands and segments show what they were last told, the others were taken over
+    showing = []
 
-    animations: AnimationGroup = None
+    # the gamma corrected color bytes, and the brightness tables scaled from them by level
+    curve = None
+    curve_gamma = None
+    level_tables = {}
 
-    def __init__(self, num_strands, strand_length, brightness) -> None:
-        self.reconfigure(num_strands, strand_length, brightness)
+    def __init__(self, num_strands, strand_length, brightness, host_render=False, gamma=1.0) -> None:
+        self.reconfigure(num_strands, strand_length, brightness, host_render, gamma)
 
-    def reconfigure(self, num_strands, strand_length, brightness) -> None:
+    def reconfigure(self, num_strands, strand_length, brightness, host_render=False, gamma=1.0) -> None:
+        self.host_render = host_render
+        self.gamma = gamma
+        if (
+            self.pixels is not None
+            and num_strands in (0, self.num_strands)
+            and strand_length in (0, self.strand_length)
+        ):
+            # same pixel buffer, keep it and whatever the strands are playing
+            if brightness != 0.0:
+                self.brightness = brightness
+            self.update_tables()
+            print(f"reconfigured with brightness of {self.brightness} and gamma {self.gamma}, strands unchanged")
+            return
         if num_strands != 0:
             self.num_strands = num_strands
         if strand_length != 0:
@@ -306,46 +512,194 @@ class PixelDisplay:
         if self.pixels is not None:
             self.pixels.deinit()
             # del self.pixels
-        self.pixels = NeoPxl8(
+        self.pixels = StrandNeoPxl8(
             first_led_pin,
             self.strand_length * self.num_strands,
             num_strands=self.num_strands,
             auto_write=False,
             brightness=self.brightness,
+            strand_bytes=self.strand_length * 3,
         )
+        # every strand's brightness on top of the display's, and the fades moving them
+        self.levels = [1.0] * self.num_strands
+        self.fades = {}
+        self.update_tables()
         print("set pixels")
         self.strand_list =  [PixelStrand(self.strand(i, self.strand_length)) for i in range(self.num_strands)]
         print("set strand list")
         print(
             f"reconfigured with {self.num_strands} strands, {self.strand_length} pixels per strand, and brigthness of {self.brightness}"
         )
-        self.regenerate_animation_group()
+        self.animations = [pxs.get_active_animation() for pxs in self.strand_list]
+        # the host defines the segments again for the new strands
+        self.segments = []
+        self.overlaps = [[] for _ in range(self.num_strands)]
+        self.showing = [True] * self.num_strands
+        self.dirty = True
+
+    def define_segments(self, segments):
+        """Add segments, see ledproto.encode_segments, as the strands after the physical ones.
+
+        The pixel indices of each segment and which strands and segments share pixels are
+        worked out once here, after that a command reaches a segment through its PixelMap
+        the way it reaches a strand.
+        """
+        if segments == self.segments:
+            return
+        if len(segments) > ledproto.MAX_SEGMENTS:
+            raise ValueError(f"at most {ledproto.MAX_SEGMENTS} segments")
+        # every strand and segment as its (strand, start, end) runs
+        runs = [[(i, 0, self.strand_length)] for i in range(self.num_strands)]
+        maps = []
+        for segment in segments:
+            indices = []
+            for strand, start, end, reverse in segment:
+                if not 0 <= strand < self.num_strands or not 0 <= start < end <= self.strand_length:
+                    raise ValueError(f"segment run {strand}:{start}-{end} is outside the display")
+                first = strand * self.strand_length
+                if reverse:
+                    indices.extend(range(first + end - 1, first + start - 1, -1))
+                else:
+                    indices.extend(range(first + start, first + end))
+            maps.append(PixelMap(self.pixels, indices, individual_pixels=True))
+            runs.append([(run[0], run[1], run[2]) for run in segment])
+        # the old segments go dark, strands they took over stay dark until told otherwise
+        for i in range(self.num_strands, len(self.strand_list)):
+            if self.showing[i]:
+                self.strand_list[i].strand.fill((0, 0, 0))
+        del self.strand_list[self.num_strands :]
+        del self.animations[self.num_strands :]
+        for pixel_map in maps:
+            self.strand_list.append(PixelStrand(pixel_map, ""))
+            self.animations.append(None)
+        self.showing = self.showing[: self.num_strands] + [False] * len(maps)
+        self.overlaps = [
+            [j for j in range(len(runs)) if j != i and runs_overlap(runs[i], runs[j])]
+            for i in range(len(runs))
+        ]
+        self.segments = segments
+        self.dirty = True
+        print(f"defined {len(segments)} segments")
+
+    def claim(self, index):
+        """Stop the strands and segments sharing pixels with index, the last one addressed shows."""
+        for other in self.overlaps[index]:
+            if self.showing[other]:
+                pxs = self.strand_list[other]
+                pxs.stop()
+                pxs.strand.fill((0, 0, 0))
+                self.animations[other] = None
+                self.showing[other] = False
+        self.showing[index] = True
+
+    def set_brightness(self, brightness):
+        # scaled on show, no need to touch the strands
+        self.brightness = brightness
+        self.update_tables()
+
+    def update_tables(self):
+        """Show the strands at their levels, NeoPxl8 scales alone while no table is needed."""
+        # the gamma curve is worked out once per gamma, the tables are scaled from it and
+        # only hold for one display brightness
+        if self.curve_gamma != self.gamma:
+            self.curve = ledproto.gamma_curve(self.gamma)
+            self.curve_gamma = self.gamma
+        self.level_tables = {}
+        if self.gamma == 1.0 and all(level == 1.0 for level in self.levels):
+            self.pixels.brightness = self.brightness
+            for strand in range(self.num_strands):
+                self.pixels.set_table(strand, None)
+        else:
+            # the tables apply the display brightness too, after the gamma correction
+            self.pixels.brightness = 1.0
+            for strand in range(self.num_strands):
+                self.pixels.set_table(strand, self.level_table(self.levels[strand]))
+        self.dirty = True
+
+    def level_table(self, level):
+        """The table of a strand at level, built on first use and shared by every strand at it."""
+        table = self.level_tables.get(level)
+        if table is None:
+            if len(self.level_tables) > MAX_LEVEL_TABLES:
+                self.level_tables = {}
+            table = ledproto.scale_curve(self.curve, self.brightness * level)
+            self.level_tables[level] = table
+        return table
+
+    def set_level(self, strand, level):
+        if level == self.levels[strand]:
+            return
+        self.levels[strand] = level
+        if self.pixels.mapping:
+            self.pixels.set_table(strand, self.level_table(level))
+            self.dirty = True
+        else:
+            self.update_tables()
+
+    def fade(self, strand, level, duration):
+        level = min(max(level, 0.0), 1.0)
+        if duration > 0:
+            self.fades[strand] = (time.monotonic_ns(), int(duration * 1_000_000_000), self.levels[strand], level)
+        else:
+            self.fades.pop(strand, None)
+            self.set_level(strand, level)
+
+    def step_fades(self, now):
+        for strand in list(self.fades):
+            started, duration, start, end = self.fades[strand]
+            t = min((now - started) / duration, 1.0)
+            # fades step through FADE_STEPS levels, so they reuse the tables of earlier ones
+            level = int((start + (end - start) * t) * FADE_STEPS + 0.5) / FADE_STEPS
+            self.set_level(strand, end if t >= 1.0 else level)
+            if t >= 1.0:
+                del self.fades[strand]
 
     def animate(self):
-        if self.animations == None:
-            self.regenerate_animation_group()
-        # animation legnth of 0 is ok, means all pixels are manually setting values.
-        if self.has_active_animations:
-            self.animations.animate()
+        if len(self.fades) > 0:
+            self.step_fades(time.monotonic_ns())
+        if not self.host_render:
+            now = time.monotonic_ns()
+            for pxs in self.strand_list:
+                if pxs.tween is not None:
+                    pxs.step_tween(now)
+            for animation in self.animations:
+                # active animation can be none if we manually set pixel colors
+                if animation is not None and animation.animate(False):
+                    self.dirty = True
+        if self.dirty:
+            self.pixels.show()
+            self.shows += 1
+            self.dirty = False
 
     def set_animation(self, strand_index: int, params: dict):
         if strand_index >= len(self.strand_list):
             raise ValueError("index out of bound for configured number of leds")
-        self.strand_list[strand_index].handle_command(params)
-        self.regenerate_animation_group()
-
-    def regenerate_animation_group(self):
-        raw_anim = []
-        for pxs in self.strand_list:
-            a = pxs.get_active_animation()
-            # active animation can be none if we manually set pixel colors
-            if a is not None:
-                raw_anim.append(a)
-        if len(raw_anim) > 0:
-            self.animations = AnimationGroup(*raw_anim)
-            self.has_active_animations = True
-        else:
-            self.has_active_animations = False
+        pxs = self.strand_list[strand_index]
+        if "brightness" in params:
+            if strand_index >= self.num_strands:
+                raise ValueError("brightness dims whole strands, not segments")
+            self.fade(strand_index, float(params["brightness"]), float(params.get("transition", 0)))
+            if all(name in ("brightness", "transition") for name in params):
+                return
+        if len(self.overlaps[strand_index]) > 0:
+            self.claim(strand_index)
+        pxs.handle_command(params)
+        self.animations[strand_index] = pxs.get_active_animation()
+        self.dirty = True
+
+    def show_frame(self, command: dict):
+        # host render mode, copy the streamed spans into the buffer, animate() pushes it out
+        for key in command:
+            params = command[key]
+            strand = self.strand_list[int(key)].strand
+            if "pixel_spans" in params:
+                ledproto.apply_pixel_spans(strand, params["pixel_spans"])
+            elif "set_pixel_colors" in params:
+                for pixel, color in params["set_pixel_colors"].items():
+                    strand[int(pixel)] = [int(y) for y in color]
+            else:
+                raise ValueError("only pixel frames are accepted in host render mode")
+        self.dirty = True
 
     def strand(self, n, pixels_count):
         return PixelMap(
@@ -356,16 +710,631 @@ class PixelDisplay:
 
 
 
-NUM_FETCHES = 100
+# boards sharing a bus need their own address, set MULTI_LED_I2C_ADDRESS = "0x41" in
+# settings.toml on every board after the first one
+I2C_ADDRESS = os.getenv("MULTI_LED_I2C_ADDRESS", "0x40")
+if isinstance(I2C_ADDRESS, str):
+    I2C_ADDRESS = int(I2C_ADDRESS, 16)
+# a message is abandoned when no byte arrived for this long
+RECEIVE_GAP_NS = 20_000_000
+READ_SIZE = 32
+# the largest part of a message the firmware can take, one strand's entry of a json
+# message or one binary frame, allocated once at startup
+RECEIVE_BUFFER_SIZE = 8192
+# parts of received messages waiting for time in the i/o slot, past this they are
+# handled even if it delays the next frame
+MAX_DEFERRED = 8
 
 pixel_display = None
 
-error_text = ""
 
-with I2CTarget(board.SCL, board.SDA, (0x40,)) as device:
+class DeviceStatus:
+    """What the host gets back when it reads from the device."""
+
+    def __init__(self) -> None:
+        # seq of the last message received intact
+        self.seq = ledproto.SEQ_NONE
+        self.code = ledproto.STATUS_OK
+        # frames dropped because they were damaged, wraps at 256
+        self.bad_frames = 0
+        self.error_text = ""
+        # seq of the message being handled
+        self.current = ledproto.SEQ_NONE
+
+    def start(self, seq) -> bool:
+        self.current = seq
+        # streamed pixels and other messages the host does not wait for leave the
+        # acknowledgement of the last acknowledged one as it is
+        if seq == ledproto.SEQ_NONE:
+            return True
+        # a resend of the message we already applied only needs acknowledging again
+        if seq == self.seq:
+            return False
+        self.seq = seq
+        self.code = ledproto.STATUS_OK
+        self.error_text = ""
+        return True
+
+    def fail(self, e) -> None:
+        print(e)
+        self.error_text = str(e)
+        if self.current != ledproto.SEQ_NONE:
+            self.code = ledproto.STATUS_ERROR
+
+    def bad_frame(self, e) -> None:
+        self.bad_frames = (self.bad_frames + 1) & 0xFF
+        self.fail(e)
+
+    def encode(self, receive_ms):
+        return ledproto.encode_status(
+            self.seq, self.code, self.bad_frames, receive_ms, self.error_text
+        )
+
+
+status = DeviceStatus()
+
+
+class FrameStats:
+    """How often the main loop ran and pushed pixels out, over the last whole second."""
+
+    def __init__(self) -> None:
+        self.loops = 0
+        self.window_start_ns = time.monotonic_ns()
+        self.window_loops = 0
+        self.window_shows = 0
+        self.loops_per_s = 0
+        self.shows_per_s = 0
+
+    def tick(self, now, shows) -> None:
+        self.loops += 1
+        elapsed = now - self.window_start_ns
+        if elapsed >= 1_000_000_000:
+            self.loops_per_s = (self.loops - self.window_loops) * 1_000_000_000 // elapsed
+            self.shows_per_s = (shows - self.window_shows) * 1_000_000_000 // elapsed
+            self.window_start_ns = now
+            self.window_loops = self.loops
+            self.window_shows = shows
+
+    def encode(self, shows, scheduler):
+        return ledproto.encode_stats(
+            self.shows_per_s,
+            self.loops_per_s,
+            shows,
+            scheduler.late_frames,
+            scheduler.dropped_frames,
+            scheduler.deferred,
+        )
+
+
+frame_stats = FrameStats()
+
+
+class FrameScheduler:
+    """Paces the main loop at frame_rate frames per second.
+
+    Every tick starts with the render slot, animate() and its show. The rest of the tick
+    is the i/o slot: the bus is served the whole time, but a received message is only
+    handled when the time handling usually takes fits before the next frame, otherwise
+    it waits for the next tick. The first message of a tick is always handled so a slow
+    display can not starve the host. frame_rate 0 renders on every loop iteration.
+    """
+
+    def __init__(self) -> None:
+        self.period_ns = 0
+        self.next_frame_ns = 0
+        self.frames = 0
+        # frames that started more than half a tick after they were due
+        self.late_frames = 0
+        # ticks that went by without a frame at all
+        self.dropped_frames = 0
+        # messages handled in a later tick than the one they arrived in
+        self.deferred = 0
+        # rolling estimate of how long handling a message takes
+        self.handle_ns = 0
+        self.handled_this_tick = False
+
+    def configure(self, frame_rate) -> None:
+        self.period_ns = 1_000_000_000 // int(frame_rate) if frame_rate > 0 else 0
+        self.next_frame_ns = time.monotonic_ns()
+
+    def frame_due(self, now) -> bool:
+        return now >= self.next_frame_ns
+
+    def rendered(self, started) -> None:
+        self.frames += 1
+        self.handled_this_tick = False
+        if self.period_ns == 0:
+            return
+        behind = started - self.next_frame_ns
+        if behind >= self.period_ns:
+            # skip the missed ticks rather than rushing frames out to catch up
+            missed = behind // self.period_ns
+            self.dropped_frames += missed
+            self.next_frame_ns += missed * self.period_ns
+            behind -= missed * self.period_ns
+        if behind > self.period_ns // 2:
+            self.late_frames += 1
+        self.next_frame_ns += self.period_ns
+
+    def fits(self, now) -> bool:
+        return (
+            self.period_ns == 0
+            or not self.handled_this_tick
+            or now + self.handle_ns < self.next_frame_ns
+        )
+
+    def handled(self, elapsed) -> None:
+        self.handled_this_tick = True
+        if self.handle_ns == 0:
+            self.handle_ns = elapsed
+        else:
+            self.handle_ns = (self.handle_ns * 3 + elapsed) // 4
+
+    def request_timeout(self, now):
+        """How long device.request() may wait for the host, -1 only checks once."""
+        if self.period_ns == 0 or now >= self.next_frame_ns:
+            return -1
+        return (self.next_frame_ns - now) / 1_000_000_000
+
+
+scheduler = FrameScheduler()
+
+
+# preset id -> scene, {strand index: command}, decoded once when stored
+presets = {}
+
+
+def apply_strand_commands(command):
+    for key in command:
+        try:
+            pixel_display.set_animation(int(key), command[key])
+        except Exception as e:
+            status.fail(e)
+
+
+class Timeline:
+    """Keyframes the host loaded, played against this board's own clock.
+
+    Every keyframe is a scene, {strand index: command}, applied once the playback
+    position passes its time, so when it shows does not depend on when the host's
+    messages arrive. Seeking applies every keyframe up to the new position, the strands
+    end up the way playing through would have left them.
+    """
+
+    def __init__(self) -> None:
+        self.clear(False, 0)
+
+    def clear(self, loop, length_ns) -> None:
+        # (ns from the start, scene) in time order
+        self.keyframes = []
+        self.loop = loop
+        self.length_ns = length_ns
+        self.playing = False
+        # monotonic time of position 0 while playing, the position itself while stopped
+        self.origin_ns = 0
+        self.position_ns = 0
+        # index of the next keyframe to apply
+        self.next = 0
+
+    def add(self, at_ns, scene) -> None:
+        if len(self.keyframes) >= ledproto.MAX_KEYFRAMES:
+            raise ValueError(f"a timeline holds at most {ledproto.MAX_KEYFRAMES} keyframes")
+        # the host sends them in order, so this is an append
+        i = len(self.keyframes)
+        while i > 0 and self.keyframes[i - 1][0] > at_ns:
+            i -= 1
+        self.keyframes.insert(i, (at_ns, scene))
+
+    def seek(self, position_ns, now) -> None:
+        if self.loop and self.length_ns > 0:
+            position_ns %= self.length_ns
+        self.next = 0
+        self.apply_until(position_ns)
+        self.origin_ns = now - position_ns
+        self.position_ns = position_ns
+
+    def start(self, position_ns, now) -> None:
+        if position_ns < 0:
+            position_ns = self.position_ns
+        self.seek(position_ns, now)
+        self.playing = True
+
+    def stop(self, now) -> None:
+        if self.playing:
+            self.position_ns = now - self.origin_ns
+            self.playing = False
+
+    def apply_until(self, position_ns) -> None:
+        while self.next < len(self.keyframes) and self.keyframes[self.next][0] <= position_ns:
+            apply_strand_commands(self.keyframes[self.next][1])
+            self.next += 1
+
+    def run(self, now) -> None:
+        """Apply the keyframes that came due, called before every frame."""
+        if not self.playing:
+            return
+        position_ns = now - self.origin_ns
+        self.apply_until(position_ns)
+        while self.loop and self.length_ns > 0 and position_ns >= self.length_ns:
+            # start over keeping the phase, keyframes at 0 apply again
+            self.origin_ns += self.length_ns
+            position_ns -= self.length_ns
+            self.next = 0
+            self.apply_until(position_ns)
+
+
+timeline = Timeline()
+
+
+def seconds_to_ns(seconds):
+    return int(seconds * 1_000_000_000)
+
+
+def handle_message(command):
+    global pixel_display
+    if "store_preset" in command:
+        preset = command["store_preset"]
+        preset_id = int(preset["id"])
+        if not 0 <= preset_id < ledproto.MAX_PRESETS:
+            status.fail(f"preset id {preset_id} out of range")
+        else:
+            presets[preset_id] = preset["scene"]
+    elif "delete_preset" in command:
+        presets.pop(int(command["delete_preset"]), None)
+    elif "timeline_clear" in command:
+        sub_command = command["timeline_clear"]
+        timeline.clear(bool(sub_command["loop"]), seconds_to_ns(sub_command["length"]))
+    elif "timeline_keyframe" in command:
+        keyframe = command["timeline_keyframe"]
+        timeline.add(seconds_to_ns(keyframe["at"]), keyframe["scene"])
+    elif "timeline_stop" in command:
+        timeline.stop(time.monotonic_ns())
+    elif "reconfigure" in command:
+        sub_command = command["reconfigure"]
+        if pixel_display is not None:
+            pixel_display.reconfigure(
+                sub_command["num_strands"],
+                sub_command["strand_length"],
+                sub_command["brightness"],
+                sub_command.get("host_render", False),
+                sub_command.get("gamma", 1.0),
+            )
+        else:
+            pixel_display = PixelDisplay(
+                sub_command["num_strands"],
+                sub_command["strand_length"],
+                sub_command["brightness"],
+                sub_command.get("host_render", False),
+                sub_command.get("gamma", 1.0),
+            )
+        scheduler.configure(sub_command.get("frame_rate", 0))
+    elif pixel_display is None:
+        status.fail("not configured yet")
+    elif "set_brightness" in command:
+        try:
+            pixel_display.set_brightness(float(command["set_brightness"]))
+        except Exception as e:
+            status.fail(e)
+    elif "define_segments" in command:
+        try:
+            pixel_display.define_segments(command["define_segments"])
+        except Exception as e:
+            status.fail(e)
+    elif "timeline_start" in command:
+        position = command["timeline_start"]
+        timeline.start(-1 if position == ledproto.TIMELINE_HERE else seconds_to_ns(position), time.monotonic_ns())
+    elif "timeline_seek" in command:
+        timeline.seek(seconds_to_ns(command["timeline_seek"]), time.monotonic_ns())
+    elif "recall_preset" in command:
+        scene = presets.get(int(command["recall_preset"]))
+        if scene is None:
+            status.fail(f"unknown preset {command['recall_preset']}")
+        else:
+            apply_strand_commands(scene)
+    elif pixel_display.host_render:
+        try:
+            pixel_display.show_frame(command)
+        except Exception as e:
+            status.fail(e)
+    else:
+        apply_strand_commands(command)
+
+
+# the kinds of message MessageReceiver tells apart by their first byte
+KIND_JSON = 1
+KIND_BINARY = 2
+# bytes between json tokens, the nul bytes are padding some adapters add to a write
+JSON_SPACE = b" \t\r\n\x00"
+
+
+class MessageReceiver:
+    """Parses messages while their bytes arrive, in one buffer allocated up front.
+
+    A message is one json object or a run of binary frames. Every top level entry of a
+    json message, one strand's command say, and every binary frame is handed to dispatch
+    as soon as its last byte is in, then dropped from the buffer. So a message can be
+    any size, only its largest part has to fit in RECEIVE_BUFFER_SIZE, and a message can
+    span several write transactions while animations keep rendering. A json message ends
+    once its braces balance, binary frames once a transaction ends on a frame boundary,
+    the host never ends a transaction between two frames of one message.
+    """
+
+    def __init__(self, dispatch, size=RECEIVE_BUFFER_SIZE) -> None:
+        # called with (first, seq, command, error), first for the first part of a message
+        self.dispatch = dispatch
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.started_ns = 0
+        self.last_byte_ns = 0
+        # register the host selected last, reads answer with it
+        self.register = ledproto.REG_STATUS
+        # how long the last complete message took from its first to its last byte
+        self.last_receive_ms = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self.length = 0
+        # KIND_JSON or KIND_BINARY while a message is received, None between messages
+        self.kind = None
+        self.first = True
+        # json scanner state, the buffer holds the entry being received from part_start on
+        self.scanned = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.part_start = 0
+        self.part_empty = True
+        # dropping the rest of a json entry that did not fit the buffer
+        self.overflow = False
+        # bytes still to drop of a binary frame that does not fit the buffer
+        self.skip = 0
+
+    def discard(self, n) -> None:
+        rest = self.length - n
+        if rest > 0:
+            self.view[0:rest] = self.view[n : self.length]
+        self.length = rest
+        self.scanned -= n
+        self.part_start -= n
+
+    def emit(self, seq, command, error=None) -> None:
+        self.dispatch(self.first, seq, command, error)
+        self.first = False
+
+    def end_message(self) -> None:
+        self.last_receive_ms = (self.last_byte_ns - self.started_ns) / 1_000_000
+        print(f"received a message in {self.last_receive_ms} ms")
+        self.kind = None
+        self.first = True
+
+    def fail(self, e) -> None:
+        """Drop what is buffered of a damaged message, the parts dispatched already stay applied."""
+        self.emit(ledproto.SEQ_NONE, None, f"invalid message: {e}")
+        self.reset()
+
+    def feed(self, data, offset=0) -> None:
+        while offset < len(data):
+            n = min(len(data) - offset, len(self.buffer) - self.length)
+            self.view[self.length : self.length + n] = data[offset : offset + n]
+            self.length += n
+            offset += n
+            self.process()
+            if self.length == len(self.buffer):
+                # nothing could be dispatched from a full buffer
+                if not self.overflow:
+                    self.emit(ledproto.SEQ_NONE, None, f"message part longer than {len(self.buffer)} bytes")
+                    self.overflow = True
+                self.discard(self.length)
+                self.part_start = 0
+
+    def process(self) -> None:
+        while self.length > 0:
+            if self.kind is None:
+                start = 0
+                while start < self.length and self.buffer[start] in JSON_SPACE:
+                    start += 1
+                self.discard(start)
+                if self.length == 0:
+                    return
+                self.started_ns = self.last_byte_ns
+                if self.buffer[0] == ledproto.MAGIC:
+                    self.kind = KIND_BINARY
+                elif self.buffer[0] == ord("{"):
+                    self.kind = KIND_JSON
+                    self.scanned = 0
+                    self.depth = 0
+                else:
+                    self.fail(f"unexpected byte 0x{self.buffer[0]:02x}")
+                    return
+            if self.kind == KIND_BINARY:
+                if not self.process_frame():
+                    return
+            elif not self.process_json():
+                return
+
+    def process_frame(self) -> bool:
+        """Dispatch the binary frame at the start of the buffer, False until it is all in."""
+        if self.skip > 0:
+            n = min(self.skip, self.length)
+            self.skip -= n
+            self.discard(n)
+            return self.skip == 0
+        if self.length < ledproto.HEADER_SIZE:
+            return False
+        try:
+            total = ledproto.frame_length(self.buffer)
+        except ledproto.ProtocolError as e:
+            self.fail(e)
+            return False
+        if total > len(self.buffer):
+            self.emit(ledproto.SEQ_NONE, None, f"frame of {total} bytes does not fit the receive buffer")
+            self.skip = total
+            return True
+        if self.length < total:
+            return False
+        try:
+            # decoded from a copy, commands may point into it and wait for a later frame
+            _, seq, command, _ = ledproto.decode_frame(bytes(self.view[:total]))
+        except Exception as e:
+            self.emit(ledproto.SEQ_NONE, None, f"invalid message: {e}")
+        else:
+            self.emit(seq, command)
+        self.discard(total)
+        return True
+
+    def process_json(self) -> bool:
+        """Scan what arrived of a json message, dispatching every entry it completes.
+
+        Returns True once the message ended, the rest of the buffer is the next one.
+        """
+        buffer = self.buffer
+        i = self.scanned
+        while i < self.length:
+            byte = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif byte == 0x5C:  # backslash
+                    self.escape = True
+                elif byte == 0x22:  # quote
+                    self.in_string = False
+            elif byte in JSON_SPACE:
+                buffer[i] = 0x20
+            elif byte == 0x22:
+                self.in_string = True
+                self.part_empty = False
+            elif byte == 0x7B or byte == 0x5B:  # { [
+                self.depth += 1
+                if self.depth == 1:
+                    self.part_start = i + 1
+                    self.part_empty = True
+                else:
+                    self.part_empty = False
+            elif self.depth == 1 and (byte == 0x2C or byte == 0x7D):
+                # an entry of the top level object ends, at its comma or the closing brace
+                self.scanned = i
+                self.emit_entry(i)
+                i = self.scanned
+                if byte != 0x2C:
+                    self.depth = 0
+                    self.discard(i + 1)
+                    self.end_message()
+                    return True
+                self.part_start = i + 1
+                self.part_empty = True
+            elif byte == 0x7D or byte == 0x5D:  # } ]
+                self.depth -= 1
+            else:
+                self.part_empty = False
+            i += 1
+        self.scanned = i
+        return False
+
+    def emit_entry(self, end) -> None:
+        # the entry is buffer[part_start:end], the byte before it and the one at end
+        # become its braces so it parses as an object of its own
+        if self.overflow:
+            self.overflow = False
+        elif not self.part_empty:
+            start = self.part_start - 1
+            self.buffer[start] = 0x7B
+            self.buffer[end] = 0x7D
+            try:
+                command = json.loads(str(self.view[start : end + 1], "utf-8"))
+            except Exception as e:
+                self.emit(ledproto.SEQ_NONE, None, f"invalid message: {e}")
+            else:
+                self.emit(ledproto.SEQ_NONE, command)
+        self.discard(end)
+        self.scanned = 0
+
+    def read_request(self, request) -> None:
+        """Read one write transaction, dispatching every part of a message it completes.
+
+        The whole transaction is read before anything is decided, bytes after the end of
+        a message start the next one. A message spanning several transactions is only
+        dropped when the next one takes longer than RECEIVE_GAP_NS to start.
+        """
+        if self.kind is not None and time.monotonic_ns() - self.last_byte_ns > RECEIVE_GAP_NS:
+            print(f"dropping the rest of an incomplete message, {self.length} bytes")
+            self.reset()
+        # every write from the host starts with the register byte, it is not part of the message
+        register_byte = True
+        while True:
+            data = request.read(READ_SIZE)
+            if len(data) == 0:
+                break
+            offset = 0
+            if register_byte:
+                register_byte = False
+                self.register = data[0]
+                if data[0] != ledproto.REG_COMMAND:
+                    # the host selected another register to read from, no data follows
+                    return
+                offset = 1
+                if self.kind is None:
+                    self.last_byte_ns = time.monotonic_ns()
+            self.feed(data, offset)
+        self.last_byte_ns = time.monotonic_ns()
+        if self.kind == KIND_BINARY and self.length == 0 and self.skip == 0:
+            self.end_message()
+
+
+# parts of messages not handled yet, (frame they arrived in, first, seq, command, error)
+received = []
+# whether the parts of the message being handled are applied, a resent one is not
+accepting = True
+
+
+def handle_part(first, seq, command, error):
+    global accepting
+    if first:
+        accepting = status.start(seq)
+    if error is not None:
+        status.bad_frame(error)
+    elif accepting:
+        print(command)
+        try:
+            handle_message(command)
+        except Exception as e:
+            status.fail(e)
+
+
+def handle_next():
+    started = time.monotonic_ns()
+    arrived, first, seq, command, error = received.pop(0)
+    if arrived != scheduler.frames:
+        scheduler.deferred += 1
+    handle_part(first, seq, command, error)
+    scheduler.handled(time.monotonic_ns() - started)
+
+
+def queue_part(first, seq, command, error=None):
+    received.append((scheduler.frames, first, seq, command, error))
+    # past MAX_DEFERRED parts are handled while the message still arrives, so a long
+    # message never piles up in memory
+    while len(received) > MAX_DEFERRED:
+        handle_next()
+
+
+receiver = MessageReceiver(queue_part)
+
+
+with I2CTarget(board.SCL, board.SDA, (I2C_ADDRESS,)) as device:
     while True:
-        # check if there's a pending device request
-        i2c_target_request = device.request()
+        now = time.monotonic_ns()
+        # render slot
+        if pixel_display is not None and scheduler.frame_due(now):
+            timeline.run(now)
+            pixel_display.animate()
+            scheduler.rendered(now)
+
+        # i/o slot, wait for the host until the next frame is due unless there is work
+        if len(received) > 0 and scheduler.fits(time.monotonic_ns()):
+            timeout = -1
+        else:
+            timeout = scheduler.request_timeout(time.monotonic_ns())
+        i2c_target_request = device.request(timeout)
 
         if i2c_target_request:
             # no request is pending
@@ -373,57 +1342,22 @@ with I2CTarget(board.SCL, board.SDA, (0x40,)) as device:
                 address = i2c_target_request.address
 
                 if i2c_target_request.is_read:
-                    print(f"read request to address '0x{address:02x}'")
-
-                    # if error_text != "":
-                    #     buffer = bytes(error_text.encode("utf-8"))
-                    #     i2c_target_request.write(buffer)
-                    # else:
-                    #     temp = "success"
-                    #     i2c_target_request.write(temp.encode("utf-8"))
+                    if receiver.register == ledproto.REG_STATS:
+                        shows = 0 if pixel_display is None else pixel_display.shows
+                        i2c_target_request.write(frame_stats.encode(shows, scheduler))
+                    else:
+                        i2c_target_request.write(status.encode(receiver.last_receive_ms))
                 else:
                     # transaction is a write request
-                    full_msg = ""
-                    for i in range(NUM_FETCHES):
-                        time.sleep(0.01)
-                        data = i2c_target_request.read(32)
-                        # print(f"received data: {data}")
-                        if len(data) > 0:
-                            full_msg = full_msg + data.decode()
-                    cleaned_msg = full_msg.replace("\x00", "")
-                    command = {}
                     try:
-                        command = json.loads(cleaned_msg)
-                    except:
-                        print("invalid json received")
-                        print(cleaned_msg)
-                        continue
-                    print(command)
-                    if "reconfigure" in command:
-                        sub_command = command["reconfigure"]
-                        if pixel_display is not None:
-                            pixel_display.reconfigure(
-                                sub_command["num_strands"],
-                                sub_command["strand_length"],
-                                sub_command["brightness"],
-                            )
-                        else:
-                            pixel_display = PixelDisplay(
-                                sub_command["num_strands"],
-                                sub_command["strand_length"],
-                                sub_command["brightness"],
-                            )
-                    else:
-                        for key in command:
-                            try:
-                                pixel_display.set_animation(int(key), command[key])
-                            except Exception as e:
-                                # device.write(
-                                #     json.dumps(f"error setting animation, {e}").encode(
-                                #         "utf-8"
-                                #     )
-                                # )
-                                print(e)
-                                error_text = str(e)
+                        receiver.read_request(i2c_target_request)
+                    except Exception as e:
+                        receiver.fail(e)
+
+        while len(received) > 0:
+            if len(received) < MAX_DEFERRED and not scheduler.fits(time.monotonic_ns()):
+                break
+            handle_next()
+
         if pixel_display is not None:
-            pixel_display.animate()
+            frame_stats.tick(time.monotonic_ns(), pixel_display.shows)
@@ -2,7 +2,6 @@ import board
 import rainbowio
 import adafruit_ticks
 from adafruit_led_animation.color import AMBER, AQUA, BLACK, BLUE, GREEN, ORANGE, PINK, PURPLE, RED, WHITE, YELLOW, GOLD, JADE, MAGENTA, OLD_LACE, TEAL
-from adafruit_led_animation.group import AnimationGroup
 from adafruit_led_animation.animation.blink import Blink
 from adafruit_led_animation.animation.colorcycle import ColorCycle
 from adafruit_led_animation.animation.comet import Comet
@@ -16,23 +15,82 @@ from adafruit_led_animation.animation.rainbowcomet import RainbowComet
 from adafruit_led_animation.animation.rainbowchase import RainbowChase
 from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
 from adafruit_led_animation.animation.customcolorchase import CustomColorChase
+import os
 import time
 import busio
 import json
+import ledproto
 
 
 from adafruit_led_animation.helper import PixelMap
 from adafruit_neopxl8 import NeoPxl8
 
-default_num_bytes = 1000
+# the host sends every message COBS encoded and ended by a zero byte, see ledproto.cobs_encode.
+# set MULTI_LED_UART_BAUD_RATE in settings.toml to match the baud_rate attribute
+UART_BAUD_RATE = int(os.getenv("MULTI_LED_UART_BAUD_RATE", 1_000_000))
+# the longest encoded message that can be received, a longer one is dropped
+RECEIVE_BUFFER_SIZE = 4096
 
-uart = busio.UART(board.TX, board.RX, baudrate=9600)
+uart = busio.UART(
+    board.TX,
+    board.RX,
+    baudrate=UART_BAUD_RATE,
+    timeout=0,
+    receiver_buffer_size=RECEIVE_BUFFER_SIZE,
+)
 
 # Customize for your strands here
 num_strands = 3
 strand_length = 120
 first_led_pin = board.NEOPIXEL0        
 
+# animation name -> (constructor, the PixelStrand settings it takes as keyword args),
+# "color" is the first of the strand colors
+ANIMATIONS = {
+    "blink": (Blink, ("speed", "color")),
+    "colorcycle": (ColorCycle, ("speed", "colors")),
+    "comet": (Comet, ("speed", "color", "tail_length", "bounce")),
+    "chase": (Chase, ("speed", "size", "spacing", "color")),
+    "pulse": (Pulse, ("speed", "period", "color")),
+    "sparkle": (Sparkle, ("speed", "color", "num_sparkles")),
+    "solid": (Solid, ("color",)),
+    "rainbow": (Rainbow, ("speed", "period")),
+    "sparkle_pulse": (SparklePulse, ("speed", "period", "color")),
+    "rainbow_comet": (RainbowComet, ("speed", "tail_length", "bounce")),
+    "rainbow_chase": (RainbowChase, ("speed", "size", "spacing", "step")),
+    "rainbow_sparkle": (RainbowSparkle, ("speed", "num_sparkles")),
+    "custom_color_chase": (CustomColorChase, ("speed", "size", "spacing", "colors")),
+}
+
+class AnimationCache:
+    """Builds the animations of one strand and keeps the last few around, keyed by name and settings."""
+
+    def __init__(self, strand, max_size=8) -> None:
+        self.strand = strand
+        self.max_size = max_size
+        self.cache = {}
+        # keys oldest first, the least recently built one is dropped when full
+        self.keys = []
+
+    def get(self, animation_name, settings):
+        entry = ANIMATIONS.get(animation_name)
+        if entry is None:
+            raise ValueError("invalid animation name")
+        constructor, params = entry
+        values = [settings["colors"][0] if param == "color" else settings[param] for param in params]
+        key = (animation_name,) + tuple(
+            tuple(value) if isinstance(value, list) else value for value in values
+        )
+        animation = self.cache.get(key)
+        if animation is not None:
+            return animation
+        animation = constructor(self.strand, **dict(zip(params, values)))
+        if len(self.keys) >= self.max_size:
+            del self.cache[self.keys.pop(0)]
+        self.cache[key] = animation
+        self.keys.append(key)
+        return animation
+
 class PixelStrand:
     # Animation settings
     speed: float = 0.1
@@ -47,14 +105,13 @@ class PixelStrand:
     def __init__(self, strand) -> None:
         self.strand = strand
         self.active_animation = "blink"
-        self.regenerate_animations()
+        self.animations = AnimationCache(strand)
         
     def set_animation(self, params:dict) -> None:
         for (name, args) in params.items():
-            if name == "animation":
+            if name in ("animation", "set_animation"):
                 self.active_animation = args
                 self.strand.fill((0,0,0))
-                self.strand.show()
             elif name == "speed":
                 self.speed = float(args)
             elif name == "color":
@@ -85,14 +142,24 @@ class PixelStrand:
                 # clear active animation if we're explicitly setting pixel colors and zero all pixels if switching from animation to manual mode
                 if self.active_animation != "":
                     self.strand.fill((0,0,0))
-                    self.strand.show()
                 self.active_animation = ""
                 self.set_pixel_colors(args)
+            elif name == "pixel_spans":
+                if self.active_animation != "":
+                    self.strand.fill((0,0,0))
+                self.active_animation = ""
+                ledproto.apply_pixel_spans(self.strand, args)
             else:
                 raise ValueError(f"invalid arg: {name}")
-        self.regenerate_animations()
+        animation = self.get_active_animation()
+        if animation is not None:
+            # a command restarts the animation, also when it is one built before
+            animation.reset()
                 
     def get_color(self, color: str) -> adafruit_led_animation.color:
+        if not isinstance(color, str):
+            # binary frames carry [r, g, b]
+            return (int(color[0]), int(color[1]), int(color[2]))
         color_map = {
             "amber": AMBER,
             "aqua": AQUA,
@@ -120,43 +187,22 @@ class PixelStrand:
         for pixel, color in pixel_colors.items():
             # convert from floats to ints
             self.strand[int(pixel)] = [int(y) for y in color]
-        self.strand.show()   
     
-    def regenerate_animations(self):
-        self.blink = Blink(self.strand, speed=self.speed, color=self.colors[0])
-        self.colorcycle = ColorCycle(self.strand, speed=self.speed, colors=self.colors)
-        self.comet = Comet(self.strand, speed=self.speed, color=self.colors[0], tail_length=self.tail_length, bounce=self.bounce)
-        self.chase = Chase(self.strand, speed=self.speed, size=self.size, spacing=self.spacing, color=self.colors[0])
-        self.pulse = Pulse(self.strand, speed=self.speed, period=self.period, color=self.colors[0])
-        self.sparkle = Sparkle(self.strand, speed=self.speed, color=self.colors[0], num_sparkles=self.num_sparkles)
-        self.solid = Solid(self.strand, color=self.colors[0])
-        self.rainbow = Rainbow(self.strand, speed=self.speed, period=self.period)
-        self.sparkle_pulse = SparklePulse(self.strand, speed=self.speed, period=self.period, color=self.colors[0])
-        self.rainbow_comet = RainbowComet(self.strand, speed=self.speed, tail_length=self.tail_length, bounce=self.bounce)
-        self.rainbow_chase = RainbowChase(self.strand, speed=self.speed, size=self.size, spacing=self.spacing, step=self.step)
-        self.rainbow_sparkle = RainbowSparkle(self.strand, speed=self.speed, num_sparkles=self.num_sparkles)
-        self.custom_color_chase = CustomColorChase(self.strand, speed=self.speed, size=self.size, spacing=self.spacing, colors=self.colors)
+    def settings(self) -> dict:
+        return {
+            "speed": self.speed,
+            "colors": self.colors,
+            "tail_length": self.tail_length,
+            "bounce": self.bounce,
+            "size": self.size,
+            "spacing": self.spacing,
+            "period": self.period,
+            "num_sparkles": self.num_sparkles,
+            "step": self.step,
+        }
 
     def get_animation(self, animation: str) -> Animation:
-        animation_map = {
-            "blink": self.blink,
-            "colorcycle": self.colorcycle,
-            "comet": self.comet,
-            "chase": self.chase,
-            "pulse": self.pulse,
-            "sparkle": self.sparkle,
-            "solid": self.solid,
-            "rainbow": self.rainbow,
-            "sparkle_pulse": self.sparkle_pulse,
-            "rainbow_comet": self.rainbow_comet,
-            "rainbow_chase": self.rainbow_chase,
-            "rainbow_sparkle": self.rainbow_sparkle,
-            "custom_color_chase": self.custom_color_chase
-        }
-        animationl = animation_map.get(animation.lower())
-        if not animationl:
-            raise ValueError("invalid animation name")
-        return animationl 
+        return self.animations.get(animation.lower(), self.settings())
 
     def get_active_animation(self) -> Animation:
         if self.active_animation != "":
@@ -171,7 +217,11 @@ class PixelDisplay:
     pixels = None
     strand_list = []
     
-    animations:AnimationGroup = None
+    # what each strand plays, by strand index, None for a strand showing pixels set by hand
+    animations = []
+    # some pixel changed since the last show, one show per loop pushes every strand
+    dirty = False
+    shows = 0
 
     def __init__(self, num_strands, strand_length, brightness) -> None:
         self.reconfigure(num_strands, strand_length, brightness)
@@ -199,30 +249,35 @@ class PixelDisplay:
         for strand in strands:
             strands_list.append(PixelStrand(strand))
         self.strand_list = strands_list
+        self.animations = [pxs.get_active_animation() for pxs in self.strand_list]
+        self.dirty = True
         print("set strand list")
         print(self.strand_list)
         print(f"reconfigured with {self.num_strands} strands, {self.strand_length} pixels per strand, and brigthness of {self.brightness}")
         
+    def set_brightness(self, brightness):
+        # NeoPxl8 scales every pixel on show, the strands keep playing
+        self.brightness = brightness
+        self.pixels.brightness = brightness
+        self.dirty = True
+
     def animate(self):
-        if self.animations == None:
-            self.regenerate_animation_group()
-        self.animations.animate()
+        for animation in self.animations:
+            if animation is not None and animation.animate(False):
+                self.dirty = True
+        if self.dirty:
+            self.pixels.show()
+            self.shows += 1
+            self.dirty = False
     
     def set_animation(self, strand_index:int, params:dict):
         if strand_index >= len(self.strand_list):
             raise ValueError("index out of bound for configured number of leds")
-        self.strand_list[strand_index].set_animation(params)
-        self.regenerate_animation_group()
-
-        
-    def regenerate_animation_group(self):
-        raw_anim = []
-        for pxs in self.strand_list:
-            a = pxs.get_active_animation()
-            # active animation can be none if we manually set pixel colors
-            if a is not None:
-                raw_anim.append(a)
-        self.animations = AnimationGroup(*raw_anim)
+        pxs = self.strand_list[strand_index]
+        pxs.set_animation(params)
+        # only this strand changes, the others keep running without losing their timing
+        self.animations[strand_index] = pxs.get_active_animation()
+        self.dirty = True
 
         
     def strand(self, n, pixels_count):
@@ -243,15 +298,153 @@ pixel_display.set_animation(2, {"speed": .2, "tail_length": 30, "animation": "ra
 
 
 
+DELIMITER = bytes((ledproto.COBS_DELIMITER,))
+
+
+class FrameReader:
+    """Splits the uart byte stream into messages at the zero delimiters.
+
+    The uart reads straight into a ring buffer allocated once, so a busy stream does not
+    churn the heap, and a message can arrive over any number of loops while the strands
+    keep animating. A message that does not fit the buffer is dropped up to its delimiter.
+    """
+
+    def __init__(self, uart, size=RECEIVE_BUFFER_SIZE) -> None:
+        self.uart = uart
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        # the buffered bytes start at head, the first scanned of them hold no delimiter
+        self.head = 0
+        self.count = 0
+        self.scanned = 0
+        # discarding the rest of a message too long for the buffer
+        self.overflow = False
+        self.dropped = 0
+
+    def fill(self):
+        size = len(self.buffer)
+        if self.count == size:
+            return
+        tail = (self.head + self.count) % size
+        # only the part up to the end of the buffer, the rest is read on the next call
+        end = size if tail >= self.head else self.head
+        n = self.uart.readinto(self.view[tail:end])
+        if n:
+            self.count += n
+
+    def find_delimiter(self):
+        """Offset of the first delimiter from head, -1 if none arrived yet."""
+        size = len(self.buffer)
+        start = self.head + self.scanned
+        end = self.head + self.count
+        if start < size:
+            found = self.buffer.find(DELIMITER, start, min(end, size))
+            if found >= 0:
+                return found - self.head
+            start = size
+        if end > size:
+            found = self.buffer.find(DELIMITER, start - size, end - size)
+            if found >= 0:
+                return found + size - self.head
+        self.scanned = self.count
+        return -1
+
+    def take(self, length):
+        """The next length bytes, then skips them and their delimiter."""
+        size = len(self.buffer)
+        start = self.head
+        end = start + length
+        if end <= size:
+            data = self.view[start:end]
+        else:
+            data = bytes(self.view[start:]) + bytes(self.view[: end - size])
+        self.head = (end + 1) % size
+        self.count -= length + 1
+        self.scanned = 0
+        return data
+
+    def read(self):
+        """The next complete message decoded, None until one arrived."""
+        self.fill()
+        while True:
+            length = self.find_delimiter()
+            if length < 0:
+                break
+            encoded = self.take(length)
+            if self.overflow:
+                self.overflow = False
+            elif length > 0:
+                # decoded before fill can overwrite the bytes
+                return ledproto.cobs_decode(encoded)
+        if self.count == len(self.buffer):
+            if not self.overflow:
+                self.dropped += 1
+                print(f"dropping a message longer than {len(self.buffer)} bytes")
+            self.overflow = True
+            self.head = 0
+            self.count = 0
+            self.scanned = 0
+        return None
+
+
+# preset id -> scene, {strand index: command}, as stored by the host
+presets = {}
+
+
+def apply_strand_commands(command):
+    for key in command:
+        try:
+            pixel_display.set_animation(int(key), command[key])
+        except Exception as e:
+            print(f"strand {key}: {e}")
+
+
+def handle_message(command):
+    if "reconfigure" in command:
+        sub_command = command["reconfigure"]
+        pixel_display.reconfigure(
+            sub_command["num_strands"], sub_command["strand_length"], sub_command["brightness"]
+        )
+    elif "set_brightness" in command:
+        pixel_display.set_brightness(float(command["set_brightness"]))
+    elif "store_preset" in command:
+        presets[int(command["store_preset"]["id"])] = command["store_preset"]["scene"]
+    elif "delete_preset" in command:
+        presets.pop(int(command["delete_preset"]), None)
+    elif "recall_preset" in command:
+        apply_strand_commands(presets.get(int(command["recall_preset"]), {}))
+    elif "strand" in command:
+        # the original {"strand": n, "animation": ...} messages
+        strand_index = command.pop("strand")
+        pixel_display.set_animation(int(strand_index), command)
+    else:
+        apply_strand_commands(command)
+
+
+def handle_received(msg):
+    try:
+        if ledproto.is_binary(msg):
+            commands = [command for _, command in ledproto.decode_frames(msg)]
+        else:
+            commands = [json.loads(msg.decode())]
+    except Exception as e:
+        print(f"invalid message: {e}")
+        return
+    for command in commands:
+        print(command)
+        try:
+            handle_message(command)
+        except Exception as e:
+            print(e)
+
+
+reader = FrameReader(uart)
+
 while True:
-    data = uart.read(default_num_bytes)
-    if data is not None and data != b'\x00':
-        print(data)
-        print("got data over uart")
-        json_data = json.loads(data.decode('utf-8'))
-        strand_index = json_data["strand"]
-        json_data.pop("strand")
-        pixel_display.set_animation(strand_index, json_data)
+    msg = reader.read()
+    while msg is not None:
+        handle_received(msg)
+        msg = reader.read()
     pixel_display.animate()
         
     # print("shuold be blinking")
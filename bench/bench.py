@@ -0,0 +1,349 @@
+"""Latency and throughput benchmark of MultiLed against an emulated RP2040.
+
+Every command shape in commands.json (plus a stream_pixels frame) is sent through
+MultiLed.do_command to the firmware running in bench/emulator.py, for each protocol:
+
+    python bench/bench.py > bench_output.json
+    python bench/bench.py --baseline bench_output.json
+
+Results are json on stdout. With --baseline, cases that got slower or bigger on the
+wire than the baseline are listed on stderr and the exit status is 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# puts src/ and the stub CircuitPython modules on sys.path
+import emulator
+
+from google.protobuf.struct_pb2 import Struct
+from viam import logging
+from viam.proto.app.robot import ComponentConfig
+
+import main
+
+COMMANDS = os.path.join(emulator.ROOT, "commands.json")
+DEFAULT_BUS_HZ = 400_000
+CACHE_HIT_REPEAT = 1000
+
+
+class Case:
+    def __init__(self, name: str, kind: str, commands) -> None:
+        self.name = name
+        self.kind = kind
+        self._commands = commands
+
+    def command(self, i: int) -> dict:
+        return self._commands(i)
+
+
+def load_commands(path: str = COMMANDS) -> list:
+    """commands.json is a list of examples written one after the other, not one json document."""
+    with open(path) as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    commands = []
+    offset = 0
+    while True:
+        while offset < len(text) and text[offset].isspace():
+            offset += 1
+        if offset >= len(text):
+            return commands
+        command, offset = decoder.raw_decode(text, offset)
+        commands.append(command)
+
+
+def command_kind(command: dict) -> str:
+    kinds = set()
+    for params in command.values():
+        for arg in ("set_pixel_colors", "sequence", "set_animation"):
+            if arg in params:
+                kinds.add(arg)
+                break
+    return "+".join(sorted(kinds)) or "params"
+
+
+def stream_frame(num_strands: int, strand_length: int):
+    """A block of 10 lit pixels that moves one pixel per command."""
+
+    def command(i: int) -> dict:
+        frames = {}
+        for strand in range(num_strands):
+            colors = [[0, 0, 0]] * strand_length
+            for pixel in range(i, i + 10):
+                colors[pixel % strand_length] = [255, 64 * strand % 256, 0]
+            frames[str(strand)] = colors
+        return {"stream_pixels": frames}
+
+    return command
+
+
+def cases(num_strands: int, strand_length: int) -> list:
+    found = []
+    for i, command in enumerate(load_commands()):
+        found.append(Case(f"commands.json[{i}]", command_kind(command), lambda _, c=command: c))
+    found.append(Case("stream_pixels", "stream_pixels", stream_frame(num_strands, strand_length)))
+    return found
+
+
+def make_config(args, protocol: str) -> ComponentConfig:
+    attributes = Struct()
+    attributes.update(
+        {
+            "num_strands": args.strands,
+            "strand_length": args.strand_length,
+            "brightness": 0.2,
+            "address": hex(emulator.DEFAULT_ADDRESS),
+            "protocol": protocol,
+            "acknowledge": args.acknowledge,
+        }
+    )
+    if args.controllers > 1:
+        # --strands each, spread over the buses in turn
+        attributes.update(
+            {
+                "num_strands": args.strands * args.controllers,
+                "controllers": [
+                    {"address": hex(address), "bus": 1 + i % args.buses, "num_strands": args.strands}
+                    for i, address in enumerate(controller_addresses(args))
+                ],
+            }
+        )
+    if args.frame_rate:
+        attributes.update({"frame_rate": args.frame_rate})
+    config = ComponentConfig(name="bench", attributes=attributes)
+    main.MultiLed.validate_config(config)
+    return config
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "max": samples[-1],
+    }
+
+
+def cache_hit_us(led: main.MultiLed, command: dict) -> float:
+    """Host time of a per strand command seen before: its key, the check and the frame lookup."""
+    led.command_cache.encoded(led.check_command(command))
+    started = time.perf_counter()
+    for _ in range(CACHE_HIT_REPEAT):
+        led.command_cache.encoded(led.check_command(command))
+    return (time.perf_counter() - started) * 1e6 / CACHE_HIT_REPEAT
+
+
+def per_command(before: dict, after: dict, count: int) -> dict:
+    return {key: (after[key] - before[key]) / count for key in after}
+
+
+def controller_addresses(args) -> list:
+    return [emulator.DEFAULT_ADDRESS + i for i in range(args.controllers)]
+
+
+def total(counters: list) -> dict:
+    return {key: sum(c[key] for c in counters) for key in counters[0]}
+
+
+def wait_idle(devices: list) -> None:
+    for device in devices:
+        device.wait_idle()
+
+
+def firmware_counters(devices: list) -> dict:
+    counters = total([device.counters() for device in devices])
+    # pixel pushes are counted for the whole process already
+    counters["shows"] = devices[0].counters()["shows"]
+    return counters
+
+
+async def run_case(case: Case, protocol: str, args) -> dict:
+    result = {"case": case.name, "kind": case.kind, "protocol": protocol}
+    devices = [emulator.EmulatedRP2040(address=address) for address in controller_addresses(args)]
+    for device in devices:
+        device.start()
+    buses = {}
+
+    def open_bus(number: int) -> emulator.FakeSMBus:
+        buses[number] = emulator.FakeSMBus(smbus_only=args.smbus_only)
+        return buses[number]
+
+    main.SMBus = open_bus
+    led = main.MultiLed.new(make_config(args, protocol), {})
+    try:
+        wait_idle(devices)
+        latencies = []
+        wire_before = {number: bus.counters() for number, bus in buses.items()}
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            await led.do_command(case.command(i))
+            # the write returns once the bytes are on the bus, the command is handled after
+            wait_idle(devices)
+            latencies.append((time.perf_counter() - started) * 1000)
+        per_bus = [
+            per_command(wire_before[number], bus.counters(), args.iterations)
+            for number, bus in buses.items()
+        ]
+        wire = total(per_bus)
+        # buses run side by side, the busiest one is what a command waits for
+        wire["bus_ms"] = max(b["wire_bytes"] for b in per_bus) * 9 * 1000 / args.bus_hz
+        result["latency_ms"] = summarize(latencies)
+        result["wire_per_command"] = wire
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(led.do_command(case.command(args.iterations + i)) for i in range(args.iterations))
+        )
+        wait_idle(devices)
+        result["messages_per_s"] = args.iterations / (time.perf_counter() - started)
+
+        firmware_before = firmware_counters(devices)
+        time.sleep(args.frame_window)
+        firmware = per_command(firmware_before, firmware_counters(devices), args.frame_window)
+        result["firmware_per_s"] = {"loops": firmware["loops"], "shows": firmware["shows"]}
+        result["device_stats"] = await led.do_command({"get_device_stats": {}})
+        status = await led.do_command({"get_status": {}})
+        statuses = status["controllers"] if "controllers" in status else [status]
+        if "controllers" in status:
+            result["last_device_error"] = [c["error"] for c in statuses]
+        else:
+            result["last_device_error"] = status["error"]
+        # a command the firmware rejected or could not parse fails the case, however fast it was
+        failed = [c for c in statuses if c["error"] or c["bad_frames"]]
+        if failed:
+            result["error"] = "device error: " + "; ".join(
+                f"{c['error'] or 'no error text'} ({c['bad_frames']} damaged frames)" for c in failed
+            )
+    except Exception as e:
+        result["error"] = repr(e)
+    finally:
+        await led.close()
+        for device in devices:
+            device.stop()
+    command = case.command(0)
+    if "error" not in result and main.is_strand_command(command):
+        # with the emulated firmware stopped, its thread does not take turns with the host
+        result["cache_hit_us"] = cache_hit_us(led, command)
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=emulator.ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Describe every case that is slower or sends more bytes than in baseline."""
+    previous = {(r["case"], r["protocol"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        old = previous.get((r["case"], r["protocol"]))
+        if old is None or "error" in r or "error" in old:
+            continue
+        name = f"{r['case']} ({r['protocol']})"
+        if r["latency_ms"]["p50"] > old["latency_ms"]["p50"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 latency {old['latency_ms']['p50']:.2f} -> {r['latency_ms']['p50']:.2f} ms"
+            )
+        if r["messages_per_s"] < old["messages_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {old['messages_per_s']:.0f} -> {r['messages_per_s']:.0f} messages/s"
+            )
+        if "cache_hit_us" in r and "cache_hit_us" in old and r["cache_hit_us"] > old["cache_hit_us"] * (1 + tolerance):
+            regressions.append(f"{name}: cache hit {old['cache_hit_us']:.1f} -> {r['cache_hit_us']:.1f} us")
+        if r["firmware_per_s"]["loops"] < old["firmware_per_s"]["loops"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: firmware loop {old['firmware_per_s']['loops']:.0f} -> {r['firmware_per_s']['loops']:.0f} /s"
+            )
+        if r["wire_per_command"]["wire_bytes"] > old["wire_per_command"]["wire_bytes"]:
+            regressions.append(
+                f"{name}: {old['wire_per_command']['wire_bytes']:.0f} -> {r['wire_per_command']['wire_bytes']:.0f} bytes on the wire"
+            )
+    return regressions
+
+
+async def run(args) -> dict:
+    results = []
+    for case in cases(args.strands * args.controllers, args.strand_length):
+        if args.case and case.name not in args.case:
+            continue
+        for protocol in args.protocol:
+            results.append(await run_case(case, protocol, args))
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "num_strands": args.strands,
+            "controllers": args.controllers,
+            "buses": args.buses,
+            "strand_length": args.strand_length,
+            "acknowledge": args.acknowledge,
+            "smbus_only": args.smbus_only,
+            "frame_rate": args.frame_rate,
+            "bus_hz": args.bus_hz,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50, help="commands sent per case and measurement")
+    parser.add_argument("--strands", type=int, default=3, help="strands per controller")
+    parser.add_argument("--controllers", type=int, default=1, help="emulated boards driven as one display")
+    parser.add_argument("--buses", type=int, default=1, help="i2c buses the controllers are spread over")
+    parser.add_argument("--strand-length", type=int, default=120)
+    parser.add_argument("--protocol", nargs="+", choices=main.PROTOCOLS, default=list(main.PROTOCOLS))
+    parser.add_argument("--case", nargs="+", help="only run these cases, e.g. commands.json[0] stream_pixels")
+    parser.add_argument("--acknowledge", action="store_true", help="wait for acknowledgements, binary protocol only")
+    parser.add_argument("--smbus-only", action="store_true", help="emulate an adapter without i2c_rdwr")
+    parser.add_argument("--frame-rate", type=float, default=0, help="frames per second the firmware paces to, 0 for unpaced")
+    parser.add_argument("--bus-hz", type=int, default=DEFAULT_BUS_HZ, help="i2c clock used to estimate bus time")
+    parser.add_argument("--frame-window", type=float, default=1.0, help="seconds to measure the firmware frame rate")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+    if args.acknowledge:
+        args.protocol = [main.PROTOCOL_BINARY]
+    return args
+
+
+def cli(argv=None) -> int:
+    args = parse_args(argv)
+    logging.setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    failures = [r for r in results["results"] if "error" in r]
+    for r in failures:
+        print(f"failed: {r['case']} ({r['protocol']}): {r['error']}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
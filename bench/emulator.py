@@ -0,0 +1,192 @@
+"""Runs 2040_scripts/rp2040i2c.py on the desktop against a fake SMBus.
+
+The firmware source is executed unmodified on its own thread with the stub CircuitPython
+modules in bench/stubs. FakeSMBus stands in for smbus2.SMBus on the host side and
+hands every transaction to the emulated I2CTarget at its address, counting what would be
+on the wire. Several emulated boards can share a process, each on its own address.
+"""
+
+import __future__
+import ctypes
+import errno
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, "bench", "stubs")
+SRC = os.path.join(ROOT, "src")
+FIRMWARE = os.path.join(ROOT, "2040_scripts", "rp2040i2c.py")
+DEFAULT_ADDRESS = 0x40
+ADDRESS_SETTING = "MULTI_LED_I2C_ADDRESS"
+
+for path in (SRC, STUBS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import adafruit_neopxl8  # noqa: E402
+import i2ctarget  # noqa: E402
+from smbus2 import I2cFunc  # noqa: E402
+
+I2C_M_RD = 0x0001
+
+
+class EmulatedRP2040:
+    """The firmware main loop on a daemon thread, start() returns once it listens on the bus."""
+
+    def __init__(self, firmware: str = FIRMWARE, address: int = DEFAULT_ADDRESS, quiet: bool = True) -> None:
+        self.firmware = firmware
+        self.address = address
+        self.namespace = {"__name__": "code", "__file__": firmware}
+        if quiet:
+            # CircuitPython prints go to the usb console, not worth measuring here
+            self.namespace["print"] = lambda *args, **kwargs: None
+        self.target = None
+        self.error = None
+        self.messages_received = 0
+        self.messages_handled = 0
+        self._thread = None
+
+    def start(self, timeout: float = 5.0) -> None:
+        with open(self.firmware) as f:
+            source = f.read()
+        # os.getenv reads settings.toml on the board, here it is the process environment,
+        # the firmware reads it before it attaches to the bus
+        os.environ[ADDRESS_SETTING] = hex(self.address)
+        # MicroPython never evaluates annotations, some in the firmware name things it does not import
+        code = compile(source, self.firmware, "exec", flags=__future__.annotations.compiler_flag, dont_inherit=True)
+        self._thread = threading.Thread(target=self._run, args=(code,), name="rp2040", daemon=True)
+        self._thread.start()
+        try:
+            with i2ctarget.attached:
+                if not i2ctarget.attached.wait_for(lambda: self._attached() or self.error, timeout):
+                    raise TimeoutError("emulated firmware did not attach to the bus")
+        finally:
+            os.environ.pop(ADDRESS_SETTING, None)
+        if self.error is not None:
+            raise self.error
+        self.target = i2ctarget.targets[self.address]
+        self._count_messages()
+
+    def _count_messages(self) -> None:
+        # the firmware may hold a message back for a later frame, count the parts that go
+        # in and out so wait_idle covers those too
+        receiver = self.namespace["receiver"]
+        dispatch = receiver.dispatch
+        handle_part = self.namespace["handle_part"]
+
+        def counted_dispatch(*part):
+            self.messages_received += 1
+            dispatch(*part)
+
+        def counted_handle(*part):
+            try:
+                handle_part(*part)
+            finally:
+                self.messages_handled += 1
+
+        receiver.dispatch = counted_dispatch
+        self.namespace["handle_part"] = counted_handle
+
+    def _attached(self) -> bool:
+        return self.address in i2ctarget.targets and self._thread.is_alive()
+
+    def _run(self, code) -> None:
+        try:
+            exec(code, self.namespace)
+        except i2ctarget.Stopped:
+            pass
+        except BaseException as e:
+            self.error = e
+            with i2ctarget.attached:
+                i2ctarget.attached.notify_all()
+
+    def stop(self) -> None:
+        if self.target is not None:
+            self.target.stop()
+        if self._thread is not None:
+            self._thread.join(5.0)
+
+    def wait_idle(self, timeout: float = 5.0) -> None:
+        """Wait until every transaction and every message received so far was handled."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"emulated firmware crashed: {self.error!r}")
+            if self.target.wait_idle(max(deadline - time.monotonic(), 0)):
+                if self.messages_handled >= self.messages_received:
+                    return
+            if time.monotonic() >= deadline:
+                raise TimeoutError("emulated firmware is still busy")
+            time.sleep(0.0001)
+
+    @property
+    def display(self):
+        return self.namespace.get("pixel_display")
+
+    def counters(self) -> dict:
+        return {
+            "loops": self.target.polls,
+            "requests": self.target.requests,
+            "shows": adafruit_neopxl8.NeoPxl8.total_shows,
+        }
+
+
+class FakeSMBus:
+    """The parts of smbus2.SMBus that transport.I2CTransport uses.
+
+    Transactions go to whichever emulated firmware listens on their address. smbus_only
+    leaves out the plain I2C functionality, like an adapter that can only do smbus block
+    transfers.
+    """
+
+    def __init__(self, smbus_only: bool = False) -> None:
+        self.funcs = 0 if smbus_only else I2cFunc.I2C | I2cFunc.SMBUS_I2C_BLOCK
+        self.transactions = 0
+        self.write_bytes = 0
+        self.read_bytes = 0
+
+    def counters(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "write_bytes": self.write_bytes,
+            "read_bytes": self.read_bytes,
+            # start + address byte per transaction, 9 clocks per byte with the ack
+            "wire_bytes": self.transactions + self.write_bytes + self.read_bytes,
+        }
+
+    def _target(self, address: int):
+        target = i2ctarget.targets.get(address)
+        if target is None:
+            raise OSError(errno.ENXIO, f"no device at 0x{address:02x}")
+        return target
+
+    def _write(self, address: int, data: bytes) -> None:
+        self._target(address).transact_write(address, data)
+        self.transactions += 1
+        self.write_bytes += len(data)
+
+    def _read(self, address: int, size: int) -> bytes:
+        data = self._target(address).transact_read(address, size)
+        self.transactions += 1
+        self.read_bytes += size
+        return data
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, data) -> None:
+        self._write(i2c_addr, bytes((register,)) + bytes(data))
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list:
+        self._write(i2c_addr, bytes((register,)))
+        return list(self._read(i2c_addr, length))
+
+    def i2c_rdwr(self, *i2c_msgs) -> None:
+        for msg in i2c_msgs:
+            if msg.flags & I2C_M_RD:
+                data = self._read(msg.addr, msg.len)
+                ctypes.memmove(msg.buf, data, msg.len)
+            else:
+                self._write(msg.addr, bytes(msg))
+
+    def close(self) -> None:
+        pass
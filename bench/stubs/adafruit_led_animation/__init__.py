@@ -0,0 +1,5 @@
+"""Just enough of adafruit_led_animation for rp2040i2c.py to run on a desktop.
+
+Animations redraw the same number of pixels per step as the library does and follow
+the same animate / show protocol, the colors they draw are only approximate.
+"""
@@ -0,0 +1,230 @@
+import random
+import sys
+
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+from rainbowio import colorwheel
+
+BLACK = (0, 0, 0)
+
+
+def _scale(color, level):
+    return (int(color[0] * level), int(color[1] * level), int(color[2] * level))
+
+
+def _unpack(color):
+    return ((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
+
+
+class Animation:
+    def __init__(self, pixel_object, speed, color, peers=None, paused=False, name=None):
+        self.pixel_object = pixel_object
+        self.speed = speed
+        self.color = color
+        self.draw_count = 0
+        self._next_update = ticks_ms()
+
+    @property
+    def speed(self):
+        return self._speed_ms / 1000
+
+    @speed.setter
+    def speed(self, seconds):
+        self._speed_ms = int(seconds * 1000)
+
+    def animate(self, show=True):
+        now = ticks_ms()
+        if ticks_less(now, self._next_update):
+            return False
+        self.draw()
+        self.draw_count += 1
+        if show:
+            self.show()
+        self._next_update = ticks_add(now, self._speed_ms)
+        return True
+
+    def draw(self):
+        raise NotImplementedError()
+
+    def show(self):
+        self.pixel_object.show()
+
+    def fill(self, color):
+        self.pixel_object.fill(color)
+
+    def reset(self):
+        self.draw_count = 0
+
+
+class Solid(Animation):
+    def __init__(self, pixel_object, color, name=None):
+        super().__init__(pixel_object, 1, color)
+
+    def draw(self):
+        self.fill(self.color)
+
+
+class Blink(Animation):
+    def __init__(self, pixel_object, speed, color, background_color=BLACK, name=None):
+        super().__init__(pixel_object, speed, color)
+        self.background_color = background_color
+
+    def draw(self):
+        self.fill(self.color if self.draw_count % 2 == 0 else self.background_color)
+
+
+class ColorCycle(Animation):
+    def __init__(self, pixel_object, speed, colors=None, name=None, start_color=0):
+        colors = colors or [(255, 0, 0)]
+        super().__init__(pixel_object, speed, colors[0])
+        self.colors = colors
+
+    def draw(self):
+        self.fill(self.colors[self.draw_count % len(self.colors)])
+
+
+class Comet(Animation):
+    def __init__(self, pixel_object, speed, color, background_color=BLACK, tail_length=0,
+                 reverse=False, bounce=False, name=None, ring=False):
+        super().__init__(pixel_object, speed, color)
+        self.tail_length = max(int(tail_length), 1)
+        self.bounce = bounce
+
+    def tail_color(self, i):
+        return _scale(self.color, 1 - i / self.tail_length)
+
+    def draw(self):
+        # the library rewrites the whole strand every step
+        n = len(self.pixel_object)
+        head = self.draw_count % (n + self.tail_length)
+        for pixel in range(n):
+            i = head - pixel
+            self.pixel_object[pixel] = self.tail_color(i) if 0 <= i < self.tail_length else BLACK
+
+
+class RainbowComet(Comet):
+    def __init__(self, pixel_object, speed, tail_length=10, reverse=False, bounce=False,
+                 colorwheel_offset=0, step=0, name=None, ring=False):
+        super().__init__(pixel_object, speed, (255, 0, 0), tail_length=tail_length, bounce=bounce)
+
+    def tail_color(self, i):
+        return _scale(_unpack(colorwheel(i * 256 // self.tail_length)), 1 - i / self.tail_length)
+
+
+class Chase(Animation):
+    def __init__(self, pixel_object, speed, color, size=2, spacing=3, reverse=False, name=None):
+        super().__init__(pixel_object, speed, color)
+        self.size = max(int(size), 1)
+        self.spacing = max(int(spacing), 0)
+
+    def bar_color(self, n):
+        return self.color
+
+    def draw(self):
+        bar = self.size + self.spacing
+        for pixel in range(len(self.pixel_object)):
+            shifted = pixel - self.draw_count
+            on = shifted % bar < self.size
+            self.pixel_object[pixel] = self.bar_color(shifted // bar) if on else BLACK
+
+
+class RainbowChase(Chase):
+    def __init__(self, pixel_object, speed, size=2, spacing=3, reverse=False, name=None, step=8):
+        super().__init__(pixel_object, speed, (255, 0, 0), size=size, spacing=spacing)
+        self.step = step
+
+    def bar_color(self, n):
+        return _unpack(colorwheel(n * self.step + self.draw_count))
+
+
+class CustomColorChase(Chase):
+    def __init__(self, pixel_object, speed, size=2, spacing=3, reverse=False, name=None, colors=None):
+        colors = colors or [(255, 0, 0)]
+        super().__init__(pixel_object, speed, colors[0], size=size, spacing=spacing)
+        self.colors = colors
+
+    def bar_color(self, n):
+        return self.colors[n % len(self.colors)]
+
+
+class Pulse(Animation):
+    def __init__(self, pixel_object, speed, color, period=5, breath=0, min_intensity=0,
+                 max_intensity=1, name=None):
+        super().__init__(pixel_object, speed, color)
+        self.period = max(period, 0.001)
+
+    def level(self):
+        phase = (ticks_ms() / 1000 / self.period) % 1
+        return 1 - abs(phase * 2 - 1)
+
+    def draw(self):
+        self.fill(_scale(self.color, self.level()))
+
+
+class Sparkle(Animation):
+    def __init__(self, pixel_object, speed, color, num_sparkles=1, name=None, mask=None):
+        super().__init__(pixel_object, speed, color)
+        self.num_sparkles = int(num_sparkles)
+
+    def background(self):
+        self.fill(_scale(self.color, 0.1))
+
+    def draw(self):
+        self.background()
+        n = len(self.pixel_object)
+        for _ in range(self.num_sparkles):
+            self.pixel_object[random.randrange(n)] = self.color
+
+
+class SparklePulse(Sparkle):
+    def __init__(self, pixel_object, speed, color, period=5, max_intensity=1, min_intensity=0, name=None):
+        super().__init__(pixel_object, speed, color)
+        self.period = max(period, 0.001)
+
+    def background(self):
+        phase = (ticks_ms() / 1000 / self.period) % 1
+        self.fill(_scale(self.color, 1 - abs(phase * 2 - 1)))
+
+
+class Rainbow(Animation):
+    def __init__(self, pixel_object, speed, period=5, step=1, name=None, precompute_rainbow=True):
+        super().__init__(pixel_object, speed, (255, 0, 0))
+        self.period = max(period, 0.001)
+
+    def draw(self):
+        n = len(self.pixel_object)
+        offset = int((ticks_ms() / 1000 / self.period) * 256)
+        for pixel in range(n):
+            self.pixel_object[pixel] = _unpack(colorwheel(pixel * 256 // max(n, 1) + offset))
+
+
+class RainbowSparkle(Rainbow):
+    def __init__(self, pixel_object, speed, period=5, num_sparkles=None, step=1, name=None, background_brightness=0.2):
+        super().__init__(pixel_object, speed, period=period)
+        self.num_sparkles = num_sparkles or 1
+
+    def draw(self):
+        super().draw()
+        n = len(self.pixel_object)
+        for _ in range(self.num_sparkles):
+            self.pixel_object[random.randrange(n)] = (255, 255, 255)
+
+
+# the firmware imports every animation from its own submodule
+for _module, _cls in (
+    ("blink", Blink),
+    ("colorcycle", ColorCycle),
+    ("comet", Comet),
+    ("chase", Chase),
+    ("pulse", Pulse),
+    ("sparkle", Sparkle),
+    ("solid", Solid),
+    ("rainbow", Rainbow),
+    ("sparklepulse", SparklePulse),
+    ("rainbowcomet", RainbowComet),
+    ("rainbowchase", RainbowChase),
+    ("rainbowsparkle", RainbowSparkle),
+    ("customcolorchase", CustomColorChase),
+):
+    _submodule = type(sys)(f"{__name__}.{_module}")
+    setattr(_submodule, _cls.__name__, _cls)
+    sys.modules[_submodule.__name__] = _submodule
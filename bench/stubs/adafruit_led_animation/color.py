@@ -0,0 +1,16 @@
+AMBER = (255, 100, 0)
+AQUA = (50, 255, 255)
+BLACK = (0, 0, 0)
+BLUE = (0, 0, 255)
+GREEN = (0, 255, 0)
+ORANGE = (255, 40, 0)
+PINK = (242, 90, 255)
+PURPLE = (180, 0, 255)
+RED = (255, 0, 0)
+WHITE = (255, 255, 255)
+YELLOW = (255, 150, 0)
+GOLD = (255, 222, 30)
+JADE = (0, 255, 40)
+MAGENTA = (255, 0, 20)
+OLD_LACE = (253, 245, 230)
+TEAL = (0, 255, 120)
@@ -0,0 +1,16 @@
+class AnimationGroup:
+    def __init__(self, *members, sync=False, name=None):
+        self._members = members
+        self._sync = sync
+
+    def animate(self, show=True):
+        # like the library, every member shows its own pixel object
+        return any([item.animate(show) for item in self._members])
+
+    def show(self):
+        for item in self._members:
+            item.show()
+
+    def reset(self):
+        for item in self._members:
+            item.reset()
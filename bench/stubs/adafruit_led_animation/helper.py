@@ -0,0 +1,29 @@
+class PixelMap:
+    def __init__(self, strip, pixel_ranges, individual_pixels=False):
+        self._pixels = strip
+        self._ranges = list(pixel_ranges)
+        self.n = len(self._ranges)
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            for i, color in zip(range(*index.indices(self.n)), value):
+                self._pixels[self._ranges[i]] = color
+            return
+        self._pixels[self._ranges[index]] = value
+
+    def __getitem__(self, index):
+        return self._pixels[self._ranges[index]]
+
+    def fill(self, color):
+        for pixel in self._ranges:
+            self._pixels[pixel] = color
+
+    def show(self):
+        self._pixels.show()
+
+    @property
+    def auto_write(self):
+        return self._pixels.auto_write
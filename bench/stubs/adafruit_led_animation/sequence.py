@@ -0,0 +1,36 @@
+from adafruit_ticks import ticks_diff, ticks_ms
+
+
+class AnimationSequence:
+    def __init__(self, *members, advance_interval=None, auto_clear=True, random_order=False,
+                 auto_reset=False, advance_on_cycle_complete=False, name=None):
+        self._members = members
+        self._advance_interval = int(advance_interval * 1000) if advance_interval else None
+        self._auto_clear = auto_clear
+        self._current = 0
+        self._last_advance = ticks_ms()
+
+    @property
+    def current_animation(self):
+        return self._members[self._current]
+
+    def next(self):
+        if self._auto_clear:
+            self.current_animation.fill((0, 0, 0))
+        self._current = (self._current + 1) % len(self._members)
+        self._last_advance = ticks_ms()
+
+    def animate(self, show=True):
+        if self._advance_interval and ticks_diff(ticks_ms(), self._last_advance) > self._advance_interval:
+            self.next()
+        return self.current_animation.animate(show)
+
+    def show(self):
+        self.current_animation.show()
+
+    def fill(self, color):
+        self.current_animation.fill(color)
+
+    def reset(self):
+        self._current = 0
+        self.current_animation.reset()
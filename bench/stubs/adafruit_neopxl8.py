@@ -0,0 +1,57 @@
+"""NeoPxl8 that keeps the pixels in a bytearray and counts show() calls."""
+
+
+def _rgb(value):
+    if isinstance(value, int):
+        return ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+    return (int(value[0]), int(value[1]), int(value[2]))
+
+
+class NeoPxl8:
+    # across every instance, the display is rebuilt on reconfigure
+    total_shows = 0
+
+    def __init__(self, data0, n, *, num_strands=8, bpp=3, brightness=1.0, auto_write=True, pixel_order=None):
+        self.n = n
+        self.num_strands = num_strands
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.buf = bytearray(n * 3)
+        self.shows = 0
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            for i, color in zip(range(*index.indices(self.n)), value):
+                self[i] = color
+            return
+        if index < 0:
+            index += self.n
+        self.buf[index * 3 : index * 3 + 3] = bytes(_rgb(value))
+        if self.auto_write:
+            self.show()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n
+        return tuple(self.buf[index * 3 : index * 3 + 3])
+
+    def fill(self, color):
+        self.buf[:] = bytes(_rgb(color)) * self.n
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        # the real driver scales by brightness and hands the copy to _transmit, which
+        # fills the dma buffer
+        self._transmit(bytes(self.buf))
+        self.shows += 1
+        NeoPxl8.total_shows += 1
+
+    def _transmit(self, buffer):
+        pass
+
+    def deinit(self):
+        pass
@@ -0,0 +1,5 @@
+"""Pin names the firmware looks up, nothing drives them in the emulator."""
+
+SCL = "SCL"
+SDA = "SDA"
+NEOPIXEL0 = "NEOPIXEL0"
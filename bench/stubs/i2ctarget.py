@@ -0,0 +1,133 @@
+"""I2CTarget whose bus is the host process, see bench/emulator.py.
+
+The host side calls transact_write / transact_read from its own thread and blocks
+until the firmware handled the request, the way clock stretching holds the bus on
+the real device.
+"""
+
+import threading
+import time
+from collections import deque
+
+# address -> attached I2CTarget
+targets = {}
+attached = threading.Condition()
+
+
+class Stopped(BaseException):
+    """Raised from request() to end the firmware main loop, not caught by except Exception."""
+
+
+class I2CTargetRequest:
+    def __init__(self, target, address, is_read, data=b"", read_size=0):
+        self.target = target
+        self.address = address
+        self.is_read = is_read
+        self.is_restart = False
+        self._data = memoryview(bytes(data))
+        self._offset = 0
+        self.read_size = read_size
+        self.response = b""
+        self.done = threading.Event()
+
+    def read(self, n=-1, ack=True):
+        if n < 0:
+            n = len(self._data) - self._offset
+        chunk = bytes(self._data[self._offset : self._offset + n])
+        self._offset += len(chunk)
+        return chunk
+
+    def write(self, buffer):
+        self.response = bytes(buffer)[: self.read_size]
+        return len(self.response)
+
+    def ack(self, ack=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.target._finish(self)
+        return False
+
+
+class I2CTarget:
+    def __init__(self, scl, sda, addresses, smbus=False):
+        self.addresses = tuple(addresses)
+        self._requests = deque()
+        self._lock = threading.Condition()
+        self._pending = 0
+        self._stopped = False
+        # main loop iterations, every one asks for a request
+        self.polls = 0
+        self.requests = 0
+        with attached:
+            for address in self.addresses:
+                targets[address] = self
+            attached.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
+        return False
+
+    def deinit(self):
+        with attached:
+            for address in self.addresses:
+                if targets.get(address) is self:
+                    del targets[address]
+
+    def request(self, timeout=-1.0):
+        """Like CircuitPython: wait up to timeout seconds, 0 waits forever, < 0 checks once."""
+        self.polls += 1
+        with self._lock:
+            if timeout >= 0:
+                self._lock.wait_for(
+                    lambda: self._requests or self._stopped, None if timeout == 0 else timeout
+                )
+            if self._stopped:
+                raise Stopped()
+            if self._requests:
+                self.requests += 1
+                return self._requests.popleft()
+        if timeout < 0:
+            # let the host threads run, the real controller does not share a cpu with them
+            time.sleep(0)
+        return None
+
+    def _finish(self, request):
+        with self._lock:
+            self._pending -= 1
+            self._lock.notify_all()
+        request.done.set()
+
+    def _submit(self, request, timeout):
+        with self._lock:
+            if self._stopped:
+                raise OSError("i2c target stopped")
+            self._pending += 1
+            self._requests.append(request)
+            self._lock.notify_all()
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"i2c target 0x{request.address:02x} did not answer")
+
+    def transact_write(self, address, data, timeout=5.0):
+        self._submit(I2CTargetRequest(self, address, False, data), timeout)
+
+    def transact_read(self, address, size, timeout=5.0):
+        request = I2CTargetRequest(self, address, True, read_size=size)
+        self._submit(request, timeout)
+        return request.response + bytes(size - len(request.response))
+
+    def wait_idle(self, timeout=5.0):
+        """Wait until every submitted request was handled."""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()
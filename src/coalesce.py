@@ -0,0 +1,132 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional
+
+from viam import logging
+
+LOG = logging.getLogger(__name__)
+
+# these args can only be sent on their own for a strand, see ledproto._strand_kind
+EXCLUSIVE_ARGS = ("set_pixel_colors", "sequence")
+
+
+def is_strand_command(command: Mapping) -> bool:
+    return len(command) > 0 and all(str(key).isdigit() for key in command)
+
+
+def merge_strand(pending: dict, params: Mapping) -> bool:
+    """Merge params into the pending args of one strand, later args win.
+
+    Returns False without touching pending if the two can not be expressed as one
+    command, e.g. pixel colors after an animation change.
+    """
+    keys = set(pending) | set(params)
+    for arg in EXCLUSIVE_ARGS:
+        if arg in keys and len(keys) > 1:
+            return False
+    for key, value in params.items():
+        if key == "set_pixel_colors" and key in pending:
+            value = {**pending[key], **value}
+        # re-insert so the merged args keep the order they were last written in
+        pending.pop(key, None)
+        pending[key] = value
+    return True
+
+
+class CommandCoalescer:
+    """Batches per strand commands that arrive within a short window into one message.
+
+    Commands use the {"0": {...}, "1": {...}} shape from commands.json. While a batch is
+    open, args for the same strand are merged last writer wins, and every caller waits
+    for the single write that carries its command.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        send: Callable[[dict, Optional[float]], Awaitable[Optional[dict]]],
+    ) -> None:
+        self.window = window
+        self._send = send
+        self._pending: Dict[str, dict] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._deadline: Optional[float] = None
+        self._timer: Optional[asyncio.Task] = None
+        self.commands_received = 0
+        self.messages_sent = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "commands_received": self.commands_received,
+            "messages_sent": self.messages_sent,
+            "writes_saved": self.commands_received - self.messages_sent,
+        }
+
+    async def submit(self, command: Mapping, timeout: Optional[float] = None) -> Optional[dict]:
+        """Add command to the open batch and return what sending the batch returned."""
+        loop = asyncio.get_running_loop()
+        self.commands_received += 1
+        if not self._merge(command):
+            self._flush()
+            self._merge(command)
+
+        if timeout is not None:
+            deadline = loop.time() + timeout
+            if self._deadline is None or deadline < self._deadline:
+                self._deadline = deadline
+        future = loop.create_future()
+        self._waiters.append(future)
+        if self._timer is None:
+            self._timer = loop.create_task(self._flush_later())
+        # shield so one caller timing out does not cancel the write for the whole batch
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _merge(self, command: Mapping) -> bool:
+        merged = {key: dict(params) for key, params in self._pending.items()}
+        for key, params in command.items():
+            if not merge_strand(merged.setdefault(str(key), {}), params):
+                return False
+        self._pending = merged
+        return True
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        message, waiters, deadline = self._pending, self._waiters, self._deadline
+        self._pending, self._waiters, self._deadline = {}, [], None
+        self.messages_sent += 1
+        asyncio.get_running_loop().create_task(self._write(message, waiters, deadline))
+
+    async def _write(
+        self, message: dict, waiters: List[asyncio.Future], deadline: Optional[float]
+    ) -> None:
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - asyncio.get_running_loop().time(), 0)
+        try:
+            result = await self._send(message, timeout)
+        except Exception as e:
+            LOG.error(f"failed to send coalesced command: {e}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("coalescer closed"))
+        self._pending, self._waiters, self._deadline = {}, [], None
@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import ledproto
+
+# what PixelStrand.handle_command on the firmware accepts, value types as in ledproto.PARAMS
+PARAM_KINDS = dict(ledproto.PARAMS)
+SEQUENCE_KEYS = ("animations", "duration")
+DEFAULT_CACHE_SIZE = 256
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))
+
+
+def check_color(color) -> None:
+    if isinstance(color, str):
+        if color.lower() not in ledproto.COLOR_NAMES:
+            raise ValueError(f"invalid color name {color}")
+        return
+    if (
+        not isinstance(color, (list, tuple))
+        or len(color) < 3
+        or not all(_is_number(value) and 0 <= value <= 255 for value in color[:3])
+    ):
+        raise ValueError(f"invalid color {color}, expected a color name or [r, g, b] from 0 to 255")
+
+
+def check_param(name: str, value) -> None:
+    kind = PARAM_KINDS.get(name)
+    if kind is None:
+        raise ValueError(f"invalid arg: {name}")
+    if kind == "a":
+        if value not in ledproto.ANIMATION_NAMES:
+            raise ValueError(f"invalid animation name {value}")
+    elif kind in ("t", "v"):
+        if not _is_number(value) or value < 0:
+            raise ValueError(f"{name} must be a number of 0 or more, got {value}")
+    elif kind == "b":
+        if not _is_number(value):
+            raise ValueError(f"{name} must be true, false or a number, got {value}")
+    elif kind == "c":
+        check_color(value)
+    elif kind == "f":
+        if not _is_number(value) or not 0 <= value <= 1:
+            raise ValueError(f"{name} must be a number from 0 to 1, got {value}")
+    elif kind == "l":
+        if not isinstance(value, (list, tuple)) or len(value) == 0:
+            raise ValueError(f"{name} must be a list of at least one color")
+        for color in value:
+            check_color(color)
+
+
+def check_pixel_colors(pixels, strand_length: int) -> None:
+    if not isinstance(pixels, Mapping):
+        raise ValueError("set_pixel_colors must map pixel indices to colors")
+    for pixel, color in pixels.items():
+        try:
+            index = int(pixel)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid pixel index {pixel}")
+        if not 0 <= index < strand_length:
+            raise ValueError(f"pixel {pixel} is outside a strand of {strand_length} pixels")
+        if isinstance(color, str):
+            raise ValueError(f"pixel {pixel} needs an [r, g, b] color, not a name")
+        check_color(color)
+
+
+def check_sequence(sequence) -> None:
+    if not isinstance(sequence, Mapping):
+        raise ValueError("sequence must be an object with animations and duration")
+    for key in sequence:
+        if key not in SEQUENCE_KEYS:
+            raise ValueError(f"invalid sequence arg: {key}")
+    if "duration" in sequence and (not _is_number(sequence["duration"]) or sequence["duration"] < 0):
+        raise ValueError("sequence duration must be a number of seconds")
+    animations = sequence.get("animations", [])
+    if not isinstance(animations, (list, tuple)) or len(animations) == 0:
+        raise ValueError("sequence needs a list of at least one animation")
+    for animation in animations:
+        if not isinstance(animation, Mapping) or "set_animation" not in animation:
+            raise ValueError("every sequence animation needs set_animation")
+        for name, value in animation.items():
+            check_param(name, value)
+
+
+def check_live_update(params: Mapping) -> None:
+    """Raise ValueError for args only the i2c firmware applies to a running animation."""
+    for name in ("brightness", "transition"):
+        if name in params:
+            raise ValueError(f"{name} needs the i2c firmware")
+    if "set_animation" not in params and len(params) > 0 and all(name in ledproto.LIVE_PARAMS for name in params):
+        raise ValueError("changing speed or colors in place needs the i2c firmware, send them with set_animation")
+
+
+def check_command(
+    command: Mapping,
+    num_strands: int,
+    strand_length: int,
+    segment_lengths: Sequence[int] = (),
+    live_updates: bool = True,
+) -> None:
+    """Raise ValueError for a per strand command the firmware would reject.
+
+    Mirrors PixelStrand.handle_command, so a bad name, color or index is reported to
+    the caller instead of costing a bus transfer and failing on the RP2040. Segments
+    are the strands after num_strands, with the lengths in segment_lengths. Without
+    live_updates, as on the uart firmware, per strand brightness, transitions and in
+    place speed or color changes are rejected too.
+    """
+    for key, params in command.items():
+        strand = int(key)
+        if not 0 <= strand < num_strands + len(segment_lengths):
+            raise ValueError(f"strand {key}: index out of bound for configured number of leds")
+        # segments are numbered in config order
+        label = f"strand {key}" if strand < num_strands else f"segment {strand - num_strands}"
+        if not isinstance(params, Mapping):
+            raise ValueError(f"{label}: args must be an object")
+        length = strand_length if strand < num_strands else segment_lengths[strand - num_strands]
+        try:
+            if not live_updates:
+                check_live_update(params)
+            for name, value in params.items():
+                if name == "set_pixel_colors":
+                    check_pixel_colors(value, length)
+                elif name == "brightness" and strand >= num_strands:
+                    raise ValueError("brightness dims whole strands, not segments")
+                elif name == "sequence":
+                    check_sequence(value)
+                else:
+                    check_param(name, value)
+        except ValueError as e:
+            raise ValueError(f"{label}: {e}") from None
+
+
+def check_keyframes(
+    keyframes, num_strands: int, strand_length: int, segment_lengths: Sequence[int] = ()
+) -> List[Tuple[float, Mapping]]:
+    """The keyframes of a timeline as (seconds, scene) in time order, raises ValueError for a bad one."""
+    if not isinstance(keyframes, (list, tuple)) or len(keyframes) == 0:
+        raise ValueError('a timeline needs a list of keyframes like {"at": 0, "scene": {"0": {...}}}')
+    if len(keyframes) > ledproto.MAX_KEYFRAMES:
+        raise ValueError(f"a timeline holds at most {ledproto.MAX_KEYFRAMES} keyframes, got {len(keyframes)}")
+    checked = []
+    for i, keyframe in enumerate(keyframes):
+        if not isinstance(keyframe, Mapping) or not isinstance(keyframe.get("scene"), Mapping) or len(keyframe["scene"]) == 0:
+            raise ValueError(f"keyframe {i} needs a scene of per strand commands")
+        at = keyframe.get("at", 0)
+        if isinstance(at, bool) or not _is_number(at) or at < 0:
+            raise ValueError(f"keyframe {i}: at must be a number of seconds from the start, got {at}")
+        try:
+            check_command(keyframe["scene"], num_strands, strand_length, segment_lengths)
+        except ValueError as e:
+            raise ValueError(f"keyframe {i}: {e}") from None
+        checked.append((at, keyframe["scene"]))
+    # sorted is stable, keyframes at the same time apply in the order given
+    return sorted(checked, key=lambda keyframe: keyframe[0])
+
+
+# values that are their own key
+_LEAVES = {str, int, float, bool, type(None)}
+
+
+def _structure(value) -> Hashable:
+    kind = type(value)
+    if kind is dict or (kind is not list and kind is not tuple and isinstance(value, Mapping)):
+        # tagged, so a list of pairs is not the same key as an object
+        return (Mapping,) + tuple(
+            [(key, item if type(item) in _LEAVES else _structure(item)) for key, item in value.items()]
+        )
+    # a list of plain values, like a color, is its own tuple
+    key = tuple(value)
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        return tuple([item if type(item) in _LEAVES else _structure(item) for item in value])
+
+
+def command_key(command: Mapping) -> Optional[Hashable]:
+    """Identifies a command by content, arg order included, None if it can not be keyed.
+
+    The key is the command as nested tuples, cheaper to build than serializing it. Equal
+    numbers like 1, 1.0 and True give the same key, they pass the same checks and the
+    firmware takes them alike.
+    """
+    try:
+        return _structure(command)
+    except TypeError:
+        return None
+
+
+class CommandCache:
+    """Commands that passed check_command and their encoded frames, by command_key.
+
+    The least recently used entry is dropped when full. Entries only hold for one display
+    config, build a new cache when it changes.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Optional[list]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def checked(self, key: Optional[Hashable]) -> bool:
+        """Whether the command with key was checked before, counts as a hit or a miss."""
+        if key is not None and key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key: Optional[Hashable]) -> None:
+        if key is None or key in self._entries:
+            return
+        self._entries[key] = None
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def encoded(self, key: Optional[Hashable]) -> Optional[list]:
+        """The frames stored with set_encoded, as [(controller, payload)], or None."""
+        if key is None:
+            return None
+        return self._entries.get(key)
+
+    def set_encoded(self, key: Optional[Hashable], parts: list) -> None:
+        if key is None:
+            return
+        self.add(key)
+        self._entries[key] = parts
@@ -0,0 +1,157 @@
+import asyncio
+import bisect
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import ledproto
+from coalesce import is_strand_command
+
+DEFAULT_BUS = 1
+# messages carrying a per strand command under "scene" for the controllers to keep
+SCENE_MESSAGES = ("store_preset", "timeline_keyframe")
+
+
+class Controller:
+    """One RP2040 of the display, it drives num_strands strands starting at global strand first_strand."""
+
+    def __init__(self, shared_bus, transport, address: int, first_strand: int, num_strands: int) -> None:
+        # a transport.SharedBus released again by ControllerGroup.close, None over uart
+        self.shared_bus = shared_bus
+        self.transport = transport
+        self.bus = None if shared_bus is None else shared_bus.number
+        self.address = address
+        self.first_strand = first_strand
+        self.num_strands = num_strands
+        # every device acknowledges its own seq numbers, see MultiLed.send_acknowledged
+        self.seq = ledproto.SEQ_NONE
+        self.ack_lock = asyncio.Lock()
+
+    @property
+    def name(self) -> str:
+        if self.shared_bus is None:
+            return self.transport.name
+        return f"{self.bus}:0x{self.address:02x}"
+
+    def next_seq(self) -> int:
+        # seq 0 means unacknowledged, so acknowledged messages cycle through 1-255
+        self.seq = self.seq % 255 + 1
+        return self.seq
+
+
+class ControllerGroup:
+    """Several controllers shown as one display with global strand indices.
+
+    Controllers are numbered in config order, the strands of the first one come first.
+    Commands are split by the controller owning each strand and renumbered to its local
+    strand indices, the parts for different controllers are sent concurrently.
+    """
+
+    def __init__(self, controllers: Sequence[Controller]) -> None:
+        self.controllers = list(controllers)
+        self._firsts = [controller.first_strand for controller in self.controllers]
+        # global segment index -> (controller, its index there), see set_segments
+        self._segments: List[Tuple[Controller, int]] = []
+        # the runs of every controller's segments in its own strand indices
+        self._segment_runs: Dict[int, list] = {}
+
+    @property
+    def num_strands(self) -> int:
+        last = self.controllers[-1]
+        return last.first_strand + last.num_strands
+
+    def set_segments(self, segments: Sequence[Sequence[Sequence]]) -> None:
+        """Give each segment, a list of [strand, start, end, reverse] runs, to the controller driving its strands.
+
+        A segment has to stay on one controller, which addresses its segments after its
+        own strands. Global segment i is strand num_strands + i.
+        """
+        self._segments = []
+        self._segment_runs = {}
+        for runs in segments:
+            controller, _ = self.locate(runs[0][0])
+            local = self._segment_runs.setdefault(id(controller), [])
+            self._segments.append((controller, controller.num_strands + len(local)))
+            local.append([[strand - controller.first_strand, start, end, reverse] for strand, start, end, reverse in runs])
+
+    def locate(self, strand: int) -> Tuple[Controller, int]:
+        """The controller driving a global strand or segment index and its index on it."""
+        if self.num_strands <= strand < self.num_strands + len(self._segments):
+            return self._segments[strand - self.num_strands]
+        if not 0 <= strand < self.num_strands:
+            raise ValueError("index out of bound for configured number of leds")
+        controller = self.controllers[bisect.bisect_right(self._firsts, strand) - 1]
+        return controller, strand - controller.first_strand
+
+    def split(self, message: Mapping) -> List[Tuple[Controller, dict]]:
+        """Split a per strand message by controller, anything else goes to every controller.
+
+        A reconfigure tells each controller its own number of strands, define_segments
+        its own segments from set_segments, a preset or a timeline keyframe is stored on
+        every controller with its part of the scene.
+        """
+        if "reconfigure" in message:
+            return [
+                (controller, {**message, "reconfigure": {**message["reconfigure"], "num_strands": controller.num_strands}})
+                for controller in self.controllers
+            ]
+        if "define_segments" in message:
+            return [
+                (controller, {"define_segments": self._segment_runs.get(id(controller), [])})
+                for controller in self.controllers
+            ]
+        for name in SCENE_MESSAGES:
+            if name in message:
+                # every controller stores its part of the scene, an empty one if it has
+                # none, so a recall or a timeline can go to all of them
+                stored = message[name]
+                scenes = dict((id(c), part) for c, part in self.split(stored["scene"]))
+                return [
+                    (c, {name: {**stored, "scene": scenes.get(id(c), {})}})
+                    for c in self.controllers
+                ]
+        if not is_strand_command(message):
+            return [(controller, dict(message)) for controller in self.controllers]
+        parts: Dict[int, dict] = {}
+        for strand, params in message.items():
+            controller, local = self.locate(int(strand))
+            parts.setdefault(id(controller), {})[str(local)] = params
+        return [(c, parts[id(c)]) for c in self.controllers if id(c) in parts]
+
+    def split_strands(self, strands: Mapping[int, object]) -> List[Tuple[Controller, dict]]:
+        """Like split for dicts keyed by int strand index, such as pixel spans."""
+        parts: Dict[int, dict] = {}
+        for strand, value in strands.items():
+            controller, local = self.locate(strand)
+            parts.setdefault(id(controller), {})[local] = value
+        return [(c, parts[id(c)]) for c in self.controllers if id(c) in parts]
+
+    async def gather(
+        self,
+        parts: Sequence[Tuple[Controller, object]],
+        send: Callable[[Controller, object], Awaitable],
+    ) -> list:
+        """Run send for every part at once, the slowest controller sets the latency."""
+        if len(parts) == 1:
+            controller, part = parts[0]
+            return [await send(controller, part)]
+        return list(await asyncio.gather(*(send(controller, part) for controller, part in parts)))
+
+    def send_blocking(self, payloads: Sequence[Tuple[Controller, bytes]], timeout: Optional[float] = None) -> None:
+        """Write one payload per controller from synchronous code, all buses at once."""
+        futures = [controller.transport.submit(payload) for controller, payload in payloads]
+        for future in futures:
+            future.result(timeout)
+
+    def stats(self) -> List[dict]:
+        return [
+            {"controller": controller.name, **controller.transport.stats()}
+            for controller in self.controllers
+        ]
+
+    def close(self) -> None:
+        for controller in self.controllers:
+            if controller.shared_bus is None:
+                controller.transport.close()
+                continue
+            # the bus pool closes the handle once nobody uses it
+            controller.transport.close(close_bus=False)
+            controller.shared_bus.release()
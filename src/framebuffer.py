@@ -0,0 +1,96 @@
+from typing import Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Color = Tuple[int, int, int]
+
+
+class FrameBuffer:
+    """A whole display frame, num_strands x strand_length x 3 bytes of rgb.
+
+    Backed by a uint8 numpy array when numpy is installed, otherwise by a bytearray.
+    Either way the pixels live in one contiguous buffer, strands are handed out as
+    memoryview slices of it and push() sends them without building per pixel objects.
+    """
+
+    def __init__(self, num_strands: int, strand_length: int, use_numpy: Optional[bool] = None) -> None:
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ImportError("numpy is not installed, use a bytearray backed FrameBuffer instead")
+        self.num_strands = num_strands
+        self.strand_length = strand_length
+        self.shape = (num_strands, strand_length, 3)
+        if use_numpy:
+            self.array = np.zeros(self.shape, dtype=np.uint8)
+            self.buffer = memoryview(self.array).cast("B")
+        else:
+            self.array = None
+            self.buffer = memoryview(bytearray(num_strands * strand_length * 3))
+
+    def _range(self, strand: int, start: int, end: Optional[int]) -> Tuple[int, int]:
+        if not 0 <= strand < self.num_strands:
+            raise ValueError("index out of bound for configured number of leds")
+        if end is None:
+            end = self.strand_length
+        if not 0 <= start <= end <= self.strand_length:
+            raise ValueError(f"pixel range {start}:{end} is outside a strand of {self.strand_length} pixels")
+        return start, end
+
+    def strand(self, index: int) -> memoryview:
+        """The rgb bytes of one strand, a view into the frame, not a copy."""
+        offset = index * self.strand_length * 3
+        return self.buffer[offset : offset + self.strand_length * 3]
+
+    def fill(self, color: Color, strand: Optional[int] = None, start: int = 0, end: Optional[int] = None) -> None:
+        """Fill pixels start:end of a strand, or of every strand if strand is None."""
+        strands = range(self.num_strands) if strand is None else (strand,)
+        for index in strands:
+            first, last = self._range(index, start, end)
+            if self.array is not None:
+                self.array[index, first:last] = color
+            else:
+                self.strand(index)[first * 3 : last * 3] = bytes(color[:3]) * (last - first)
+
+    def set_pixels(self, strand: int, start: int, colors: Sequence[Color]) -> None:
+        """Copy a run of colors into a strand starting at pixel start."""
+        first, last = self._range(strand, start, start + len(colors))
+        if self.array is not None:
+            self.array[strand, first:last] = colors
+        else:
+            self.strand(strand)[first * 3 : last * 3] = bytes(
+                value for color in colors for value in color[:3]
+            )
+
+    def gradient(
+        self, strand: int, start_color: Color, end_color: Color, start: int = 0, end: Optional[int] = None
+    ) -> None:
+        """Linear gradient from start_color at pixel start to end_color at pixel end - 1."""
+        first, last = self._range(strand, start, end)
+        count = last - first
+        if count == 0:
+            return
+        if self.array is not None:
+            steps = np.linspace(0.0, 1.0, count)[:, None]
+            a = np.asarray(start_color[:3], dtype=np.float32)
+            b = np.asarray(end_color[:3], dtype=np.float32)
+            self.array[strand, first:last] = np.rint(a + (b - a) * steps).astype(np.uint8)
+            return
+        out = bytearray(count * 3)
+        for i in range(count):
+            t = i / (count - 1) if count > 1 else 0.0
+            for c in range(3):
+                out[i * 3 + c] = round(start_color[c] + (end_color[c] - start_color[c]) * t)
+        self.strand(strand)[first * 3 : last * 3] = out
+
+    def clear(self) -> None:
+        self.fill((0, 0, 0))
+
+    async def push(self, multi_led, timeout: Optional[float] = None) -> None:
+        """Send the frame to a MultiLed, only pixels that changed since the last push go on the bus."""
+        await multi_led.stream_pixels(
+            {index: self.strand(index) for index in range(self.num_strands)}, timeout
+        )
@@ -0,0 +1,831 @@
+"""Binary wire protocol shared by the multi-led host module and the RP2040 firmware.
+
+This file has to run both on CPython (host) and on CircuitPython (copy it to the
+CIRCUITPY drive next to code.py), so it only uses ``struct`` and builtins, plus
+``collections.abc`` where CPython has it.
+
+Every frame looks like::
+
+    magic(1) version(1) opcode(1) seq(1) length(2, little endian) payload(length) crc16(2)
+
+The crc is CRC-16/CCITT-FALSE over the header and the payload. Commands use the
+same dict shapes as the json protocol (see commands.json), decoding a frame gives
+back the dict the firmware already knows how to handle.
+"""
+
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # CircuitPython decodes json into plain dicts
+    Mapping = dict
+
+MAGIC = 0xA5
+VERSION = 1
+
+HEADER_FORMAT = "<BBBBH"
+HEADER_SIZE = 6
+CRC_SIZE = 2
+FRAME_OVERHEAD = HEADER_SIZE + CRC_SIZE
+MAX_PAYLOAD = 0xFFFF
+
+OP_RECONFIGURE = 0x01
+OP_SET_ANIMATION = 0x02
+OP_SET_PIXELS = 0x03
+OP_SEQUENCE = 0x04
+OP_PIXEL_SPANS = 0x05
+OP_SET_BRIGHTNESS = 0x06
+OP_STORE_PRESET = 0x07
+OP_RECALL_PRESET = 0x08
+OP_DELETE_PRESET = 0x09
+OP_TIMELINE_CLEAR = 0x0A
+OP_TIMELINE_KEYFRAME = 0x0B
+OP_TIMELINE_CONTROL = 0x0C
+OP_DEFINE_SEGMENTS = 0x0D
+
+# presets are numbered 0 to MAX_PRESETS - 1 and kept in the firmware's ram
+MAX_PRESETS = 32
+
+# keyframes of the one timeline the firmware holds in ram
+MAX_KEYFRAMES = 256
+# loop(1) length_ms(4)
+TIMELINE_CLEAR_FORMAT = "<BI"
+# action(1) position_ms(4), actions in the order of TIMELINE_ACTIONS
+TIMELINE_CONTROL_FORMAT = "<BI"
+TIMELINE_ACTIONS = ("timeline_stop", "timeline_start", "timeline_seek")
+# timeline_start position that plays on from where the timeline stands
+TIMELINE_HERE = -1
+_HERE_MS = 0xFFFFFFFF
+
+# segments are addressed as the strands after a controller's own, see encode_segments
+MAX_SEGMENTS = 64
+MAX_SEGMENT_RUNS = 32
+# strand(1) start(2) end(2) reverse(1)
+SEGMENT_RUN_FORMAT = "<BHHB"
+SEGMENT_RUN_SIZE = 6
+
+# first byte of every i2c write, selects what the write is for
+REG_COMMAND = 0x00
+REG_STATUS = 0x01
+REG_STATS = 0x02
+
+# seq 0 means the host does not wait for an acknowledgement, acknowledged frames use 1-255
+SEQ_NONE = 0
+
+# status block the firmware answers reads with:
+# seq(1) code(1) bad_frames(1) receive_ms(2) error length(1) error text
+STATUS_FORMAT = "<BBBHB"
+STATUS_HEADER_SIZE = 6
+# whole status fits in one smbus block read
+STATUS_SIZE = 32
+STATUS_ERROR_MAX = STATUS_SIZE - STATUS_HEADER_SIZE
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# frame counters, read through REG_STATS:
+# shows_per_s(2) loops_per_s(4) shows(4) late_frames(4) dropped_frames(4) deferred(4),
+# rates are over the last whole second, the rest count since boot
+STATS_FORMAT = "<HIIIII"
+STATS_SIZE = 22
+
+# ids on the wire are the index into these tuples, only ever append to them
+ANIMATION_NAMES = (
+    "blink",
+    "colorcycle",
+    "comet",
+    "chase",
+    "pulse",
+    "sparkle",
+    "solid",
+    "rainbow",
+    "sparkle_pulse",
+    "rainbow_comet",
+    "rainbow_chase",
+    "rainbow_sparkle",
+    "custom_color_chase",
+)
+
+COLOR_NAMES = (
+    "amber",
+    "aqua",
+    "black",
+    "blue",
+    "green",
+    "orange",
+    "pink",
+    "purple",
+    "red",
+    "white",
+    "yellow",
+    "gold",
+    "jade",
+    "magenta",
+    "old_lace",
+    "teal",
+)
+
+# a color byte below COLOR_RGB is an index into COLOR_NAMES, COLOR_RGB is followed by r, g, b
+COLOR_RGB = 0x80
+
+# value types: a = animation name, t = seconds as a varint of microseconds, c = color,
+# l = color list, v = unsigned varint, b = uint8, f = float32
+PARAMS = (
+    ("set_animation", "a"),
+    ("speed", "t"),
+    ("color", "c"),
+    ("colors", "l"),
+    ("tail_length", "v"),
+    ("bounce", "b"),
+    ("size", "v"),
+    ("spacing", "v"),
+    ("period", "v"),
+    ("num_sparkles", "v"),
+    ("step", "v"),
+    ("transition", "t"),
+    ("brightness", "f"),
+)
+
+# args that change a running animation in place instead of rebuilding it when sent
+# without set_animation, transition is how many seconds they take to get there. A
+# strand's brightness is always changed in place, whatever it shows
+LIVE_PARAMS = ("speed", "color", "colors")
+
+PARAM_IDS = {name: i for i, (name, _) in enumerate(PARAMS)}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def _make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def encode_frame(opcode, payload, seq=0):
+    length = len(payload)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"payload of {length} bytes does not fit in a frame")
+    frame = bytearray(HEADER_SIZE + length + CRC_SIZE)
+    struct.pack_into(HEADER_FORMAT, frame, 0, MAGIC, VERSION, opcode, seq & 0xFF, length)
+    frame[HEADER_SIZE : HEADER_SIZE + length] = payload
+    crc = crc16(memoryview(frame)[: HEADER_SIZE + length])
+    struct.pack_into("<H", frame, HEADER_SIZE + length, crc)
+    return frame
+
+
+# byte streams such as the uart carry messages COBS encoded, each one ends with this byte
+COBS_DELIMITER = 0x00
+
+
+def cobs_encode(data):
+    """Consistent Overhead Byte Stuffing: data without any zero byte, at most 1 byte longer per 254."""
+    data = bytes(data)
+    out = bytearray()
+    start = 0
+    while True:
+        zero = data.find(b"\x00", start, start + 254)
+        if zero < 0:
+            end = min(start + 254, len(data))
+            out.append(end - start + 1)
+            out.extend(data[start:end])
+            if end == len(data):
+                return out
+            # a full block of 254 is not followed by an implied zero
+            start = end
+        else:
+            out.append(zero - start + 1)
+            out.extend(data[start:zero])
+            start = zero + 1
+
+
+def cobs_decode(data):
+    """Undo cobs_encode, data is one encoded message without its delimiter."""
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        code = data[i]
+        if code == 0 or i + code > len(data):
+            raise ProtocolError("bad cobs block")
+        out.extend(data[i + 1 : i + code])
+        i += code
+        if code < 0xFF and i < len(data):
+            out.append(0)
+    return out
+
+
+def set_seq(frames, seq):
+    """Copy of the concatenated frames with every seq set to seq, for frames encoded once and sent again."""
+    out = bytearray(frames)
+    offset = 0
+    while offset < len(out):
+        length = struct.unpack_from("<H", out, offset + 4)[0]
+        out[offset + 3] = seq & 0xFF
+        crc = crc16(memoryview(out)[offset : offset + HEADER_SIZE + length])
+        struct.pack_into("<H", out, offset + HEADER_SIZE + length, crc)
+        offset += HEADER_SIZE + length + CRC_SIZE
+    return out
+
+
+def _encode_varint(out, value):
+    if value < 0:
+        raise ProtocolError(f"negative value {value} can not be encoded")
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(buf, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _encode_color(out, color):
+    if isinstance(color, str):
+        try:
+            out.append(COLOR_NAMES.index(color.lower()))
+        except ValueError:
+            raise ProtocolError(f"invalid color name {color}")
+    else:
+        out.append(COLOR_RGB)
+        out.extend(bytes((int(color[0]), int(color[1]), int(color[2]))))
+
+
+def _encode_params(out, params):
+    out.append(len(params))
+    for name, value in params.items():
+        param_id = PARAM_IDS.get(name)
+        if param_id is None:
+            raise ProtocolError(f"invalid arg: {name}")
+        kind = PARAMS[param_id][1]
+        out.append(param_id)
+        if kind == "a":
+            try:
+                out.append(ANIMATION_NAMES.index(value))
+            except ValueError:
+                raise ProtocolError("invalid animation name")
+        elif kind == "t":
+            _encode_varint(out, int(round(float(value) * 1000000)))
+        elif kind == "v":
+            _encode_varint(out, int(value))
+        elif kind == "b":
+            out.append(int(value) & 0xFF)
+        elif kind == "c":
+            _encode_color(out, value)
+        elif kind == "f":
+            out.extend(struct.pack("<f", float(value)))
+        elif kind == "l":
+            out.append(len(value))
+            for color in value:
+                _encode_color(out, color)
+
+
+def _strand_kind(key, params):
+    if not isinstance(params, Mapping):
+        raise ProtocolError(f"strand {key}: args must be an object, got {params!r}")
+    if "set_pixel_colors" in params:
+        kind = OP_SET_PIXELS
+        special = "set_pixel_colors"
+    elif "sequence" in params:
+        kind = OP_SEQUENCE
+        special = "sequence"
+    else:
+        return OP_SET_ANIMATION
+    if len(params) != 1:
+        raise ProtocolError(f"{special} can not be combined with other args in the binary protocol")
+    return kind
+
+
+# reconfigure flags
+FLAG_HOST_RENDER = 0x01
+# num_strands(1) strand_length(2) brightness(4) flags(1) then frame_rate(2) and gamma(4),
+# which older hosts do not send. frame_rate 0 means show frames as fast as the loop runs
+RECONFIGURE_FORMAT = "<BHfB"
+RECONFIGURE_SIZE = 8
+
+
+def encode_reconfigure(num_strands, strand_length, brightness, host_render=False, frame_rate=0, gamma=1.0, seq=0):
+    flags = FLAG_HOST_RENDER if host_render else 0
+    payload = struct.pack(
+        RECONFIGURE_FORMAT + "Hf",
+        int(num_strands),
+        int(strand_length),
+        float(brightness),
+        flags,
+        min(int(frame_rate), 0xFFFF),
+        float(gamma),
+    )
+    return encode_frame(OP_RECONFIGURE, payload, seq)
+
+
+def gamma_curve(gamma=1.0):
+    """Every color byte after gamma correction, as floats from 0 to 255, see scale_curve."""
+    return [(i / 255) ** gamma * 255 for i in range(256)]
+
+
+def scale_curve(curve, brightness):
+    """256 bytes mapping a color byte to curve at brightness, multiplies only."""
+    return bytes(min(int(value * brightness + 0.5), 255) for value in curve)
+
+
+def brightness_table(brightness, gamma=1.0):
+    """256 bytes mapping a color byte to what shows at brightness after gamma correction."""
+    return scale_curve(gamma_curve(gamma), brightness)
+
+
+def encode_brightness(brightness, seq=0):
+    """Encode {"set_brightness": brightness}, changes brightness without reconfiguring."""
+    return encode_frame(OP_SET_BRIGHTNESS, struct.pack("<f", float(brightness)), seq)
+
+
+def encode_store_preset(preset_id, scene, seq=0):
+    """Encode {"store_preset": {"id": n, "scene": {strand index: params}}}.
+
+    The scene is encoded with encode_message and its frames nested in the payload after
+    the id, so the firmware decodes it once when storing and not on every recall.
+    """
+    out = bytearray([int(preset_id)])
+    out.extend(encode_message(scene))
+    return encode_frame(OP_STORE_PRESET, out, seq)
+
+
+def encode_preset(opcode, preset_id, seq=0):
+    """Encode {"recall_preset": n} or {"delete_preset": n}, a 9 byte frame."""
+    return encode_frame(opcode, bytes((int(preset_id),)), seq)
+
+
+def _seconds_to_ms(seconds):
+    return min(max(int(round(float(seconds) * 1000)), 0), _HERE_MS - 1)
+
+
+def encode_timeline_clear(loop, length, seq=0):
+    """Encode {"timeline_clear": {"loop": bool, "length": seconds}}, drops the loaded keyframes."""
+    payload = struct.pack(TIMELINE_CLEAR_FORMAT, 1 if loop else 0, _seconds_to_ms(length))
+    return encode_frame(OP_TIMELINE_CLEAR, payload, seq)
+
+
+def encode_timeline_keyframe(at, scene, seq=0):
+    """Encode {"timeline_keyframe": {"at": seconds, "scene": {strand index: params}}}.
+
+    The scene is nested as frames the way encode_store_preset does it.
+    """
+    out = bytearray(struct.pack("<I", _seconds_to_ms(at)))
+    out.extend(encode_message(scene))
+    return encode_frame(OP_TIMELINE_KEYFRAME, out, seq)
+
+
+def encode_timeline_control(action, position=0, seq=0):
+    """Encode {action: seconds}, action one of TIMELINE_ACTIONS, milliseconds on the wire."""
+    position_ms = _HERE_MS if position == TIMELINE_HERE else _seconds_to_ms(position)
+    payload = struct.pack(TIMELINE_CONTROL_FORMAT, TIMELINE_ACTIONS.index(action), position_ms)
+    return encode_frame(OP_TIMELINE_CONTROL, payload, seq)
+
+
+def encode_segments(segments, seq=0):
+    """Encode {"define_segments": [[[strand, start, end, reverse], ...], ...]}.
+
+    Segment i is addressed as strand num_strands + i. Its pixels are its runs one after
+    the other, pixels start to end - 1 of a strand each, backwards if reverse.
+    """
+    out = bytearray([len(segments)])
+    for runs in segments:
+        out.append(len(runs))
+        for strand, start, end, reverse in runs:
+            out.extend(struct.pack(SEGMENT_RUN_FORMAT, int(strand), int(start), int(end), 1 if reverse else 0))
+    return encode_frame(OP_DEFINE_SEGMENTS, out, seq)
+
+
+def encode_animation(strands, seq=0):
+    """Encode {strand index: params} where params are set_animation/speed/colors/... args."""
+    out = bytearray([len(strands)])
+    for index, params in strands.items():
+        out.append(int(index))
+        _encode_params(out, params)
+    return encode_frame(OP_SET_ANIMATION, out, seq)
+
+
+def encode_pixels(strands, seq=0):
+    """Encode {strand index: {pixel index: [r, g, b]}}."""
+    out = bytearray([len(strands)])
+    for index, pixels in strands.items():
+        out.append(int(index))
+        out.extend(struct.pack("<H", len(pixels)))
+        for pixel, color in pixels.items():
+            out.extend(struct.pack("<HBBB", int(pixel), int(color[0]), int(color[1]), int(color[2])))
+    return encode_frame(OP_SET_PIXELS, out, seq)
+
+
+def encode_sequence(strands, seq=0):
+    """Encode {strand index: {"animations": [params, ...], "duration": seconds}}."""
+    out = bytearray([len(strands)])
+    for index, sequence in strands.items():
+        animations = sequence.get("animations", [])
+        out.append(int(index))
+        out.extend(struct.pack("<fB", float(sequence.get("duration", 0)), len(animations)))
+        for animation in animations:
+            _encode_params(out, animation)
+    return encode_frame(OP_SEQUENCE, out, seq)
+
+
+def encode_pixel_spans(strands, seq=0):
+    """Encode {strand index: [(start, count, rgb)]} changed pixel ranges.
+
+    rgb holds either count colors (3 bytes each) or a single color that fills all count
+    pixels, the low bit of the encoded count tells the two apart.
+    """
+    out = bytearray([len(strands)])
+    for index, spans in strands.items():
+        out.append(int(index))
+        _encode_varint(out, len(spans))
+        for start, count, rgb in spans:
+            fill = 1 if count > 1 and len(rgb) == 3 else 0
+            _encode_varint(out, start)
+            _encode_varint(out, (count << 1) | fill)
+            out.extend(rgb)
+    return encode_frame(OP_PIXEL_SPANS, out, seq)
+
+
+def _skip_pixel_spans(buf, offset):
+    num_spans, offset = _decode_varint(buf, offset)
+    for _ in range(num_spans):
+        _, offset = _decode_varint(buf, offset)
+        packed, offset = _decode_varint(buf, offset)
+        offset += 3 if packed & 1 else 3 * (packed >> 1)
+    return offset
+
+
+def apply_pixel_spans(pixels, spans):
+    """Write spans decoded from an OP_PIXEL_SPANS frame straight into pixels, e.g. a PixelMap."""
+    num_spans, offset = _decode_varint(spans, 0)
+    for _ in range(num_spans):
+        start, offset = _decode_varint(spans, offset)
+        packed, offset = _decode_varint(spans, offset)
+        count = packed >> 1
+        if packed & 1:
+            color = (spans[offset], spans[offset + 1], spans[offset + 2])
+            offset += 3
+            for i in range(start, start + count):
+                pixels[i] = color
+        else:
+            for i in range(start, start + count):
+                pixels[i] = (spans[offset], spans[offset + 1], spans[offset + 2])
+                offset += 3
+
+
+def encode_message(message, seq=0):
+    """Encode a json style command into one or more concatenated frames."""
+    if "reconfigure" in message:
+        sub_command = message["reconfigure"]
+        return encode_reconfigure(
+            sub_command["num_strands"],
+            sub_command["strand_length"],
+            sub_command["brightness"],
+            sub_command.get("host_render", False),
+            sub_command.get("frame_rate", 0),
+            sub_command.get("gamma", 1.0),
+            seq,
+        )
+    if "set_brightness" in message:
+        return encode_brightness(message["set_brightness"], seq)
+    if "store_preset" in message:
+        preset = message["store_preset"]
+        return encode_store_preset(preset["id"], preset["scene"], seq)
+    if "recall_preset" in message:
+        return encode_preset(OP_RECALL_PRESET, message["recall_preset"], seq)
+    if "delete_preset" in message:
+        return encode_preset(OP_DELETE_PRESET, message["delete_preset"], seq)
+    if "timeline_clear" in message:
+        timeline = message["timeline_clear"]
+        return encode_timeline_clear(timeline["loop"], timeline["length"], seq)
+    if "timeline_keyframe" in message:
+        keyframe = message["timeline_keyframe"]
+        return encode_timeline_keyframe(keyframe["at"], keyframe["scene"], seq)
+    for action in TIMELINE_ACTIONS:
+        if action in message:
+            return encode_timeline_control(action, message[action], seq)
+    if "define_segments" in message:
+        return encode_segments(message["define_segments"], seq)
+
+    animations = {}
+    pixels = {}
+    sequences = {}
+    for key, params in message.items():
+        kind = _strand_kind(key, params)
+        if kind == OP_SET_PIXELS:
+            pixels[key] = params["set_pixel_colors"]
+        elif kind == OP_SEQUENCE:
+            sequences[key] = params["sequence"]
+        else:
+            animations[key] = params
+
+    out = bytearray()
+    if animations:
+        out.extend(encode_animation(animations, seq))
+    if pixels:
+        out.extend(encode_pixels(pixels, seq))
+    if sequences:
+        out.extend(encode_sequence(sequences, seq))
+    return out
+
+
+def frame_length(buf, offset=0):
+    """Return the total length of the frame starting at offset, or None if the header is incomplete."""
+    if len(buf) - offset < HEADER_SIZE:
+        return None
+    magic, version, _, _, length = struct.unpack_from(HEADER_FORMAT, buf, offset)
+    if magic != MAGIC:
+        raise ProtocolError(f"bad magic byte 0x{magic:02x}")
+    if version != VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    return HEADER_SIZE + length + CRC_SIZE
+
+
+def encode_status(seq, code, bad_frames, receive_ms, error=""):
+    text = error.encode("utf-8")[:STATUS_ERROR_MAX]
+    status = bytearray(STATUS_SIZE)
+    struct.pack_into(
+        STATUS_FORMAT, status, 0, seq, code, bad_frames & 0xFF, min(int(receive_ms), 0xFFFF), len(text)
+    )
+    status[STATUS_HEADER_SIZE : STATUS_HEADER_SIZE + len(text)] = text
+    return status
+
+
+def decode_status(buf):
+    """Returns a dict with seq, code, bad_frames, receive_ms and error."""
+    if len(buf) < STATUS_HEADER_SIZE:
+        raise ProtocolError(f"status is {len(buf)} bytes, expected at least {STATUS_HEADER_SIZE}")
+    seq, code, bad_frames, receive_ms, error_length = struct.unpack_from(STATUS_FORMAT, buf, 0)
+    error = bytes(buf[STATUS_HEADER_SIZE : STATUS_HEADER_SIZE + error_length]).decode("utf-8", "replace")
+    return {
+        "seq": seq,
+        "code": code,
+        "bad_frames": bad_frames,
+        "receive_ms": receive_ms,
+        "error": error,
+    }
+
+
+def encode_stats(shows_per_s, loops_per_s, shows, late_frames=0, dropped_frames=0, deferred=0):
+    stats = bytearray(STATS_SIZE)
+    struct.pack_into(
+        STATS_FORMAT,
+        stats,
+        0,
+        min(int(shows_per_s), 0xFFFF),
+        min(int(loops_per_s), 0xFFFFFFFF),
+        shows & 0xFFFFFFFF,
+        late_frames & 0xFFFFFFFF,
+        dropped_frames & 0xFFFFFFFF,
+        deferred & 0xFFFFFFFF,
+    )
+    return stats
+
+
+def decode_stats(buf):
+    """Returns a dict with shows_per_s, loops_per_s, shows, late_frames, dropped_frames and deferred."""
+    if len(buf) < STATS_SIZE:
+        raise ProtocolError(f"stats are {len(buf)} bytes, expected {STATS_SIZE}")
+    shows_per_s, loops_per_s, shows, late_frames, dropped_frames, deferred = struct.unpack_from(
+        STATS_FORMAT, buf, 0
+    )
+    return {
+        "shows_per_s": shows_per_s,
+        "loops_per_s": loops_per_s,
+        "shows": shows,
+        "late_frames": late_frames,
+        "dropped_frames": dropped_frames,
+        "deferred": deferred,
+    }
+
+
+def frames_complete(buf, offset=0):
+    """Return True if buf holds only whole frames from offset on."""
+    end = len(buf)
+    while offset < end:
+        total = frame_length(buf, offset)
+        if total is None:
+            return False
+        offset += total
+    return offset == end
+
+
+def _decode_color(buf, offset):
+    tag = buf[offset]
+    if tag == COLOR_RGB:
+        return (buf[offset + 1], buf[offset + 2], buf[offset + 3]), offset + 4
+    if tag >= len(COLOR_NAMES):
+        raise ProtocolError(f"invalid color id {tag}")
+    return COLOR_NAMES[tag], offset + 1
+
+
+def _decode_params(buf, offset):
+    params = {}
+    count = buf[offset]
+    offset += 1
+    for _ in range(count):
+        param_id = buf[offset]
+        offset += 1
+        if param_id >= len(PARAMS):
+            raise ProtocolError(f"invalid arg id {param_id}")
+        name, kind = PARAMS[param_id]
+        if kind == "a":
+            animation_id = buf[offset]
+            if animation_id >= len(ANIMATION_NAMES):
+                raise ProtocolError("invalid animation name")
+            value = ANIMATION_NAMES[animation_id]
+            offset += 1
+        elif kind == "t":
+            value, offset = _decode_varint(buf, offset)
+            value = value / 1000000
+        elif kind == "v":
+            value, offset = _decode_varint(buf, offset)
+        elif kind == "b":
+            value = buf[offset]
+            offset += 1
+        elif kind == "c":
+            value, offset = _decode_color(buf, offset)
+        elif kind == "f":
+            value = struct.unpack_from("<f", buf, offset)[0]
+            offset += 4
+        else:
+            value = []
+            num_colors = buf[offset]
+            offset += 1
+            for _ in range(num_colors):
+                color, offset = _decode_color(buf, offset)
+                value.append(color)
+        params[name] = value
+    return params, offset
+
+
+def _decode_scene(buf, position, end):
+    """The {strand index: params} nested as frames from position to end."""
+    scene = {}
+    while position < end:
+        _, _, command, position = decode_frame(buf, position)
+        # every strand is in one of the nested frames only
+        scene.update(command)
+    if position != end:
+        raise ProtocolError("payload length does not match its contents")
+    return scene
+
+
+def _decode_payload(opcode, buf, offset, end):
+    if opcode == OP_RECONFIGURE:
+        num_strands, strand_length, brightness, flags = struct.unpack_from(RECONFIGURE_FORMAT, buf, offset)
+        frame_rate = 0
+        if end - offset >= RECONFIGURE_SIZE + 2:
+            frame_rate = struct.unpack_from("<H", buf, offset + RECONFIGURE_SIZE)[0]
+        gamma = 1.0
+        if end - offset >= RECONFIGURE_SIZE + 6:
+            gamma = struct.unpack_from("<f", buf, offset + RECONFIGURE_SIZE + 2)[0]
+        return {
+            "reconfigure": {
+                "num_strands": num_strands,
+                "strand_length": strand_length,
+                "brightness": brightness,
+                "host_render": bool(flags & FLAG_HOST_RENDER),
+                "frame_rate": frame_rate,
+                "gamma": gamma,
+            }
+        }
+    if opcode == OP_SET_BRIGHTNESS:
+        if end - offset != 4:
+            raise ProtocolError("payload length does not match its contents")
+        return {"set_brightness": struct.unpack_from("<f", buf, offset)[0]}
+    if opcode == OP_STORE_PRESET:
+        return {"store_preset": {"id": buf[offset], "scene": _decode_scene(buf, offset + 1, end)}}
+    if opcode == OP_TIMELINE_KEYFRAME:
+        at_ms = struct.unpack_from("<I", buf, offset)[0]
+        return {"timeline_keyframe": {"at": at_ms / 1000, "scene": _decode_scene(buf, offset + 4, end)}}
+    if opcode in (OP_TIMELINE_CLEAR, OP_TIMELINE_CONTROL):
+        if end - offset != 5:
+            raise ProtocolError("payload length does not match its contents")
+        flag, ms = struct.unpack_from(TIMELINE_CLEAR_FORMAT, buf, offset)
+        if opcode == OP_TIMELINE_CLEAR:
+            return {"timeline_clear": {"loop": bool(flag), "length": ms / 1000}}
+        if flag >= len(TIMELINE_ACTIONS):
+            raise ProtocolError(f"unknown timeline action {flag}")
+        return {TIMELINE_ACTIONS[flag]: TIMELINE_HERE if ms == _HERE_MS else ms / 1000}
+    if opcode == OP_DEFINE_SEGMENTS:
+        segments = []
+        count = buf[offset]
+        offset += 1
+        for _ in range(count):
+            runs = []
+            num_runs = buf[offset]
+            offset += 1
+            for _ in range(num_runs):
+                strand, start, stop, reverse = struct.unpack_from(SEGMENT_RUN_FORMAT, buf, offset)
+                runs.append([strand, start, stop, bool(reverse)])
+                offset += SEGMENT_RUN_SIZE
+            segments.append(runs)
+        if offset != end:
+            raise ProtocolError("payload length does not match its contents")
+        return {"define_segments": segments}
+    if opcode in (OP_RECALL_PRESET, OP_DELETE_PRESET):
+        if end - offset != 1:
+            raise ProtocolError("payload length does not match its contents")
+        name = "recall_preset" if opcode == OP_RECALL_PRESET else "delete_preset"
+        return {name: buf[offset]}
+
+    command = {}
+    count = buf[offset]
+    offset += 1
+    for _ in range(count):
+        index = buf[offset]
+        offset += 1
+        if opcode == OP_SET_ANIMATION:
+            command[index], offset = _decode_params(buf, offset)
+        elif opcode == OP_SET_PIXELS:
+            pixels = {}
+            num_pixels = struct.unpack_from("<H", buf, offset)[0]
+            offset += 2
+            for _ in range(num_pixels):
+                pixel, r, g, b = struct.unpack_from("<HBBB", buf, offset)
+                pixels[pixel] = (r, g, b)
+                offset += 5
+            command[index] = {"set_pixel_colors": pixels}
+        elif opcode == OP_SEQUENCE:
+            duration, num_animations = struct.unpack_from("<fB", buf, offset)
+            offset += 5
+            animations = []
+            for _ in range(num_animations):
+                animation, offset = _decode_params(buf, offset)
+                animations.append(animation)
+            command[index] = {"sequence": {"animations": animations, "duration": duration}}
+        elif opcode == OP_PIXEL_SPANS:
+            end_of_spans = _skip_pixel_spans(buf, offset)
+            # handed to apply_pixel_spans without copying
+            command[index] = {"pixel_spans": memoryview(buf)[offset:end_of_spans]}
+            offset = end_of_spans
+        else:
+            raise ProtocolError(f"unknown opcode 0x{opcode:02x}")
+    if offset != end:
+        raise ProtocolError("payload length does not match its contents")
+    return command
+
+
+def decode_frame(buf, offset=0):
+    """Decode the frame at offset. Returns (opcode, seq, command, next offset)."""
+    total = frame_length(buf, offset)
+    if total is None or len(buf) - offset < total:
+        raise ProtocolError("incomplete frame")
+    _, _, opcode, seq, length = struct.unpack_from(HEADER_FORMAT, buf, offset)
+    payload_end = offset + HEADER_SIZE + length
+    expected = struct.unpack_from("<H", buf, payload_end)[0]
+    if crc16(memoryview(buf)[offset:payload_end]) != expected:
+        raise ProtocolError("crc mismatch")
+    try:
+        # cut at the payload end, so a payload shorter than its contents can not read the crc
+        command = _decode_payload(opcode, memoryview(buf)[:payload_end], offset + HEADER_SIZE, payload_end)
+    except (IndexError, struct.error):
+        raise ProtocolError("truncated payload")
+    return opcode, seq, command, offset + total
+
+
+def decode_message(buf):
+    """Decode every frame in buf and return the list of commands."""
+    return [command for _, command in decode_frames(buf)]
+
+
+def decode_frames(buf):
+    """Decode every frame in buf and return a list of (seq, command)."""
+    frames = []
+    offset = 0
+    while offset < len(buf):
+        _, seq, command, offset = decode_frame(buf, offset)
+        frames.append((seq, command))
+    return frames
+
+
+def is_binary(buf):
+    return len(buf) > 0 and buf[0] == MAGIC
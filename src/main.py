@@ -1,6 +1,7 @@
 import asyncio
-from typing import ClassVar, Final, Mapping, Sequence, Optional
-from smbus2 import SMBus, i2c_msg
+from typing import ClassVar, Final, FrozenSet, Hashable, List, Mapping, Sequence, Optional, Tuple
+import serial
+from smbus2 import SMBus
 
 from typing_extensions import Self
 from viam.components.generic import *
@@ -15,17 +16,115 @@ from viam import logging
 
 import json
 import io
+import time
+
+import commands
+import ledproto
+from framebuffer import FrameBuffer
+import render
+from coalesce import CommandCoalescer, is_strand_command
+from controllers import DEFAULT_BUS, Controller, ControllerGroup
+from presets import PresetMirror
+from segments import Segment, SegmentMap
+from pixelstream import PixelStreamer, frame_from_colors, spans_to_pixel_colors
+from transport import DEFAULT_MAX_PENDING, I2C_MAX_MESSAGE_LEN, BusPool, I2CTransport, SerialTransport
 
 LOG = logging.getLogger(__name__)
-MESSAGE_CHUNK_SIZE = 64
 
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY)
+
+RENDER_FIRMWARE = "firmware"
+RENDER_HOST = "host"
+RENDER_MODES = (RENDER_FIRMWARE, RENDER_HOST)
+DEFAULT_FRAME_RATE = 30.0
+# 1 sends color values to the leds as they are, around 2.2 makes fades look even
+DEFAULT_GAMMA = 1.0
+
+TRANSPORT_I2C = "i2c"
+TRANSPORT_UART = "uart"
+TRANSPORTS = (TRANSPORT_I2C, TRANSPORT_UART)
+DEFAULT_BAUD_RATE = 1_000_000
+# a write to a serial port nobody reads any more fails instead of hanging the worker
+SERIAL_WRITE_TIMEOUT = 1.0
+
+DEFAULT_ACK_TIMEOUT_MS = 50.0
+DEFAULT_MAX_RETRIES = 2
+ACK_POLL_INTERVAL = 0.002
+
+# shared by every MultiLed in the module process, looks SMBus up when a bus is opened
+BUS_POOL = BusPool(lambda number: SMBus(number))
 
-# used to divide a byte string into 32 byte chunks to send over i2c and then put back together on the read side
-def divide_chunks(l, n):
 
-    # looping till length l
-    for i in range(0, len(l), n):
-        yield l[i : i + n]
+def controller_specs(fields) -> List[Tuple[int, int, int]]:
+    """(bus, address, num_strands) of every controller, from the controllers attribute
+    or from address and num_strands for a single one. Raises on a bad config."""
+    if "controllers" not in fields:
+        # the uart transport has no address
+        address = int(fields["address"].string_value, 16) if "address" in fields else 0
+        return [(DEFAULT_BUS, address, int(fields["num_strands"].number_value))]
+    specs = []
+    for entry in fields["controllers"].list_value.values:
+        controller = entry.struct_value.fields
+        if "address" not in controller or "num_strands" not in controller:
+            raise Exception(
+                "every entry of the controllers attribute needs an address like 0x40 and num_strands"
+            )
+        address = int(controller["address"].string_value, 16)
+        num_strands = int(controller["num_strands"].number_value)
+        if num_strands < 1:
+            raise Exception(f"controller {hex(address)} needs at least one strand")
+        bus = DEFAULT_BUS
+        if "bus" in controller:
+            bus = int(controller["bus"].number_value)
+        if any(spec[:2] == (bus, address) for spec in specs):
+            raise Exception(f"controller {hex(address)} on bus {bus} is listed twice")
+        specs.append((bus, address, num_strands))
+    if len(specs) == 0:
+        raise Exception("controllers attribute must list at least one controller")
+    return specs
+
+
+def segment_specs(fields, specs: Sequence[Tuple[int, int, int]], strand_length: int) -> List[Segment]:
+    """The segments of the segments attribute in config order, each a list of runs of
+    strands on one controller. Raises on a bad config."""
+    if "segments" not in fields:
+        return []
+    # the strand numbers each controller drives, a segment has to stay on one
+    owners = [i for i, spec in enumerate(specs) for _ in range(spec[2])]
+    segments: List[Segment] = []
+    for entry in fields["segments"].list_value.values:
+        segment = entry.struct_value.fields
+        name = segment["name"].string_value if "name" in segment else ""
+        if name == "" or name.isdigit() or "runs" not in segment:
+            raise Exception(
+                'every entry of the segments attribute needs a name that is not a number and runs like [{"strand": 0, "start": 0, "end": 60}]'
+            )
+        if any(other.name == name for other in segments):
+            raise Exception(f"segment {name} is listed twice")
+        runs = []
+        for value in segment["runs"].list_value.values:
+            run = value.struct_value.fields
+            if "strand" not in run:
+                raise Exception(f"every run of segment {name} needs a strand")
+            strand = int(run["strand"].number_value)
+            start = int(run["start"].number_value) if "start" in run else 0
+            end = int(run["end"].number_value) if "end" in run else strand_length
+            if not 0 <= strand < len(owners):
+                raise Exception(f"segment {name}: strand {strand} is not on the display")
+            if not 0 <= start < end <= strand_length:
+                raise Exception(f"segment {name}: run of strand {strand} needs 0 <= start < end <= {strand_length}")
+            runs.append((strand, start, end, "reverse" in run and run["reverse"].bool_value))
+        if not 0 < len(runs) <= ledproto.MAX_SEGMENT_RUNS:
+            raise Exception(f"segment {name} needs 1 to {ledproto.MAX_SEGMENT_RUNS} runs")
+        if len({owners[run[0]] for run in runs}) > 1:
+            raise Exception(f"segment {name} spans several controllers, its strands have to be on one")
+        segments.append(Segment(name, runs))
+    for i in range(len(specs)):
+        if sum(1 for segment in segments if owners[segment.runs[0][0]] == i) > ledproto.MAX_SEGMENTS:
+            raise Exception(f"a controller holds at most {ledproto.MAX_SEGMENTS} segments")
+    return segments
 
 
 class MultiLed(Generic, EasyResource):
@@ -33,11 +132,32 @@ class MultiLed(Generic, EasyResource):
         ModelFamily("vijayvuyyuru", "multi-led"), "multi-led"
     )
 
-    bus = None
+    controllers: Optional[ControllerGroup] = None
+    command_cache: Optional[commands.CommandCache] = None
+    presets: Optional[PresetMirror] = None
+    # strands the loaded timeline plays on
+    timeline_strands: FrozenSet[int] = frozenset()
+    segments = SegmentMap()
+    # the runs the controllers were last sent, see reconfigure
+    segment_runs: Optional[list] = None
+    # what the controllers were last set up with, see reconfigure
+    transport_config: Optional[tuple] = None
+    device_config: Optional[dict] = None
+    coalescer: Optional[CommandCoalescer] = None
+    pixel_streamer: Optional[PixelStreamer] = None
+    renderer: Optional[render.HostRenderer] = None
+    render_task: Optional[asyncio.Task] = None
+    frame_rate = DEFAULT_FRAME_RATE
+    acknowledge = False
+    ack_timeout = DEFAULT_ACK_TIMEOUT_MS / 1000
+    max_retries = DEFAULT_MAX_RETRIES
+    ack_stats: Optional[dict] = None
     strand_length = 0
     num_strands = 0
     brightness = 0
     address = 0
+    protocol = PROTOCOL_JSON
+    transport = TRANSPORT_I2C
 
     @classmethod
     def new(
@@ -66,7 +186,15 @@ class MultiLed(Generic, EasyResource):
         Returns:
             Sequence[str]: A list of implicit dependencies
         """
-        if "num_strands" not in config.attributes.fields:
+        if "controllers" in config.attributes.fields:
+            specs = controller_specs(config.attributes.fields)
+            if "num_strands" in config.attributes.fields and int(
+                config.attributes.fields["num_strands"].number_value
+            ) != sum(spec[2] for spec in specs):
+                raise Exception(
+                    "num_strands attribute must match the strands of all controllers together, or be left out"
+                )
+        elif "num_strands" not in config.attributes.fields:
             raise Exception(
                 "A num_strands attribute is required for multi led component. Must be an integer. This is the number of led strips"
             )
@@ -81,10 +209,112 @@ class MultiLed(Generic, EasyResource):
                 "A brightness attribute is required for multi led component component. Must be a float like 0.2 for 20% brightness"
             )
 
-        if "address" not in config.attributes.fields:
+        transport = TRANSPORT_I2C
+        if "transport" in config.attributes.fields:
+            transport = config.attributes.fields["transport"].string_value
+            if transport not in TRANSPORTS:
+                raise Exception(
+                    f"transport attribute must be one of {', '.join(TRANSPORTS)}, got '{transport}'"
+                )
+
+        if transport == TRANSPORT_UART:
+            if "serial_port" not in config.attributes.fields:
+                raise Exception(
+                    "A serial_port attribute like /dev/ttyACM0 is required for the uart transport"
+                )
+            if "controllers" in config.attributes.fields:
+                raise Exception("controllers attribute needs the i2c transport")
+            if "acknowledge" in config.attributes.fields and config.attributes.fields["acknowledge"].bool_value:
+                raise Exception(
+                    "acknowledge attribute needs the i2c transport, the uart firmware has no status to read"
+                )
+        elif "address" not in config.attributes.fields and "controllers" not in config.attributes.fields:
             raise Exception(
                 "A address attribute is required for multi led component. It should be of format 0xADDRESS"
             )
+
+        if "baud_rate" in config.attributes.fields:
+            if config.attributes.fields["baud_rate"].number_value <= 0:
+                raise Exception("baud_rate attribute must be a positive number of bits per second")
+
+        if "protocol" in config.attributes.fields:
+            protocol = config.attributes.fields["protocol"].string_value
+            if protocol not in PROTOCOLS:
+                raise Exception(
+                    f"protocol attribute must be one of {', '.join(PROTOCOLS)}, got '{protocol}'"
+                )
+
+        if "max_pending_commands" in config.attributes.fields:
+            if config.attributes.fields["max_pending_commands"].number_value < 1:
+                raise Exception(
+                    "max_pending_commands attribute must be a positive integer"
+                )
+
+        if "max_transfer_size" in config.attributes.fields:
+            if config.attributes.fields["max_transfer_size"].number_value < 2:
+                raise Exception(
+                    "max_transfer_size attribute must be the largest i2c write the adapter supports in bytes"
+                )
+
+        if "coalesce_window_ms" in config.attributes.fields:
+            if config.attributes.fields["coalesce_window_ms"].number_value < 0:
+                raise Exception(
+                    "coalesce_window_ms attribute must be a positive number of milliseconds, 0 disables coalescing"
+                )
+
+        if "render_mode" in config.attributes.fields:
+            render_mode = config.attributes.fields["render_mode"].string_value
+            if render_mode not in RENDER_MODES:
+                raise Exception(
+                    f"render_mode attribute must be one of {', '.join(RENDER_MODES)}, got '{render_mode}'"
+                )
+            if render_mode == RENDER_HOST and render.np is None:
+                raise Exception("render_mode host needs numpy installed")
+
+        if "frame_rate" in config.attributes.fields:
+            if config.attributes.fields["frame_rate"].number_value <= 0:
+                raise Exception(
+                    "frame_rate attribute must be a positive number of frames per second"
+                )
+
+        if "gamma" in config.attributes.fields:
+            if config.attributes.fields["gamma"].number_value <= 0:
+                raise Exception("gamma attribute must be a positive number like 2.2")
+            if transport == TRANSPORT_UART:
+                raise Exception("gamma attribute needs the i2c transport, the uart firmware has no lookup tables")
+
+        if "segments" in config.attributes.fields:
+            if transport == TRANSPORT_UART:
+                raise Exception("segments attribute needs the i2c transport")
+            if (
+                "render_mode" in config.attributes.fields
+                and config.attributes.fields["render_mode"].string_value == RENDER_HOST
+            ):
+                raise Exception("segments play on the firmware, they need render_mode firmware")
+            segment_specs(
+                config.attributes.fields,
+                controller_specs(config.attributes.fields),
+                int(config.attributes.fields["strand_length"].number_value),
+            )
+
+        if "acknowledge" in config.attributes.fields:
+            if config.attributes.fields["acknowledge"].bool_value and (
+                "protocol" not in config.attributes.fields
+                or config.attributes.fields["protocol"].string_value != PROTOCOL_BINARY
+            ):
+                raise Exception(
+                    "acknowledge attribute needs the binary protocol, set protocol to binary"
+                )
+
+        if "ack_timeout_ms" in config.attributes.fields:
+            if config.attributes.fields["ack_timeout_ms"].number_value <= 0:
+                raise Exception(
+                    "ack_timeout_ms attribute must be a positive number of milliseconds"
+                )
+
+        if "max_retries" in config.attributes.fields:
+            if config.attributes.fields["max_retries"].number_value < 0:
+                raise Exception("max_retries attribute must be 0 or more")
         return []
 
     def reconfigure(
@@ -96,32 +326,143 @@ class MultiLed(Generic, EasyResource):
             config (ComponentConfig): The new configuration
             dependencies (Mapping[ResourceName, ResourceBase]): Any dependencies (both implicit and explicit)
         """
-        num_strands: int = int(config.attributes.fields["num_strands"].number_value)
+        specs = controller_specs(config.attributes.fields)
+        LOG.info(f"controllers (bus, address, strands): {specs}")
+        num_strands: int = sum(spec[2] for spec in specs)
         strand_length: int = int(config.attributes.fields["strand_length"].number_value)
         brightness: float = config.attributes.fields["brightness"].number_value
-        address_hex_string = config.attributes.fields["address"].string_value
-        LOG.info(f"address hex string: {address_hex_string}")
-        address = int(address_hex_string, 16)
-        LOG.info(f"converted address: {address}")
-
-        if self.bus is not None:
-            self.bus.close()
-
-        self.bus = SMBus(1)
-        pixel_config = {
-            "reconfigure": {
-                "num_strands": num_strands,
-                "strand_length": strand_length,
-                "brightness": brightness,
-            }
+        segments = segment_specs(config.attributes.fields, specs, strand_length)
+        protocol = PROTOCOL_JSON
+        if "protocol" in config.attributes.fields:
+            protocol = config.attributes.fields["protocol"].string_value
+        max_pending = DEFAULT_MAX_PENDING
+        if "max_pending_commands" in config.attributes.fields:
+            max_pending = int(config.attributes.fields["max_pending_commands"].number_value)
+        transport_kind = TRANSPORT_I2C
+        if "transport" in config.attributes.fields:
+            transport_kind = config.attributes.fields["transport"].string_value
+        serial_port = ""
+        if "serial_port" in config.attributes.fields:
+            serial_port = config.attributes.fields["serial_port"].string_value
+        baud_rate = DEFAULT_BAUD_RATE
+        if "baud_rate" in config.attributes.fields:
+            baud_rate = int(config.attributes.fields["baud_rate"].number_value)
+        max_transfer_size = I2C_MAX_MESSAGE_LEN
+        if "max_transfer_size" in config.attributes.fields:
+            max_transfer_size = int(config.attributes.fields["max_transfer_size"].number_value)
+        coalesce_window_ms = 0.0
+        if "coalesce_window_ms" in config.attributes.fields:
+            coalesce_window_ms = config.attributes.fields["coalesce_window_ms"].number_value
+        render_mode = RENDER_FIRMWARE
+        if "render_mode" in config.attributes.fields:
+            render_mode = config.attributes.fields["render_mode"].string_value
+        frame_rate = DEFAULT_FRAME_RATE
+        if "frame_rate" in config.attributes.fields:
+            frame_rate = config.attributes.fields["frame_rate"].number_value
+        gamma = DEFAULT_GAMMA
+        if "gamma" in config.attributes.fields:
+            gamma = config.attributes.fields["gamma"].number_value
+        acknowledge = False
+        if "acknowledge" in config.attributes.fields:
+            acknowledge = config.attributes.fields["acknowledge"].bool_value
+        ack_timeout_ms = DEFAULT_ACK_TIMEOUT_MS
+        if "ack_timeout_ms" in config.attributes.fields:
+            ack_timeout_ms = config.attributes.fields["ack_timeout_ms"].number_value
+        max_retries = DEFAULT_MAX_RETRIES
+        if "max_retries" in config.attributes.fields:
+            max_retries = int(config.attributes.fields["max_retries"].number_value)
+
+        self.stop_render_loop()
+
+        if self.coalescer is not None:
+            self.coalescer.close()
+            self.coalescer = None
+        if coalesce_window_ms > 0:
+            self.coalescer = CommandCoalescer(coalesce_window_ms / 1000, self.send_command)
+
+        transport_config = (transport_kind, serial_port, baud_rate, specs, max_pending, max_transfer_size)
+        if self.controllers is None or transport_config != self.transport_config:
+            controllers = []
+            if transport_kind == TRANSPORT_UART:
+                port = serial.Serial(serial_port, baud_rate, write_timeout=SERIAL_WRITE_TIMEOUT)
+                controllers.append(Controller(None, SerialTransport(port, max_pending), 0, 0, num_strands))
+            # controllers on the same bus, also those of other resources, share its handle
+            # and take turns on it, separate buses are written at the same time. The new ones
+            # take their buses from the pool before the old ones let go, so the handles stay open.
+            first_strand = 0
+            for bus, address, strands in specs if transport_kind == TRANSPORT_I2C else ():
+                shared_bus = BUS_POOL.acquire(bus)
+                transport = I2CTransport(shared_bus.bus, address, max_pending, max_transfer_size, shared_bus.lock)
+                controllers.append(Controller(shared_bus, transport, address, first_strand, strands))
+                first_strand += strands
+            if self.controllers is not None:
+                self.controllers.close()
+            self.controllers = ControllerGroup(controllers)
+            self.transport_config = transport_config
+            # other devices, or the same ones in another order, get the whole config and
+            # have none of the presets
+            self.device_config = None
+            self.segment_runs = None
+            self.presets = PresetMirror()
+            self.timeline_strands = frozenset()
+            LOG.info(f"transport stats: {self.controllers.stats()}")
+        device_config = {
+            "num_strands": num_strands,
+            "strand_length": strand_length,
+            "brightness": brightness,
+            "host_render": render_mode == RENDER_HOST,
+            # the firmware paces its frames only when asked to
+            "frame_rate": frame_rate if "frame_rate" in config.attributes.fields else 0,
+            "gamma": gamma,
         }
+        previous = self.device_config
+        # a reconfigure rebuilds the display on the firmware, only send it when the display
+        # changed, a new brightness or gamma alone is applied without touching the strands
+        rebuild = previous is None or any(
+            previous[key] != value for key, value in device_config.items() if key not in ("brightness", "gamma")
+        )
 
         self.num_strands = num_strands
-        self.strand_length = self.strand_length
+        self.strand_length = strand_length
         self.brightness = brightness
-        self.address = address
+        self.segments = SegmentMap(segments, num_strands)
+        self.controllers.set_segments([segment.runs for segment in segments])
+        self.address = specs[0][1]
+        self.protocol = protocol
+        self.transport = transport_kind
+        if rebuild:
+            self.pixel_streamer = PixelStreamer(num_strands, strand_length)
+        self.frame_rate = frame_rate
+        self.acknowledge = acknowledge
+        self.ack_timeout = ack_timeout_ms / 1000
+        self.max_retries = max_retries
+        self.ack_stats = {"acknowledged": 0, "resent": 0, "errors": 0}
+        # checks depend on the display size and transport, frames on the protocol and controllers
+        self.command_cache = commands.CommandCache()
+        if render_mode != RENDER_HOST:
+            self.renderer = None
+        elif rebuild or self.renderer is None:
+            self.renderer = render.HostRenderer(num_strands, strand_length, time.monotonic())
 
-        self.send_message(pixel_config)
+        if rebuild or previous["gamma"] != gamma:
+            # the firmware keeps its strands when the display size stays the same
+            self.send_message({"reconfigure": device_config})
+        elif previous["brightness"] != brightness:
+            self.send_message({"set_brightness": brightness})
+        else:
+            LOG.info("display config unchanged, nothing sent to the controllers")
+        self.device_config = device_config
+        # the firmware drops its segments when it rebuilds the strands and keeps them otherwise
+        segment_runs = self.segments.runs()
+        if segment_runs != (self.segment_runs or []) or (rebuild and segment_runs):
+            self.send_message({"define_segments": segment_runs})
+        self.segment_runs = segment_runs
+        if self.renderer is not None:
+            try:
+                self.start_render_loop()
+            except RuntimeError:
+                # no running event loop yet, do_command starts it
+                pass
 
     async def do_command(
         self,
@@ -131,30 +472,367 @@ class MultiLed(Generic, EasyResource):
         **kwargs,
     ) -> Mapping[str, ValueTypes]:
         LOG.info(f"value passed into do command: {command}")
-        return self.send_message(command)
+        if "get_stats" in command:
+            return self.get_stats()
+        if "get_status" in command:
+            return await self.poll_controllers("poll_status", timeout)
+        if "get_device_stats" in command:
+            return await self.poll_controllers("poll_stats", timeout)
+        if "store_preset" in command:
+            return await self.store_preset(command["store_preset"], timeout)
+        if "recall_preset" in command:
+            return await self.recall_preset(command["recall_preset"], timeout)
+        if "delete_preset" in command:
+            return await self.delete_preset(command["delete_preset"], timeout)
+        if "list_presets" in command:
+            return {"presets": self.presets.ids()}
+        if "load_timeline" in command:
+            return await self.load_timeline(command["load_timeline"], timeout)
+        if "start_timeline" in command:
+            return await self.control_timeline("timeline_start", command["start_timeline"], timeout)
+        if "seek_timeline" in command:
+            return await self.control_timeline("timeline_seek", command["seek_timeline"], timeout)
+        if "stop_timeline" in command:
+            return await self.control_timeline("timeline_stop", command["stop_timeline"], timeout)
+        # segments are addressed by name, the rest of the way by their strand index
+        command = self.segments.resolve(command)
+        key = None
+        if is_strand_command(command):
+            key = self.check_command(command)
+        if self.renderer is not None:
+            self.handle_host_render_command(command)
+            return {}
+        if "stream_pixels" in command:
+            strand_length = self.pixel_streamer.strand_length
+            frames = {
+                int(strand): frame_from_colors(colors, strand_length)
+                for strand, colors in command["stream_pixels"].items()
+            }
+            await self.stream_pixels(frames, timeout)
+            return {}
+        if is_strand_command(command):
+            # anything else sent to a strand overwrites what was streamed to it
+            self.invalidate_streamed(command)
+        if self.coalescer is not None and is_strand_command(command):
+            result = await self.coalescer.submit(command, timeout)
+        else:
+            result = await self.send_command(command, timeout, key)
+        return result or {}
+
+    async def store_preset(self, args: Mapping, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        """Store a per strand command on the controllers under a name, storing a name again replaces it.
+
+        recall_preset then applies it with a frame of a few bytes.
+        """
+        if "name" not in args or "scene" not in args or not is_strand_command(self.segments.resolve(args["scene"])):
+            raise ValueError('store_preset needs a name and a scene like {"0": {"set_animation": "solid"}}')
+        name = str(args["name"])
+        scene = self.segments.resolve(args["scene"])
+        self.check_command(scene)
+        preset_id = self.presets.allocate(name)
+        result = {}
+        if self.renderer is None:
+            result = await self.send_command({"store_preset": {"id": preset_id, "scene": scene}}, timeout)
+        # a preset one of the controllers rejected is not mirrored, a scene stored under the
+        # name before stays
+        if not any("error" in part for part in [result, *result.get("controllers", ())]):
+            self.presets.store(name, preset_id, scene)
+        return {"preset": name, "id": preset_id, **result}
+
+    async def recall_preset(self, name_or_id, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        name, preset = self.presets.find(name_or_id)
+        if self.renderer is not None:
+            self.handle_host_render_command(preset.scene)
+            return {"preset": name}
+        # the preset overwrites what was streamed to its strands
+        self.invalidate_streamed(preset.scene)
+        result = await self.send_command({"recall_preset": preset.id}, timeout)
+        return {"preset": name, **result}
+
+    async def delete_preset(self, name_or_id, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        name, preset = self.presets.find(name_or_id)
+        result = {}
+        if self.renderer is None:
+            result = await self.send_command({"delete_preset": preset.id}, timeout)
+        self.presets.delete(name)
+        return result
+
+    async def load_timeline(self, args: Mapping, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        """Load keyframes onto the controllers, replacing the timeline they hold.
+
+        Every keyframe is a per strand scene applied at its time in seconds. The controllers
+        play them on their own clock after start_timeline, so bus latency does not move them.
+        A looping timeline starts over after length seconds, by default the last keyframe's time.
+        """
+        if self.renderer is not None:
+            raise ValueError("timelines play on the firmware, they need render_mode firmware")
+        if self.transport == TRANSPORT_UART:
+            raise ValueError("the uart firmware has no timelines, they need the i2c transport")
+        if not isinstance(args, Mapping):
+            raise ValueError('load_timeline needs {"keyframes": [...]}')
+        keyframes = args.get("keyframes")
+        if isinstance(keyframes, (list, tuple)):
+            keyframes = [
+                {**keyframe, "scene": self.segments.resolve(keyframe["scene"])}
+                if isinstance(keyframe, Mapping) and isinstance(keyframe.get("scene"), Mapping)
+                else keyframe
+                for keyframe in keyframes
+            ]
+        keyframes = commands.check_keyframes(keyframes, self.num_strands, self.strand_length, self.segments.lengths)
+        length = args.get("length", keyframes[-1][0])
+        if isinstance(length, bool) or not isinstance(length, (int, float)) or length < 0:
+            raise ValueError(f"timeline length must be a number of seconds, got {length}")
+        loop = bool(args.get("loop", False))
+        result = await self.send_command({"timeline_clear": {"loop": loop, "length": length}}, timeout)
+        for loaded, (at, scene) in enumerate(keyframes):
+            if "error" in result:
+                return {"keyframes": loaded, **result}
+            result = await self.send_command({"timeline_keyframe": {"at": at, "scene": scene}}, timeout)
+        self.timeline_strands = frozenset(
+            covered for _, scene in keyframes for strand in scene for covered in self.segments.strands(int(strand))
+        )
+        return {"keyframes": len(keyframes), "length": length, **result}
+
+    async def control_timeline(self, action: str, args: Mapping, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        """Start, seek or stop the loaded timeline, args {"at": seconds}.
+
+        start_timeline without at plays on from where the timeline stands, at 0 after a
+        load. Seeking applies every keyframe up to the new position.
+        """
+        if self.renderer is not None:
+            raise ValueError("timelines play on the firmware, they need render_mode firmware")
+        if self.transport == TRANSPORT_UART:
+            raise ValueError("the uart firmware has no timelines, they need the i2c transport")
+        position = 0
+        if action != "timeline_stop":
+            position = args.get("at", ledproto.TIMELINE_HERE) if isinstance(args, Mapping) else args
+            # bool is an int, true would start the timeline 1 second in
+            if (
+                isinstance(position, bool)
+                or not isinstance(position, (int, float))
+                or (position < 0 and position != ledproto.TIMELINE_HERE)
+            ):
+                raise ValueError(f"timeline position must be a number of seconds, got {position}")
+            if action == "timeline_seek" and position == ledproto.TIMELINE_HERE:
+                raise ValueError('seek_timeline needs a position like {"at": 2.5}')
+        # the timeline overwrites what was streamed to its strands
+        for strand in self.timeline_strands:
+            self.pixel_streamer.invalidate(strand)
+        return await self.send_command({action: position}, timeout)
+
+    def check_command(self, command: Mapping[str, ValueTypes]) -> Optional[Hashable]:
+        """Reject a per strand command the firmware would not take, returns its cache key.
+
+        A command seen before is not checked again.
+        """
+        key = commands.command_key(command)
+        if not self.command_cache.checked(key):
+            # the uart firmware restarts the animation on every command, the host renderer does not
+            live_updates = self.transport != TRANSPORT_UART or self.renderer is not None
+            commands.check_command(
+                command, self.num_strands, self.strand_length, self.segments.lengths, live_updates
+            )
+            self.command_cache.add(key)
+        return key
+
+    def invalidate_streamed(self, command: Mapping) -> None:
+        """Forget what was streamed to the strands a per strand command covers, segments included."""
+        for strand in command:
+            for covered in self.segments.strands(int(strand)):
+                self.pixel_streamer.invalidate(covered)
+
+    def handle_host_render_command(self, command: Mapping[str, ValueTypes]):
+        if self.render_task is None:
+            self.start_render_loop()
+        if "stream_pixels" in command:
+            for strand, colors in command["stream_pixels"].items():
+                self.renderer.set_frame(
+                    int(strand), frame_from_colors(colors, self.pixel_streamer.strand_length)
+                )
+        elif is_strand_command(command):
+            self.renderer.handle_command(command, time.monotonic())
+        else:
+            raise ValueError(f"command {list(command)} is not supported in render_mode host")
+
+    def start_render_loop(self):
+        self.render_task = asyncio.get_running_loop().create_task(self.render_loop())
+
+    def stop_render_loop(self):
+        if self.render_task is not None:
+            self.render_task.cancel()
+            self.render_task = None
+
+    async def render_loop(self):
+        """Render every animation on the host and stream the frames, the firmware only shows them."""
+        frame = self.frame_buffer()
+        interval = 1 / self.frame_rate
+        while True:
+            started = time.monotonic()
+            self.renderer.render(frame.array, started)
+            try:
+                await frame.push(self, interval)
+            except Exception as e:
+                LOG.error(f"failed to stream rendered frame: {e}")
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    async def poll_controllers(self, poll: str, timeout: Optional[float] = None) -> Mapping[str, ValueTypes]:
+        """Read a device register of every controller, see I2CTransport.poll_status and poll_stats."""
+        if self.transport == TRANSPORT_UART:
+            raise ValueError(
+                "get_status and get_device_stats are not supported on uart transport, the uart firmware has no registers to read"
+            )
+        parts = [(controller, None) for controller in self.controllers.controllers]
+        results = await self.controllers.gather(
+            parts, lambda controller, _: getattr(controller.transport, poll)(timeout)
+        )
+        return self.combine_results(parts, results)
+
+    def combine_results(self, parts, results: list) -> Mapping[str, ValueTypes]:
+        # a single controller answers like before there were several
+        if len(results) == 1:
+            return results[0] or {}
+        if not any(results):
+            return {}
+        return {
+            "controllers": [
+                {"controller": controller.name, **(result or {})}
+                for (controller, _), result in zip(parts, results)
+            ]
+        }
+
+    def get_stats(self) -> Mapping[str, ValueTypes]:
+        transports = self.controllers.stats()
+        if len(transports) == 1:
+            stats = {"transport": transports[0]}
+        else:
+            stats = {"controllers": transports}
+        stats["bus_pool"] = BUS_POOL.stats()
+        if self.coalescer is not None:
+            stats["coalescer"] = self.coalescer.stats()
+        if self.acknowledge:
+            stats["acks"] = dict(self.ack_stats)
+        stats["command_cache"] = self.command_cache.stats()
+        return stats
+
+    def encode_message(self, message) -> bytes:
+        if self.protocol == PROTOCOL_BINARY:
+            return bytes(ledproto.encode_message(message))
+        return json.dumps(message).encode("utf-8")
+
+    async def send_command(
+        self, message, timeout: Optional[float] = None, key: Optional[Hashable] = None
+    ) -> Mapping[str, ValueTypes]:
+        """Send a message to the controllers of the strands it names, all of them at once.
+
+        Per strand messages are encoded once and their frames reused when sent again,
+        key is their commands.command_key if the caller has it already.
+        """
+        if is_strand_command(message):
+            if key is None:
+                key = commands.command_key(message)
+            parts = self.command_cache.encoded(key)
+            if parts is None:
+                parts = [
+                    (controller, self.encode_message(part))
+                    for controller, part in self.controllers.split(message)
+                ]
+                self.command_cache.set_encoded(key, parts)
+        else:
+            parts = [(controller, self.encode_message(part)) for controller, part in self.controllers.split(message)]
+
+        async def send(controller: Controller, payload: bytes) -> Mapping[str, ValueTypes]:
+            if self.acknowledge:
+                return await self.send_acknowledged(controller, payload, timeout)
+            await controller.transport.send(payload, timeout)
+            return {}
+
+        return self.combine_results(parts, await self.controllers.gather(parts, send))
+
+    async def send_acknowledged(
+        self, controller: Controller, frames: bytes, timeout: Optional[float] = None
+    ) -> Mapping[str, ValueTypes]:
+        """Send binary frames with a seq number and wait until the device reports it handled them.
+
+        The message is only resent when the device answers with another seq, i.e. it is
+        alive but never got this one intact. Errors from the device come back as "error".
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(deadline - loop.time(), 0)
+
+        # one message in flight at a time, otherwise a newer seq would hide a lost one
+        async with controller.ack_lock:
+            seq = controller.next_seq()
+            payload = bytes(ledproto.set_seq(frames, seq))
+            for _ in range(self.max_retries + 1):
+                await controller.transport.send(payload, remaining())
+                status = await self.wait_for_ack(controller, seq, remaining())
+                if status["seq"] == seq:
+                    self.ack_stats["acknowledged"] += 1
+                    if status["code"] != ledproto.STATUS_OK:
+                        self.ack_stats["errors"] += 1
+                        return {"seq": seq, "error": status["error"]}
+                    return {"seq": seq}
+                self.ack_stats["resent"] += 1
+                LOG.warning(
+                    f"message {seq} to {controller.name} was lost, device is at {status['seq']} with {status['bad_frames']} bad frames, resending"
+                )
+        raise ConnectionError(f"message {seq} to {controller.name} was lost {self.max_retries + 1} times")
+
+    async def wait_for_ack(self, controller: Controller, seq: int, timeout: Optional[float]) -> dict:
+        """Poll the status until seq shows up or ack_timeout passes, returns the last status."""
+        loop = asyncio.get_running_loop()
+        wait = self.ack_timeout if timeout is None else min(self.ack_timeout, timeout)
+        give_up = loop.time() + wait
+        while True:
+            status = await controller.transport.poll_status(timeout)
+            if status["seq"] == seq or loop.time() >= give_up:
+                return status
+            await asyncio.sleep(ACK_POLL_INTERVAL)
+
+    def frame_buffer(self) -> FrameBuffer:
+        """A FrameBuffer sized for the configured display, send it with FrameBuffer.push(self)."""
+        return FrameBuffer(self.num_strands, self.pixel_streamer.strand_length)
+
+    async def stream_pixels(self, frames: Mapping[int, bytes], timeout: Optional[float] = None):
+        """Send full strand frames (strand_length * 3 bytes of rgb), only changed pixels go on the bus."""
+        changes = self.pixel_streamer.diff_all(frames)
+        if not changes:
+            return
+
+        async def send(controller: Controller, spans: Mapping[int, list]) -> None:
+            if self.protocol == PROTOCOL_BINARY:
+                payload = bytes(ledproto.encode_pixel_spans(spans))
+            else:
+                payload = json.dumps(
+                    {
+                        str(strand): {"set_pixel_colors": spans_to_pixel_colors(strand_spans)}
+                        for strand, strand_spans in spans.items()
+                    }
+                ).encode("utf-8")
+            try:
+                await controller.transport.send(payload, timeout)
+            except Exception:
+                # the controller may or may not have these pixels now
+                for strand in spans:
+                    self.pixel_streamer.invalidate(controller.first_strand + strand)
+                raise
+
+        await self.controllers.gather(self.controllers.split_strands(changes), send)
 
     def send_message(self, message):
-        byte_string = json.dumps(message).encode("utf-8")
-        chunks = divide_chunks(byte_string, MESSAGE_CHUNK_SIZE)
-        LOG.info("sent message over i2c")
-        for chunk in chunks:
-            self.bus.write_i2c_block_data(self.address, 0x00, chunk)
-        
-        # response = self.bus.read_i2c_block_data(self.address, 0x00, MESSAGE_CHUNK_SIZE)
-        # response_string = self.convert_int_list_to_string(response)
-        
-        # return {"response": response_string}
-    
-    def convert_int_list_to_string(self, int_list):
-        # Convert list of integers to bytes
-        byte_data = bytes(int_list)
-        
-        # Decode bytes to string, stopping at null terminators
-        # The 'utf-8' encoding is commonly used, but you might need another one depending on your data
-        return byte_data.decode('utf-8').rstrip('\x00')
+        parts = self.controllers.split(message)
+        self.controllers.send_blocking([(controller, self.encode_message(part)) for controller, part in parts])
+        LOG.info("sent message over %s", ", ".join(controller.transport.name for controller, _ in parts))
 
     async def close(self):
-        self.bus.close()
+        self.stop_render_loop()
+        if self.coalescer is not None:
+            self.coalescer.close()
+        if self.controllers is not None:
+            self.controllers.close()
 
 
 if __name__ == "__main__":
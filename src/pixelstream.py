@@ -0,0 +1,149 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# unchanged pixels between two changed ones are resent rather than starting a new span,
+# a span header costs about as much as one pixel
+MERGE_GAP = 1
+# runs of at least this many identical pixels are sent as a single fill color
+MIN_FILL_RUN = 4
+# pixels compared at once without numpy, only blocks that differ are looked at pixel by pixel
+COMPARE_BLOCK = 16
+
+Span = Tuple[int, int, bytes]
+
+
+def frame_from_colors(colors: Sequence, strand_length: int) -> bytearray:
+    """Build a strand frame from [[r, g, b], ...] or a flat [r, g, b, r, g, b, ...] list."""
+    frame = bytearray(strand_length * 3)
+    if len(colors) > 0 and isinstance(colors[0], (list, tuple)):
+        flat = [int(value) for color in colors for value in color[:3]]
+    else:
+        flat = [int(value) for value in colors]
+    if len(flat) > len(frame):
+        raise ValueError(
+            f"got {len(flat) // 3} pixels for a strand of {strand_length} pixels"
+        )
+    frame[: len(flat)] = bytes(flat)
+    return frame
+
+
+def changed_ranges(previous: Optional[bytes], frame: bytes) -> List[Tuple[int, int]]:
+    """Return [start, end) pixel ranges where frame differs from previous."""
+    num_pixels = len(frame) // 3
+    if previous is None or len(previous) != len(frame):
+        return [(0, num_pixels)] if num_pixels > 0 else []
+    if previous == frame:
+        return []
+    if np is not None:
+        return _changed_ranges_numpy(previous, frame)
+
+    ranges: List[Tuple[int, int]] = []
+    start = None
+    last_changed = -1
+    old = memoryview(previous)
+    new = memoryview(frame)
+    block = COMPARE_BLOCK * 3
+    for offset in range(0, len(frame), block):
+        # equal blocks are compared in one go without copying
+        if old[offset : offset + block] == new[offset : offset + block]:
+            continue
+        for j in range(offset, min(offset + block, len(frame)), 3):
+            if old[j] == new[j] and old[j + 1] == new[j + 1] and old[j + 2] == new[j + 2]:
+                continue
+            i = j // 3
+            if start is not None and i - last_changed > MERGE_GAP + 1:
+                ranges.append((start, last_changed + 1))
+                start = None
+            if start is None:
+                start = i
+            last_changed = i
+    if start is not None:
+        ranges.append((start, last_changed + 1))
+    return ranges
+
+
+def _changed_ranges_numpy(previous: bytes, frame: bytes) -> List[Tuple[int, int]]:
+    old = np.frombuffer(previous, dtype=np.uint8).reshape(-1, 3)
+    new = np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3)
+    changed = np.flatnonzero((old != new).any(axis=1))
+    # a range ends where the next changed pixel is more than MERGE_GAP pixels away
+    breaks = np.flatnonzero(np.diff(changed) > MERGE_GAP + 1)
+    starts = np.concatenate((changed[:1], changed[breaks + 1]))
+    ends = np.concatenate((changed[breaks], changed[-1:])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def run_length_spans(frame: bytes, start: int, end: int) -> List[Span]:
+    """Split the pixel range [start, end) into literal spans and fill spans for long runs."""
+    view = memoryview(frame)
+    spans: List[Span] = []
+    literal_start = start
+    i = start
+    while i < end:
+        color = frame[i * 3 : i * 3 + 3]
+        run_end = i + 1
+        while run_end < end and frame[run_end * 3 : run_end * 3 + 3] == color:
+            run_end += 1
+        if run_end - i >= MIN_FILL_RUN:
+            if literal_start < i:
+                spans.append((literal_start, i - literal_start, view[literal_start * 3 : i * 3]))
+            spans.append((i, run_end - i, color))
+            literal_start = run_end
+        i = run_end
+    if literal_start < end:
+        spans.append((literal_start, end - literal_start, view[literal_start * 3 : end * 3]))
+    return spans
+
+
+class PixelStreamer:
+    """Remembers the last frame sent to every strand so only changed pixels go on the bus."""
+
+    def __init__(self, num_strands: int, strand_length: int) -> None:
+        self.num_strands = num_strands
+        self.strand_length = strand_length
+        self.last_frames: List[Optional[bytes]] = [None] * num_strands
+
+    def invalidate(self, strand: Optional[int] = None) -> None:
+        """Forget what a strand shows, e.g. after it was given an animation. None forgets all."""
+        if strand is None:
+            self.last_frames = [None] * self.num_strands
+        elif 0 <= strand < self.num_strands:
+            self.last_frames[strand] = None
+
+    def diff(self, strand: int, frame: bytes) -> List[Span]:
+        """Return the spans that turn the last frame of strand into frame and remember it."""
+        if not 0 <= strand < self.num_strands:
+            raise ValueError("index out of bound for configured number of leds")
+        if len(frame) != self.strand_length * 3:
+            raise ValueError(
+                f"frame is {len(frame)} bytes, expected {self.strand_length * 3} for strand {strand}"
+            )
+        spans: List[Span] = []
+        for start, end in changed_ranges(self.last_frames[strand], frame):
+            spans.extend(run_length_spans(frame, start, end))
+        if spans or self.last_frames[strand] is None:
+            self.last_frames[strand] = bytes(frame)
+        return spans
+
+    def diff_all(self, frames: Dict[int, bytes]) -> Dict[int, List[Span]]:
+        changes = {}
+        for strand, frame in frames.items():
+            spans = self.diff(strand, frame)
+            if spans:
+                changes[strand] = spans
+        return changes
+
+
+def spans_to_pixel_colors(spans: List[Span]) -> Dict[str, List[int]]:
+    """Expand spans into the set_pixel_colors shape for the json protocol."""
+    pixel_colors = {}
+    for start, count, rgb in spans:
+        fill = count > 1 and len(rgb) == 3
+        for i in range(count):
+            j = 0 if fill else i * 3
+            pixel_colors[str(start + i)] = [rgb[j], rgb[j + 1], rgb[j + 2]]
+    return pixel_colors
@@ -0,0 +1,50 @@
+from typing import Dict, Mapping, Optional, Tuple, Union
+
+import ledproto
+
+
+class Preset:
+    def __init__(self, preset_id: int, scene: Mapping) -> None:
+        self.id = preset_id
+        self.scene = scene
+
+
+class PresetMirror:
+    """The presets stored on the controllers, by name.
+
+    The firmware only knows preset ids, the mirror hands them out and keeps each scene so
+    a recall is a one byte frame and the host knows which strands it changes.
+    """
+
+    def __init__(self, max_presets: int = ledproto.MAX_PRESETS) -> None:
+        self.max_presets = max_presets
+        self.presets: Dict[str, Preset] = {}
+
+    def allocate(self, name: str) -> int:
+        """The id a preset stored under name gets, the one it has if it exists already."""
+        if name in self.presets:
+            return self.presets[name].id
+        used = {preset.id for preset in self.presets.values()}
+        for preset_id in range(self.max_presets):
+            if preset_id not in used:
+                return preset_id
+        raise ValueError(f"all {self.max_presets} presets are in use, delete one first")
+
+    def store(self, name: str, preset_id: int, scene: Mapping) -> None:
+        self.presets[name] = Preset(preset_id, scene)
+
+    def find(self, name_or_id: Union[str, int, float]) -> Tuple[str, Preset]:
+        """Look a preset up by name, or by id when given a number."""
+        if isinstance(name_or_id, (int, float)) and not isinstance(name_or_id, bool):
+            for name, preset in self.presets.items():
+                if preset.id == int(name_or_id):
+                    return name, preset
+        elif str(name_or_id) in self.presets:
+            return str(name_or_id), self.presets[str(name_or_id)]
+        raise ValueError(f"unknown preset {name_or_id}")
+
+    def delete(self, name: str) -> Optional[Preset]:
+        return self.presets.pop(name, None)
+
+    def ids(self) -> Dict[str, int]:
+        return {name: preset.id for name, preset in self.presets.items()}
@@ -0,0 +1,405 @@
+"""Host side equivalents of the firmware animations, rendered with numpy.
+
+Used when MultiLed runs with render_mode "host": animations are computed here for a
+whole FrameBuffer at once and streamed to the controller, which only shows frames.
+Animations are driven by elapsed time rather than by the frame counter, so they keep
+their speed whatever frame rate the host manages.
+"""
+
+import math
+from typing import Callable, Dict, List, Mapping, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import ledproto
+
+# same values as adafruit_led_animation.color
+COLORS = {
+    "amber": (255, 100, 0),
+    "aqua": (50, 255, 255),
+    "black": (0, 0, 0),
+    "blue": (0, 0, 255),
+    "green": (0, 255, 0),
+    "orange": (255, 40, 0),
+    "pink": (242, 90, 255),
+    "purple": (180, 0, 255),
+    "red": (255, 0, 0),
+    "white": (255, 255, 255),
+    "yellow": (255, 150, 0),
+    "gold": (255, 222, 30),
+    "jade": (0, 255, 40),
+    "magenta": (255, 0, 20),
+    "old_lace": (253, 245, 230),
+    "teal": (0, 255, 120),
+}
+
+
+def parse_color(color):
+    if isinstance(color, str):
+        value = COLORS.get(color.lower())
+        if value is None:
+            raise ValueError(f"invalid color name {color}")
+        return value
+    return (int(color[0]), int(color[1]), int(color[2]))
+
+
+def color_wheel(positions):
+    """Vectorized rainbowio.colorwheel, positions 0-255 to rgb rows."""
+    pos = np.mod(positions, 256).astype(np.float32)
+    out = np.zeros(pos.shape + (3,), dtype=np.float32)
+    first = pos < 85
+    second = (pos >= 85) & (pos < 170)
+    third = pos >= 170
+    p = pos[first]
+    out[first] = np.stack((255 - p * 3, p * 3, np.zeros_like(p)), axis=-1)
+    p = pos[second] - 85
+    out[second] = np.stack((np.zeros_like(p), 255 - p * 3, p * 3), axis=-1)
+    p = pos[third] - 170
+    out[third] = np.stack((p * 3, np.zeros_like(p), 255 - p * 3), axis=-1)
+    return out
+
+
+class AnimationParams:
+    """The args a strand animation is built from, defaults match PixelStrand on the firmware."""
+
+    def __init__(self) -> None:
+        self.speed = 0.1
+        self.colors = [COLORS["red"]]
+        self.tail_length = 10
+        self.bounce = False
+        self.size = 1
+        self.spacing = 1
+        self.period = 1
+        self.num_sparkles = 1
+        self.step = 1
+
+    def copy(self) -> "AnimationParams":
+        params = AnimationParams()
+        params.__dict__.update(self.__dict__)
+        return params
+
+    def update(self, name: str, value) -> None:
+        if name == "speed":
+            self.speed = float(value)
+        elif name == "color":
+            self.colors = [parse_color(value)]
+        elif name == "colors":
+            self.colors = [parse_color(color) for color in value]
+        elif name in ("tail_length", "size", "spacing", "period", "num_sparkles", "step"):
+            setattr(self, name, int(value))
+        elif name == "bounce":
+            self.bounce = bool(int(value))
+        else:
+            raise ValueError(f"invalid arg: {name}")
+
+    def steps(self, t: float) -> int:
+        if self.speed <= 0:
+            return 0
+        return int(t / self.speed)
+
+
+def _sparkle_indices(params: AnimationParams, n: int, t: float, seed: int):
+    rng = np.random.default_rng(seed * 7919 + params.steps(t))
+    return rng.integers(0, n, size=min(params.num_sparkles, n))
+
+
+def _solid(out, params, t, seed):
+    out[:] = params.colors[0]
+
+
+def _blink(out, params, t, seed):
+    out[:] = params.colors[0] if params.steps(t) % 2 == 0 else (0, 0, 0)
+
+
+def _colorcycle(out, params, t, seed):
+    out[:] = params.colors[params.steps(t) % len(params.colors)]
+
+
+def _comet_distance(params, n, t):
+    tail = max(params.tail_length, 1)
+    cycle = n + tail
+    k = params.steps(t) % (2 * cycle if params.bounce else cycle)
+    reverse = k >= cycle
+    if reverse:
+        k -= cycle
+    index = np.arange(n)
+    if reverse:
+        index = n - 1 - index
+    dist = k - index
+    lit = (dist >= 0) & (dist < tail)
+    return dist, lit, tail
+
+
+def _comet(out, params, t, seed):
+    dist, lit, tail = _comet_distance(params, out.shape[0], t)
+    level = np.where(lit, 1.0 - dist / tail, 0.0)
+    out[:] = np.asarray(params.colors[0], dtype=np.float32) * level[:, None]
+
+
+def _rainbow_comet(out, params, t, seed):
+    dist, lit, tail = _comet_distance(params, out.shape[0], t)
+    level = np.where(lit, 1.0 - dist / tail, 0.0)
+    out[:] = color_wheel(dist * 255 / tail) * level[:, None]
+
+
+def _chase_bars(params, n, t):
+    bar = max(params.size + params.spacing, 1)
+    shifted = np.arange(n) - params.steps(t)
+    return np.mod(shifted, bar) < params.size, np.floor_divide(shifted, bar)
+
+
+def _chase(out, params, t, seed):
+    on, _ = _chase_bars(params, out.shape[0], t)
+    out[:] = 0
+    out[on] = params.colors[0]
+
+
+def _custom_color_chase(out, params, t, seed):
+    on, bars = _chase_bars(params, out.shape[0], t)
+    colors = np.asarray(params.colors, dtype=np.float32)
+    out[:] = 0
+    out[on] = colors[np.mod(bars[on], len(colors))]
+
+
+def _rainbow_chase(out, params, t, seed):
+    on, bars = _chase_bars(params, out.shape[0], t)
+    out[:] = 0
+    out[on] = color_wheel(bars[on] * params.step * 8 + params.steps(t) * params.step)
+
+
+def _pulse_level(params, t):
+    period = max(params.period, 1e-3)
+    return 0.5 - 0.5 * math.cos(2 * math.pi * t / period)
+
+
+def _pulse(out, params, t, seed):
+    out[:] = np.asarray(params.colors[0], dtype=np.float32) * _pulse_level(params, t)
+
+
+def _sparkle(out, params, t, seed):
+    color = np.asarray(params.colors[0], dtype=np.float32)
+    out[:] = color / 10
+    out[_sparkle_indices(params, out.shape[0], t, seed)] = color
+
+
+def _sparkle_pulse(out, params, t, seed):
+    _pulse(out, params, t, seed)
+    out[_sparkle_indices(params, out.shape[0], t, seed)] = params.colors[0]
+
+
+def _rainbow_colors(params, n, t):
+    period = max(params.period, 1e-3)
+    return color_wheel(np.arange(n) * 256 / max(n, 1) + (t / period) * 256)
+
+
+def _rainbow(out, params, t, seed):
+    out[:] = _rainbow_colors(params, out.shape[0], t)
+
+
+def _rainbow_sparkle(out, params, t, seed):
+    colors = _rainbow_colors(params, out.shape[0], t)
+    out[:] = colors / 4
+    sparkles = _sparkle_indices(params, out.shape[0], t, seed)
+    out[sparkles] = colors[sparkles]
+
+
+ANIMATIONS: Dict[str, Callable] = {
+    "blink": _blink,
+    "colorcycle": _colorcycle,
+    "comet": _comet,
+    "chase": _chase,
+    "pulse": _pulse,
+    "sparkle": _sparkle,
+    "solid": _solid,
+    "rainbow": _rainbow,
+    "sparkle_pulse": _sparkle_pulse,
+    "rainbow_comet": _rainbow_comet,
+    "rainbow_chase": _rainbow_chase,
+    "rainbow_sparkle": _rainbow_sparkle,
+    "custom_color_chase": _custom_color_chase,
+}
+
+
+class HostStrand:
+    """Host side mirror of the firmware PixelStrand, renders into a (strand_length, 3) array."""
+
+    def __init__(self, index: int, strand_length: int, now: float) -> None:
+        self.index = index
+        self.params = AnimationParams()
+        self.animation_name = "rainbow_comet"
+        # list of (name, params) played for duration seconds each, a single animation otherwise
+        self.sequence: Optional[List] = None
+        self.duration = 0.0
+        self.static = None
+        self.started = now
+        # (started, seconds, params before, params after) of a live update in progress
+        self.tween = None
+        # the strand's brightness, and (started, seconds, before, after) while it fades
+        self.level = 1.0
+        self.fade = None
+        self.work = np.zeros((strand_length, 3), dtype=np.float32)
+
+    def takes_live(self, params: Mapping) -> bool:
+        """Like PixelStrand.takes_live, args changing the running animation without a restart."""
+        if self.animation_name not in ANIMATIONS or self.static is not None:
+            return False
+        return all(name in ledproto.LIVE_PARAMS or name in ("transition", "brightness") for name in params)
+
+    def update_live(self, params: Mapping, now: float) -> None:
+        target = self.params.copy()
+        for name, value in params.items():
+            if name not in ("transition", "brightness"):
+                target.update(name, value)
+        duration = float(params.get("transition", 0))
+        if duration > 0:
+            self.tween = (now, duration, self.params.copy(), target)
+        else:
+            self.tween = None
+            self.set_params(target, now)
+
+    def set_params(self, params: AnimationParams, now: float) -> None:
+        # the animation is at the same step before and after a speed change
+        if self.params.speed > 0 and params.speed > 0:
+            self.started = now - (now - self.started) * params.speed / self.params.speed
+        self.params = params
+
+    def step_tween(self, now: float) -> None:
+        started, duration, start, end = self.tween
+        t = min((now - started) / duration, 1.0)
+        params = end.copy()
+        params.speed = start.speed + (end.speed - start.speed) * t
+        if len(start.colors) == len(end.colors):
+            params.colors = [
+                tuple(int(a + (b - a) * t) for a, b in zip(first, last))
+                for first, last in zip(start.colors, end.colors)
+            ]
+        self.set_params(params, now)
+        if t >= 1.0:
+            self.tween = None
+
+    def set_level(self, level: float, now: float, duration: float) -> None:
+        if duration > 0:
+            self.fade = (now, duration, self.level, level)
+        else:
+            self.fade = None
+            self.level = level
+
+    def step_fade(self, now: float) -> None:
+        started, duration, start, end = self.fade
+        t = min((now - started) / duration, 1.0)
+        self.level = start + (end - start) * t
+        if t >= 1.0:
+            self.fade = None
+
+    def handle_command(self, params: Mapping, now: float) -> None:
+        if "brightness" in params:
+            self.set_level(float(params["brightness"]), now, float(params.get("transition", 0)))
+            if all(name in ("brightness", "transition") for name in params):
+                return
+        if self.takes_live(params):
+            self.update_live(params, now)
+            return
+        self.tween = None
+        anim_name = self.animation_name
+        set_anim = True
+        for name, args in params.items():
+            if name == "set_animation":
+                if args not in ANIMATIONS:
+                    raise ValueError("invalid animation name")
+                anim_name = args
+            elif name == "set_pixel_colors":
+                set_anim = False
+                if self.static is None:
+                    self.static = np.zeros_like(self.work)
+                for pixel, color in args.items():
+                    self.static[int(pixel)] = [int(y) for y in color]
+            elif name == "sequence":
+                set_anim = False
+                self.set_sequence(args, now)
+            elif name in ("transition", "brightness"):
+                pass
+            else:
+                self.params.update(name, args)
+        if set_anim:
+            if anim_name not in ANIMATIONS:
+                raise ValueError("invalid animation name")
+            self.animation_name = anim_name
+            self.sequence = None
+            self.static = None
+            self.started = now
+        elif "set_pixel_colors" in params:
+            self.sequence = None
+            self.animation_name = ""
+
+    def set_sequence(self, sequence: Mapping, now: float) -> None:
+        animations = []
+        for animation in sequence.get("animations", []):
+            name = animation["set_animation"]
+            if name not in ANIMATIONS:
+                raise ValueError("invalid animation name")
+            params = self.params.copy()
+            for key, value in animation.items():
+                if key != "set_animation":
+                    params.update(key, value)
+            animations.append((name, params))
+        self.sequence = animations
+        self.duration = float(sequence.get("duration", 0))
+        self.static = None
+        self.animation_name = "sequence"
+        self.started = now
+
+    def set_frame(self, frame: bytes) -> None:
+        """Show a fixed frame of rgb bytes, like stream_pixels does on the firmware."""
+        self.static = np.frombuffer(bytes(frame), dtype=np.uint8).reshape(-1, 3).astype(np.float32)
+        self.sequence = None
+        self.tween = None
+        self.animation_name = ""
+
+    def render(self, out, now: float) -> None:
+        if self.fade is not None:
+            self.step_fade(now)
+        if self.static is not None:
+            out[:] = self.static * self.level
+            return
+        if self.tween is not None:
+            self.step_tween(now)
+        t = now - self.started
+        name, params = self.animation_name, self.params
+        if self.sequence:
+            if self.duration > 0:
+                current = int(t // self.duration)
+                t -= current * self.duration
+            else:
+                current = 0
+            name, params = self.sequence[current % len(self.sequence)]
+        ANIMATIONS[name](self.work, params, t, self.index)
+        if self.level != 1.0:
+            self.work *= self.level
+        np.clip(self.work, 0, 255, out=self.work)
+        out[:] = self.work
+
+
+class HostRenderer:
+    """Renders every strand of a display into a FrameBuffer array."""
+
+    def __init__(self, num_strands: int, strand_length: int, now: float) -> None:
+        if np is None:
+            raise ImportError("numpy is required for render_mode host")
+        self.strands = [HostStrand(i, strand_length, now) for i in range(num_strands)]
+
+    def handle_command(self, command: Mapping, now: float) -> None:
+        for key, params in command.items():
+            index = int(key)
+            if not 0 <= index < len(self.strands):
+                raise ValueError("index out of bound for configured number of leds")
+            self.strands[index].handle_command(params, now)
+
+    def set_frame(self, strand: int, frame: bytes) -> None:
+        self.strands[strand].set_frame(frame)
+
+    def render(self, array, now: float) -> None:
+        for strand, out in zip(self.strands, array):
+            strand.render(out, now)
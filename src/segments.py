@@ -0,0 +1,48 @@
+from typing import Dict, FrozenSet, List, Mapping, Sequence, Tuple
+
+# strand, first pixel, the pixel after the last one, backwards
+Run = Tuple[int, int, int, bool]
+
+
+class Segment:
+    """A logical strip made of runs of the physical strands, one after the other."""
+
+    def __init__(self, name: str, runs: Sequence[Run]) -> None:
+        self.name = name
+        self.runs = list(runs)
+        self.length = sum(end - start for _, start, end, _ in self.runs)
+        self.strands = frozenset(run[0] for run in self.runs)
+
+
+class SegmentMap:
+    """The configured segments, numbered after the strands.
+
+    Segment i is strand num_strands + i on the host and on the firmware alike, so once
+    resolve has replaced its name with that index a command goes through the checks, the
+    command cache, coalescing, presets and timelines the way a strand's does.
+    """
+
+    def __init__(self, segments: Sequence[Segment] = (), num_strands: int = 0) -> None:
+        self.segments = list(segments)
+        self.num_strands = num_strands
+        self.indices: Dict[str, int] = {segment.name: num_strands + i for i, segment in enumerate(self.segments)}
+
+    @property
+    def lengths(self) -> List[int]:
+        return [segment.length for segment in self.segments]
+
+    def resolve(self, command: Mapping) -> Mapping:
+        """command with segment names replaced by their strand index, as it is without any."""
+        if not any(key in self.indices for key in command):
+            return command
+        return {str(self.indices.get(key, key)): params for key, params in command.items()}
+
+    def strands(self, index: int) -> FrozenSet[int]:
+        """The physical strands a strand or segment index covers."""
+        if index < self.num_strands:
+            return frozenset((index,))
+        return self.segments[index - self.num_strands].strands
+
+    def runs(self) -> List[List[list]]:
+        """Every segment's runs, the define_segments message the controllers get."""
+        return [[list(run) for run in segment.runs] for segment in self.segments]
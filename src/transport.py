@@ -0,0 +1,356 @@
+import abc
+import asyncio
+import errno
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from smbus2 import I2cFunc, i2c_msg
+from viam import logging
+
+import ledproto
+
+LOG = logging.getLogger(__name__)
+
+# smbus block writes can not carry more than 32 bytes (I2C_SMBUS_BLOCK_MAX)
+MESSAGE_CHUNK_SIZE = 32
+REGISTER = ledproto.REG_COMMAND
+DEFAULT_MAX_PENDING = 16
+# i2c-dev refuses longer messages and more messages per I2C_RDWR ioctl
+I2C_MAX_MESSAGE_LEN = 8192
+I2C_RDWR_MAX_MSGS = 42
+# errors an adapter gives for a message it can not do, as opposed to a failed transfer
+UNSUPPORTED_ERRNOS = (errno.EINVAL, errno.EOPNOTSUPP)
+
+
+# used to divide a byte string into 32 byte chunks to send over i2c and then put back together on the read side
+def divide_chunks(l, n):
+
+    # looping till length l
+    for i in range(0, len(l), n):
+        yield l[i : i + n]
+
+
+def message_chunks(payload: bytes, size: int):
+    """payload in transactions of at most size bytes, none ending between two binary frames.
+
+    The firmware takes a transaction that ends on a frame boundary as the end of the
+    message, the frames after it would count as a message of their own.
+    """
+    if not ledproto.is_binary(payload):
+        yield from divide_chunks(payload, size)
+        return
+    boundaries = set()
+    offset = 0
+    while offset < len(payload):
+        length = ledproto.frame_length(payload, offset)
+        if length is None:
+            break
+        offset += length
+        boundaries.add(offset)
+    start = 0
+    while start < len(payload):
+        end = min(start + size, len(payload))
+        # frames are longer than a byte, so one byte earlier is inside a frame
+        if end < len(payload) and end in boundaries:
+            end -= 1
+        yield payload[start:end]
+        start = end
+
+
+class SharedBus:
+    """A bus handle from a BusPool, hold lock for every transaction that must not interleave."""
+
+    def __init__(self, pool: "BusPool", number: int, bus) -> None:
+        self.pool = pool
+        self.number = number
+        self.bus = bus
+        self.lock = threading.Lock()
+        self.refs = 0
+
+    def release(self) -> None:
+        self.pool.release(self)
+
+
+class BusPool:
+    """One open handle per i2c bus number for the whole process.
+
+    Every transport on a bus, across all resources, uses the same handle and lock, so a
+    message to one device is never interleaved with a message to another. Handles are
+    reference counted and closed when the last user releases them.
+    """
+
+    def __init__(self, open_bus: Callable[[int], object]) -> None:
+        self._open_bus = open_bus
+        self._buses: Dict[int, SharedBus] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def acquire(self, number: int) -> SharedBus:
+        with self._lock:
+            shared = self._buses.get(number)
+            if shared is None:
+                shared = SharedBus(self, number, self._open_bus(number))
+                self._buses[number] = shared
+                self.opened += 1
+            shared.refs += 1
+            return shared
+
+    def release(self, shared: SharedBus) -> None:
+        with self._lock:
+            shared.refs -= 1
+            if shared.refs > 0 or self._buses.get(shared.number) is not shared:
+                return
+            del self._buses[shared.number]
+        # no transport uses it anymore, take the lock anyway in case one is still finishing
+        with shared.lock:
+            shared.bus.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open_buses": len(self._buses), "buses_opened": self.opened}
+
+
+class _Unsupported(Exception):
+    def __init__(self, error: OSError) -> None:
+        super().__init__(str(error))
+        self.error = error
+
+
+class Transport(abc.ABC):
+    """Sends messages to one device without blocking the event loop.
+
+    All device I/O happens on a single worker thread, so messages never interleave on the wire.
+    Async callers go through a bounded asyncio queue: each message gets its own future, a
+    full queue makes the caller wait (backpressure) and a message whose caller timed out
+    while it was still queued is never written. Subclasses do the I/O in write and
+    read_register.
+    """
+
+    def __init__(self, name: str, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        self.name = name
+        self.max_pending = max_pending
+        self.messages_sent = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="multi-led-io")
+        self._queue: Optional[asyncio.Queue] = None
+        self._pump: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Future] = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"messages_sent": self.messages_sent}
+
+    @abc.abstractmethod
+    def write(self, payload: bytes) -> None:
+        """Blocking write of a whole message, only ever called on the worker thread."""
+
+    @abc.abstractmethod
+    def read_register(self, register: int, size: int) -> bytes:
+        """Blocking read of a device register, only ever called on the worker thread."""
+
+    def read_status(self) -> bytes:
+        return self.read_register(ledproto.REG_STATUS, ledproto.STATUS_SIZE)
+
+    def submit(self, payload: bytes) -> Future:
+        """Hand a message to the worker thread from synchronous code without waiting for it."""
+        return self._executor.submit(self.write, payload)
+
+    def send_blocking(self, payload: bytes, timeout: Optional[float] = None) -> None:
+        """Send from synchronous code such as reconfigure, waiting for the write to finish."""
+        return self.submit(payload).result(timeout)
+
+    async def send(self, payload: bytes, timeout: Optional[float] = None) -> None:
+        """Queue a message and wait until it is on the wire.
+
+        Raises asyncio.TimeoutError if the message was not written within timeout seconds,
+        including the time spent waiting for room in the queue.
+        """
+        return await self.run(self.write, payload, timeout=timeout)
+
+    async def poll_status(self, timeout: Optional[float] = None) -> dict:
+        """Read and decode the device status, see ledproto.decode_status."""
+        return ledproto.decode_status(await self.run(self.read_status, timeout=timeout))
+
+    async def poll_stats(self, timeout: Optional[float] = None) -> dict:
+        """Read and decode the device frame counters, see ledproto.decode_stats."""
+        return ledproto.decode_stats(
+            await self.run(self.read_register, ledproto.REG_STATS, ledproto.STATS_SIZE, timeout=timeout)
+        )
+
+    async def run(self, operation: Callable, *args, timeout: Optional[float] = None):
+        """Queue a blocking I/O operation for the worker thread and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._pump is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._pump = loop.create_task(self._run())
+
+        deadline = None if timeout is None else loop.time() + timeout
+        future = loop.create_future()
+        await asyncio.wait_for(self._queue.put((operation, args, future)), timeout)
+        remaining = None if deadline is None else max(deadline - loop.time(), 0)
+        # on timeout wait_for cancels the future, so the pump skips it if it is still queued
+        return await asyncio.wait_for(future, remaining)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            operation, args, future = await self._queue.get()
+            if future.done():
+                continue
+            self._current = future
+            try:
+                result = await loop.run_in_executor(self._executor, operation, *args)
+            except Exception as e:
+                LOG.error(f"{self.name} operation failed: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def close(self) -> None:
+        """Fail what is still queued and stop the worker."""
+        if self._pump is not None:
+            self._pump.cancel()
+            self._pump = None
+        if self._current is not None and not self._current.done():
+            self._current.set_exception(ConnectionError("transport closed"))
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(ConnectionError("transport closed"))
+            self._queue = None
+        # let an in flight write finish before the device goes away
+        self._executor.shutdown(wait=True)
+
+
+class I2CTransport(Transport):
+    """Sends messages to one i2c device."""
+
+    def __init__(
+        self,
+        bus,
+        address: int,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        max_transfer_size: int = I2C_MAX_MESSAGE_LEN,
+        bus_lock: Optional[threading.Lock] = None,
+    ) -> None:
+        super().__init__(f"i2c 0x{address:02x}", max_pending)
+        self.bus = bus
+        # held for a whole message, transports of other devices on the same bus share it
+        self.bus_lock = threading.Lock() if bus_lock is None else bus_lock
+        self.address = address
+        # plain i2c messages need the I2C functionality, otherwise fall back to smbus block writes
+        self.use_rdwr = bool(getattr(bus, "funcs", 0) & I2cFunc.I2C)
+        # register byte included
+        self.segment_size = max(min(max_transfer_size, I2C_MAX_MESSAGE_LEN), 2)
+        self.transfers = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "bulk_transfers": int(self.use_rdwr),
+            "segment_size": self.segment_size if self.use_rdwr else MESSAGE_CHUNK_SIZE + 1,
+            "messages_sent": self.messages_sent,
+            "transfers": self.transfers,
+        }
+
+    def write(self, payload: bytes) -> None:
+        """Blocking write of a whole message, only ever called on the worker thread."""
+        with self.bus_lock:
+            self._write(payload)
+
+    def _write(self, payload: bytes) -> None:
+        while self.use_rdwr:
+            try:
+                self._write_rdwr(payload)
+                self.messages_sent += 1
+                return
+            except _Unsupported as e:
+                self._shrink_segments(e.error)
+        self._write_blocks(payload)
+        self.messages_sent += 1
+
+    def _write_blocks(self, payload: bytes) -> None:
+        for chunk in message_chunks(payload, MESSAGE_CHUNK_SIZE):
+            self.bus.write_i2c_block_data(self.address, REGISTER, chunk)
+            self.transfers += 1
+
+    def _write_rdwr(self, payload: bytes) -> None:
+        # every segment starts with the register byte, same as a block write, so the
+        # firmware can treat each transaction the same way
+        segments = [
+            i2c_msg.write(self.address, bytes((REGISTER,)) + chunk)
+            for chunk in message_chunks(payload, self.segment_size - 1)
+        ]
+        for i in range(0, len(segments), I2C_RDWR_MAX_MSGS):
+            try:
+                self.bus.i2c_rdwr(*segments[i : i + I2C_RDWR_MAX_MSGS])
+            except OSError as e:
+                # the adapter rejects oversized messages before anything is sent, so only
+                # the first transfer of a message can be retried with smaller segments
+                if i == 0 and e.errno in UNSUPPORTED_ERRNOS:
+                    raise _Unsupported(e)
+                raise
+            self.transfers += 1
+
+    def read_register(self, register: int, size: int) -> bytes:
+        """Blocking read of a device register, only ever called on the worker thread."""
+        with self.bus_lock:
+            if self.use_rdwr:
+                select = i2c_msg.write(self.address, [register])
+                read = i2c_msg.read(self.address, size)
+                self.bus.i2c_rdwr(select, read)
+                return bytes(read)
+            return bytes(self.bus.read_i2c_block_data(self.address, register, size))
+
+    def _shrink_segments(self, error: OSError) -> None:
+        if self.segment_size // 2 <= MESSAGE_CHUNK_SIZE + 1:
+            LOG.warning(f"i2c adapter rejected bulk transfers ({error}), falling back to block writes")
+            self.use_rdwr = False
+        else:
+            self.segment_size //= 2
+            LOG.info(f"i2c adapter rejected bulk transfer ({error}), retrying with {self.segment_size} byte segments")
+
+    def close(self, close_bus: bool = True) -> None:
+        """Like Transport.close, close_bus=False leaves a shared bus open."""
+        super().close()
+        if close_bus:
+            self.bus.close()
+
+
+class SerialTransport(Transport):
+    """Sends messages over a serial port to the uart firmware (2040_scripts/uartrp.py).
+
+    Every message is COBS encoded and ends with a zero byte, so the firmware finds message
+    boundaries however the bytes arrive. The uart firmware has no registers to read.
+    """
+
+    def __init__(self, port, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        super().__init__(f"uart {port.port}", max_pending)
+        self.port = port
+        self.bytes_sent = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "baud_rate": self.port.baudrate,
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+        }
+
+    def write(self, payload: bytes) -> None:
+        frame = ledproto.cobs_encode(payload)
+        frame.append(ledproto.COBS_DELIMITER)
+        self.port.write(frame)
+        # wait until it is out, like an i2c write returns once the bytes are on the bus
+        self.port.flush()
+        self.messages_sent += 1
+        self.bytes_sent += len(frame)
+
+    def read_register(self, register: int, size: int) -> bytes:
+        # MultiLed.poll_controllers rejects status and stats reads on uart before they get here,
+        # anyone else polling gets the error a failed i2c read would give
+        raise ConnectionError("uart transport has no registers")
+
+    def close(self) -> None:
+        super().close()
+        self.port.close()
@@ -0,0 +1,48 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the module runs from src/ and the bench from bench/, neither is an installed package
+for path in (os.path.join(ROOT, "src"), os.path.join(ROOT, "bench")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pytest  # noqa: E402
+
+import emulator  # noqa: E402
+
+
+@pytest.fixture
+def device():
+    """The firmware running on an emulated RP2040 at emulator.DEFAULT_ADDRESS."""
+    rp2040 = emulator.EmulatedRP2040()
+    rp2040.start()
+    yield rp2040
+    rp2040.stop()
+
+
+@pytest.fixture
+def bus():
+    return emulator.FakeSMBus()
+
+
+@pytest.fixture
+def make_led(monkeypatch):
+    """Builds a MultiLed from config attributes, talking to the emulated RP2040s over fake buses."""
+    import main
+    from google.protobuf.struct_pb2 import Struct
+    from viam.proto.app.robot import ComponentConfig
+
+    monkeypatch.setattr(main, "SMBus", lambda number: emulator.FakeSMBus())
+
+    def make(**fields):
+        attributes = Struct()
+        attributes.update(
+            {"num_strands": 3, "strand_length": 30, "brightness": 0.5, "address": hex(emulator.DEFAULT_ADDRESS), **fields}
+        )
+        config = ComponentConfig(name="test", attributes=attributes)
+        main.MultiLed.validate_config(config)
+        return main.MultiLed.new(config, {})
+
+    return make
@@ -0,0 +1,30 @@
+import asyncio
+
+
+def test_commands_within_the_window_go_out_as_one_message(device, make_led):
+    async def main():
+        led = make_led(coalesce_window_ms=50)
+        transport = led.controllers.controllers[0].transport
+        try:
+            sent = transport.messages_sent
+            results = await asyncio.gather(
+                led.do_command({"0": {"set_animation": "solid", "color": "red"}}),
+                led.do_command({"0": {"color": "blue"}, "1": {"set_animation": "blink"}}),
+                led.do_command({"2": {"set_pixel_colors": {"0": [1, 2, 3]}}}),
+                led.do_command({"2": {"set_pixel_colors": {"1": [4, 5, 6]}}}),
+            )
+            device.wait_idle()
+            return results, transport.messages_sent - sent, led.coalescer.stats()
+        finally:
+            await led.close()
+
+    results, sent, stats = asyncio.run(main())
+    assert all("error" not in result for result in results)
+    assert sent == 1
+    assert stats == {"commands_received": 4, "messages_sent": 1, "writes_saved": 3}
+    strands = device.display.strand_list
+    assert strands[0].animation_name == "solid"
+    assert strands[0].colors == [device.namespace["BLUE"]]
+    assert strands[1].animation_name == "blink"
+    assert strands[2].strand[0] == (1, 2, 3)
+    assert strands[2].strand[1] == (4, 5, 6)
@@ -0,0 +1,49 @@
+import pytest
+
+import commands
+
+
+def test_live_updates_are_checked_like_any_arg():
+    commands.check_command({"0": {"speed": 0.02, "transition": 1.5}, "1": {"brightness": 0.3}}, 2, 10)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"brightness": 0.3},
+        {"set_animation": "comet", "transition": 1},
+        {"speed": 0.02},
+        {"color": "red", "colors": ["blue"]},
+    ],
+)
+def test_live_updates_are_rejected_without_them(params):
+    with pytest.raises(ValueError, match="strand 1: .*i2c firmware"):
+        commands.check_command({"1": params}, 2, 10, live_updates=False)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"set_animation": "comet", "speed": 0.02, "color": "red"},
+        {"speed": 0.02, "tail_length": 3},
+        {"set_pixel_colors": {"0": [1, 2, 3]}},
+    ],
+)
+def test_restarting_commands_pass_without_live_updates(params):
+    commands.check_command({"0": params}, 1, 10, live_updates=False)
+
+
+def test_command_key_follows_content_and_arg_order():
+    command = {"0": {"set_animation": "comet", "colors": ["red", [1, 2, 3]]}, "1": {"set_pixel_colors": {"0": [1, 2, 3]}}}
+    same = {"0": {"set_animation": "comet", "colors": ["red", [1, 2, 3]]}, "1": {"set_pixel_colors": {"0": [1, 2, 3]}}}
+    assert commands.command_key(command) == commands.command_key(same)
+    assert hash(commands.command_key(command)) == hash(commands.command_key(same))
+    assert commands.command_key({"0": {"speed": 1, "color": "red"}}) != commands.command_key({"0": {"color": "red", "speed": 1}})
+    assert commands.command_key({"0": {"colors": ["red"]}}) != commands.command_key({"0": {"colors": ["blue"]}})
+    # an object is not the list of its pairs
+    assert commands.command_key({"0": {"set_pixel_colors": {"0": 1}}}) != commands.command_key({"0": {"set_pixel_colors": [("0", 1)]}})
+
+
+def test_command_key_of_unhashable_values_is_none():
+    assert commands.command_key({"0": {"colors": [[1, 2, 3], {"a": [4]}]}}) is not None
+    assert commands.command_key({"0": {"speed": object()}}) is None
@@ -0,0 +1,93 @@
+import time
+
+import ledproto
+from emulator import DEFAULT_ADDRESS, FakeSMBus
+from transport import MESSAGE_CHUNK_SIZE, I2CTransport
+
+
+def write(bus, device, payload) -> None:
+    """One write transaction of payload to the command register."""
+    bus.write_i2c_block_data(DEFAULT_ADDRESS, ledproto.REG_COMMAND, payload)
+    device.wait_idle()
+
+
+def read_status(bus) -> dict:
+    return ledproto.decode_status(bytes(bus.read_i2c_block_data(DEFAULT_ADDRESS, ledproto.REG_STATUS, ledproto.STATUS_SIZE)))
+
+
+def configure(bus, device, num_strands=3, strand_length=30) -> None:
+    write(bus, device, ledproto.encode_reconfigure(num_strands, strand_length, 0.5))
+
+
+def test_resent_message_is_applied_once(device, bus):
+    frame = ledproto.encode_timeline_keyframe(1.0, {"0": {"set_animation": "solid"}}, seq=5)
+    write(bus, device, frame)
+    write(bus, device, frame)
+    assert len(device.namespace["timeline"].keyframes) == 1
+    assert read_status(bus)["seq"] == 5
+
+    store = ledproto.encode_store_preset(3, {"0": {"set_animation": "solid"}}, seq=6)
+    write(bus, device, store)
+    write(bus, device, store)
+    write(bus, device, ledproto.encode_timeline_keyframe(2.0, {"0": {"set_animation": "blink"}}, seq=7))
+    assert len(device.namespace["timeline"].keyframes) == 2
+
+
+def test_message_split_across_transactions_is_applied_whole(device):
+    bus = FakeSMBus(smbus_only=True)
+    configure(bus, device)
+    # the first frame ends exactly where a 32 byte block write would
+    for colors in range(1, 30):
+        message = {"0": {"set_animation": "colorcycle", "colors": ["red"] * colors}, "1": {"set_pixel_colors": {"2": [1, 2, 3]}}}
+        frames = ledproto.encode_message(message, seq=9)
+        if ledproto.frame_length(frames) == MESSAGE_CHUNK_SIZE:
+            break
+    else:
+        raise AssertionError("no first frame of 32 bytes")
+    transport = I2CTransport(bus, DEFAULT_ADDRESS)
+    try:
+        transport.send_blocking(bytes(frames))
+    finally:
+        transport.close(close_bus=False)
+    device.wait_idle()
+    strands = device.display.strand_list
+    assert strands[0].animation_name == "colorcycle"
+    assert strands[1].animation_name == ""
+    assert read_status(bus)["seq"] == 9
+
+
+def test_unacknowledged_frames_leave_the_status_alone(device, bus):
+    configure(bus, device)
+    write(bus, device, ledproto.encode_message({"0": {"set_animation": "solid"}}, seq=7))
+    write(bus, device, ledproto.encode_pixel_spans({1: [(0, 2, b"\x01\x02\x03" * 2)]}))
+    # an unacknowledged command the firmware rejects does not fail the acknowledged one
+    write(bus, device, ledproto.encode_message({"9": {"set_animation": "solid"}}))
+    status = read_status(bus)
+    assert status["seq"] == 7
+    assert status["code"] == ledproto.STATUS_OK
+
+
+def test_fades_reuse_the_level_tables(device, bus, monkeypatch):
+    write(bus, device, ledproto.encode_reconfigure(8, 30, 0.5, gamma=2.2))
+    write(bus, device, ledproto.encode_message({str(i): {"brightness": 0.0} for i in range(8)}))
+    calls = {"gamma_curve": 0, "scale_curve": 0}
+    for name in calls:
+        original = getattr(ledproto, name)
+
+        def counted(*args, name=name, original=original):
+            calls[name] += 1
+            return original(*args)
+
+        monkeypatch.setattr(ledproto, name, counted)
+    display = device.display
+    write(bus, device, ledproto.encode_message({str(i): {"brightness": 1.0, "transition": 0.2} for i in range(8)}))
+    deadline = time.monotonic() + 2
+    while display.fades and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not display.fades
+    assert display.levels == [1.0] * 8
+    # every level of the fade got one table, shared by all eight strands
+    assert calls["gamma_curve"] == 0
+    assert 0 < calls["scale_curve"] <= device.namespace["FADE_STEPS"] + 1
+    assert all(table is display.pixels.tables[0] for table in display.pixels.tables)
+    assert display.pixels.tables[0] == ledproto.brightness_table(0.5, 2.2)
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import framebuffer
+from framebuffer import FrameBuffer
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "bytearray"])
+def use_numpy(request):
+    if request.param and framebuffer.np is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+
+def test_push_sends_only_changed_spans(device, make_led, use_numpy):
+    async def main():
+        led = make_led(protocol="binary")
+        frame = FrameBuffer(3, 30, use_numpy=use_numpy)
+        sent = []
+        diff_all = led.pixel_streamer.diff_all
+
+        def recorded_diff_all(frames):
+            changes = diff_all(frames)
+            sent.append({strand: [(start, count, bytes(rgb)) for start, count, rgb in spans] for strand, spans in changes.items()})
+            return changes
+
+        led.pixel_streamer.diff_all = recorded_diff_all
+        try:
+            frame.gradient(0, (0, 0, 0), (29, 0, 0))
+            await frame.push(led)
+            await frame.push(led)
+            frame.fill((0, 0, 255), strand=2, start=10, end=20)
+            frame.set_pixels(0, 3, [(7, 7, 7)])
+            await frame.push(led)
+            device.wait_idle()
+        finally:
+            await led.close()
+        return sent
+
+    sent = asyncio.run(main())
+    assert sent[1] == {}
+    assert sent[2] == {0: [(3, 1, bytes((7, 7, 7)))], 2: [(10, 10, bytes((0, 0, 255)))]}
+    strands = device.display.strand_list
+    assert strands[0].strand[3] == (7, 7, 7)
+    assert strands[0].strand[4] == (4, 0, 0)
+    assert [strands[2].strand[i] for i in (9, 10, 19, 20)] == [(0, 0, 0), (0, 0, 255), (0, 0, 255), (0, 0, 0)]
@@ -0,0 +1,209 @@
+import struct
+
+import pytest
+
+import ledproto
+
+
+def normalized(value):
+    """Decoded commands use int keys and tuple colors, the host sends str keys and lists."""
+    if isinstance(value, dict):
+        return {str(key): normalized(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalized(item) for item in value]
+    if isinstance(value, float):
+        return round(value, 5)
+    return value
+
+
+def round_trip(message, seq=0):
+    frames = ledproto.encode_message(message, seq)
+    decoded = ledproto.decode_frames(frames)
+    assert all(frame_seq == seq for frame_seq, _ in decoded)
+    merged = {}
+    for _, command in decoded:
+        merged.update(command)
+    return merged
+
+
+MESSAGES = [
+    {"reconfigure": {"num_strands": 8, "strand_length": 300, "brightness": 0.25, "host_render": True, "frame_rate": 60, "gamma": 2.2}},
+    {"set_brightness": 0.5},
+    {"recall_preset": 3},
+    {"delete_preset": 31},
+    {"timeline_clear": {"loop": True, "length": 2.5}},
+    {"timeline_start": 1.25},
+    {"timeline_start": ledproto.TIMELINE_HERE},
+    {"timeline_seek": 0.0},
+    {"timeline_stop": 0.0},
+    {"define_segments": [[[0, 0, 60, False]], [[0, 60, 120, False], [1, 0, 120, True]]]},
+    {"0": {"set_animation": "comet", "speed": 0.05, "color": "red", "tail_length": 10, "bounce": 1}},
+    {"1": {"colors": ["blue", [1, 2, 3]], "size": 2, "spacing": 300, "period": 4, "num_sparkles": 7, "step": 1}},
+    {"2": {"speed": 0.02, "transition": 1.5, "brightness": 0.5}},
+    {"0": {"set_pixel_colors": {"0": [255, 0, 0], "299": [0, 0, 255]}}},
+    {"3": {"sequence": {"animations": [{"set_animation": "pulse", "period": 2}, {"set_animation": "solid", "color": "teal"}], "duration": 3}}},
+]
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_round_trip(message):
+    assert normalized(round_trip(message, seq=7)) == normalized(message)
+
+
+def test_every_opcode_is_covered():
+    opcodes = set()
+    messages = MESSAGES + [
+        {"store_preset": {"id": 1, "scene": {"0": {"set_animation": "solid"}}}},
+        {"timeline_keyframe": {"at": 1.0, "scene": {"0": {"set_animation": "solid"}}}},
+    ]
+    for message in messages:
+        frames = ledproto.encode_message(message)
+        offset = 0
+        while offset < len(frames):
+            opcodes.add(frames[offset + 2])
+            offset += ledproto.frame_length(frames, offset)
+    opcodes.add(ledproto.encode_pixel_spans({0: [(0, 1, b"\x01\x02\x03")]})[2])
+    expected = {value for name, value in vars(ledproto).items() if name.startswith("OP_")}
+    assert opcodes == expected
+
+
+@pytest.mark.parametrize("name", ["store_preset", "timeline_keyframe"])
+def test_nested_scene_round_trip(name):
+    scene = {"0": {"set_animation": "solid", "color": "red"}, "1": {"set_pixel_colors": {"3": [1, 2, 3]}}}
+    stored = {"id": 5, "scene": scene} if name == "store_preset" else {"at": 1.5, "scene": scene}
+    decoded = round_trip({name: stored}, seq=9)
+    assert normalized(decoded) == normalized({name: stored})
+
+
+def test_pixel_spans_round_trip():
+    spans = [(0, 3, b"\x01\x02\x03" * 3), (10, 5, b"\x09\x08\x07")]
+    [(seq, command)] = ledproto.decode_frames(ledproto.encode_pixel_spans({2: spans}, seq=4))
+    pixels = [None] * 20
+    ledproto.apply_pixel_spans(pixels, command[2]["pixel_spans"])
+    assert seq == 4
+    assert pixels[:3] == [(1, 2, 3)] * 3
+    assert pixels[10:15] == [(9, 8, 7)] * 5
+    assert pixels[3:10] == [None] * 7
+
+
+def test_multi_frame_message_shares_seq():
+    message = {
+        "0": {"set_animation": "solid"},
+        "1": {"set_pixel_colors": {"0": [1, 2, 3]}},
+        "2": {"sequence": {"animations": [{"set_animation": "blink"}], "duration": 1}},
+    }
+    frames = ledproto.encode_message(message, seq=42)
+    decoded = ledproto.decode_frames(frames)
+    assert len(decoded) == 3
+    assert {seq for seq, _ in decoded} == {42}
+    assert ledproto.frames_complete(frames)
+    assert not ledproto.frames_complete(frames[:-1])
+
+
+def test_set_seq_rewrites_every_frame():
+    message = {"0": {"set_animation": "solid"}, "1": {"set_pixel_colors": {"0": [1, 2, 3]}}}
+    frames = ledproto.set_seq(ledproto.encode_message(message), 200)
+    assert [seq for seq, _ in ledproto.decode_frames(frames)] == [200, 200]
+    assert frames == ledproto.encode_message(message, seq=200)
+
+
+def test_crc_mismatch():
+    frame = ledproto.encode_brightness(0.5)
+    frame[ledproto.HEADER_SIZE] ^= 0xFF
+    with pytest.raises(ledproto.ProtocolError, match="crc"):
+        ledproto.decode_frame(frame)
+
+
+def test_length_mismatch():
+    # a valid crc over a payload one byte longer than its contents
+    payload = struct.pack("<f", 0.5) + b"\x00"
+    frame = ledproto.encode_frame(ledproto.OP_SET_BRIGHTNESS, payload)
+    with pytest.raises(ledproto.ProtocolError, match="length"):
+        ledproto.decode_frame(frame)
+
+
+def test_truncated_payload():
+    frame = ledproto.encode_frame(ledproto.OP_SET_ANIMATION, b"\x02\x00")
+    with pytest.raises(ledproto.ProtocolError, match="truncated"):
+        ledproto.decode_frame(frame)
+
+
+def test_incomplete_frame():
+    frame = ledproto.encode_brightness(0.5)
+    assert ledproto.frame_length(frame[:3]) is None
+    with pytest.raises(ledproto.ProtocolError, match="incomplete"):
+        ledproto.decode_frame(frame[:-1])
+
+
+def test_bad_magic_and_version():
+    frame = ledproto.encode_brightness(0.5)
+    with pytest.raises(ledproto.ProtocolError, match="magic"):
+        ledproto.frame_length(b"\x00" + bytes(frame[1:]))
+    with pytest.raises(ledproto.ProtocolError, match="version"):
+        ledproto.frame_length(bytes(frame[:1]) + b"\x09" + bytes(frame[2:]))
+
+
+def test_unknown_names_are_rejected():
+    with pytest.raises(ledproto.ProtocolError):
+        ledproto.encode_message({"0": {"set_animation": "nope"}})
+    with pytest.raises(ledproto.ProtocolError):
+        ledproto.encode_message({"0": {"color": "nope"}})
+    with pytest.raises(ledproto.ProtocolError):
+        ledproto.encode_message({"0": {"nope": 1}})
+    with pytest.raises(ledproto.ProtocolError, match="strand 0"):
+        ledproto.encode_message({"0": 1})
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\x00",
+        b"\x00" * 5,
+        b"\x01\x00\x00\x02",
+        bytes(range(1, 255)),
+        bytes(range(1, 255)) + b"\x00",
+        bytes(range(1, 256)),
+        bytes(i % 255 + 1 for i in range(254 * 3)),
+        bytes(i % 7 for i in range(1000)),
+    ],
+)
+def test_cobs_round_trip(data):
+    encoded = ledproto.cobs_encode(data)
+    assert ledproto.COBS_DELIMITER not in encoded
+    # at most one byte of overhead per 254 bytes, plus the first code byte
+    assert len(encoded) <= len(data) + len(data) // 254 + 1
+    assert ledproto.cobs_decode(encoded) == data
+
+
+def test_cobs_full_block_has_no_implied_zero():
+    data = bytes(range(1, 255))
+    assert ledproto.cobs_encode(data) == b"\xff" + data
+
+
+def test_cobs_bad_block():
+    with pytest.raises(ledproto.ProtocolError):
+        ledproto.cobs_decode(b"\x05\x01\x02")
+    with pytest.raises(ledproto.ProtocolError):
+        ledproto.cobs_decode(b"\x02\x01\x00")
+
+
+def test_status_and_stats_round_trip():
+    status = ledproto.decode_status(ledproto.encode_status(3, ledproto.STATUS_ERROR, 300, 12.7, "x" * 40))
+    assert status == {"seq": 3, "code": 1, "bad_frames": 300 & 0xFF, "receive_ms": 12, "error": "x" * ledproto.STATUS_ERROR_MAX}
+    stats = ledproto.decode_stats(ledproto.encode_stats(30, 1000, 5, 1, 2, 3))
+    assert stats == {"shows_per_s": 30, "loops_per_s": 1000, "shows": 5, "late_frames": 1, "dropped_frames": 2, "deferred": 3}
+
+
+def test_old_reconfigure_without_frame_rate_or_gamma():
+    payload = struct.pack(ledproto.RECONFIGURE_FORMAT, 3, 120, 0.2, 0)
+    _, _, command, _ = ledproto.decode_frame(ledproto.encode_frame(ledproto.OP_RECONFIGURE, payload))
+    assert command["reconfigure"]["frame_rate"] == 0
+    assert command["reconfigure"]["gamma"] == 1.0
+
+
+@pytest.mark.parametrize("gamma", [1.0, 2.2])
+def test_brightness_table(gamma):
+    table = ledproto.brightness_table(0.5, gamma)
+    assert table == bytes(min(int((i / 255) ** gamma * 0.5 * 255 + 0.5), 255) for i in range(256))
+    assert ledproto.scale_curve(ledproto.gamma_curve(gamma), 0.5) == table
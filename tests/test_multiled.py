@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import ledproto
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_streamed_pixels_keep_the_acknowledged_seq(device, make_led):
+    async def main():
+        led = make_led(protocol="binary", acknowledge=True)
+        try:
+            assert await led.do_command({"0": {"set_animation": "solid", "color": "red"}}) == {"seq": 1}
+            await led.do_command({"stream_pixels": {"1": [[i, 0, 0] for i in range(30)]}})
+            device.wait_idle()
+            assert (await led.do_command({"get_status": {}}))["seq"] == 1
+            # acknowledged commands with frames streaming in between
+            results = await asyncio.gather(
+                *(led.do_command({"0": {"set_animation": "solid", "color": "blue" if i % 2 else "red"}}) for i in range(5)),
+                *(led.do_command({"stream_pixels": {"1": [[i, j, 0] for j in range(30)]}}) for i in range(5)),
+            )
+            return results, led.ack_stats
+        finally:
+            await led.close()
+
+    results, ack_stats = run(main())
+    assert [result["seq"] for result in results[:5]] == [2, 3, 4, 5, 6]
+    assert all("error" not in result for result in results)
+    assert ack_stats == {"acknowledged": 6, "resent": 0, "errors": 0}
+
+
+def test_timeline_positions_must_be_numbers(device, make_led):
+    async def main():
+        led = make_led()
+        try:
+            keyframe = {"at": True, "scene": {"0": {"set_animation": "solid"}}}
+            for command in (
+                {"start_timeline": True},
+                {"start_timeline": {"at": True}},
+                {"seek_timeline": {"at": "1"}},
+                {"seek_timeline": {}},
+                {"load_timeline": {"keyframes": [keyframe]}},
+                {"load_timeline": {"keyframes": [{**keyframe, "at": 1}], "length": True}},
+            ):
+                with pytest.raises(ValueError):
+                    await led.do_command(command)
+        finally:
+            await led.close()
+
+    run(main())
+    assert device.namespace["timeline"].keyframes == []
+
+
+def test_seeking_applies_the_keyframes_up_to_the_position(device, make_led):
+    async def main():
+        led = make_led(protocol="binary")
+        try:
+            keyframes = [
+                {"at": 0, "scene": {"0": {"set_animation": "solid"}}},
+                {"at": 1, "scene": {"0": {"set_animation": "blink"}, "1": {"set_animation": "pulse"}}},
+                {"at": 2, "scene": {"2": {"set_animation": "comet"}}},
+            ]
+            assert (await led.do_command({"load_timeline": {"keyframes": keyframes}}))["keyframes"] == 3
+            await led.do_command({"seek_timeline": {"at": 1.5}})
+            device.wait_idle()
+            shown = [strand.animation_name for strand in device.display.strand_list]
+            timeline = device.namespace["timeline"]
+            position = (timeline.playing, timeline.position_ns, timeline.next)
+            await led.do_command({"seek_timeline": 0.5})
+            device.wait_idle()
+            return shown, position, device.display.strand_list[0].animation_name
+        finally:
+            await led.close()
+
+    shown, position, rewound = run(main())
+    assert shown == ["blink", "pulse", "rainbow_comet"]
+    # seeking does not start playback, the keyframe at 2 is next
+    assert position == (False, 1_500_000_000, 2)
+    assert rewound == "solid"
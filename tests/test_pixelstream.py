@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import pixelstream
+from pixelstream import PixelStreamer, changed_ranges
+
+
+@pytest.fixture(params=["numpy", "memoryview"])
+def compare(request, monkeypatch):
+    """Runs a test with the numpy diff and again with the plain python one."""
+    if request.param == "numpy":
+        if pixelstream.np is None:
+            pytest.skip("numpy is not installed")
+    else:
+        monkeypatch.setattr(pixelstream, "np", None)
+    return request.param
+
+
+def frame(colors, strand_length=40):
+    return pixelstream.frame_from_colors(colors, strand_length)
+
+
+def test_changed_ranges(compare):
+    previous = bytes(frame([[1, 2, 3]] * 40))
+    assert changed_ranges(None, previous) == [(0, 40)]
+    assert changed_ranges(previous, previous) == []
+    assert changed_ranges(previous, memoryview(bytearray(previous))) == []
+
+    current = bytearray(previous)
+    # one channel of pixels 0, 5, 7, 16 (first pixel of the second compare block) and 39
+    for pixel in (0, 5, 7, 16, 39):
+        current[pixel * 3 + 2] = 9
+    # pixels 5 and 7 are one gap apart and merge, the rest stay separate
+    assert changed_ranges(previous, current) == [(0, 1), (5, 8), (16, 17), (39, 40)]
+    assert changed_ranges(previous, memoryview(current)) == [(0, 1), (5, 8), (16, 17), (39, 40)]
+
+
+def test_diff_sends_only_changed_spans(compare):
+    streamer = PixelStreamer(2, 40)
+    black = frame([])
+    assert streamer.diff(0, black) == [(0, 40, bytes(3))]
+    assert streamer.diff(0, black) == []
+
+    current = frame([[0, 0, 0]] * 10 + [[5, 5, 5]] * 6 + [[0, 0, 0], [1, 2, 3]])
+    spans = [(start, count, bytes(rgb)) for start, count, rgb in streamer.diff(0, current)]
+    # the unchanged pixel 16 is resent with 17 rather than starting another span
+    assert spans == [(10, 6, bytes((5, 5, 5))), (16, 2, bytes((0, 0, 0, 1, 2, 3)))]
+    assert streamer.last_frames[0] == bytes(current)
+    assert streamer.last_frames[1] is None
+
+
+def test_streamed_frames_send_only_changed_pixels(device, make_led):
+    async def main():
+        led = make_led(protocol="binary")
+        try:
+            colors = [[i, 0, 0] for i in range(30)]
+            await led.do_command({"stream_pixels": {"0": colors}})
+            device.wait_idle()
+            bus = led.controllers.controllers[0].transport.bus
+            sent = bus.write_bytes
+            colors[12] = [0, 200, 0]
+            await led.do_command({"stream_pixels": {"0": colors}})
+            device.wait_idle()
+            return bus.write_bytes - sent
+        finally:
+            await led.close()
+
+    sent = asyncio.run(main())
+    strand = device.display.strand_list[0].strand
+    assert [strand[i] for i in range(30)] == [(i, 0, 0) for i in range(12)] + [(0, 200, 0)] + [
+        (i, 0, 0) for i in range(13, 30)
+    ]
+    # one pixel plus the frame around it, not the whole strand
+    assert sent < 30
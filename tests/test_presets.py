@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+
+def test_presets_are_stored_on_the_firmware_and_recalled(device, make_led):
+    async def main():
+        led = make_led(protocol="binary")
+        transport = led.controllers.controllers[0].transport
+        try:
+            night = {"0": {"set_animation": "solid", "color": "blue"}, "1": {"set_animation": "pulse"}}
+            assert await led.do_command({"store_preset": {"name": "night", "scene": night}}) == {"preset": "night", "id": 0}
+            day = {"0": {"set_animation": "blink"}}
+            assert (await led.do_command({"store_preset": {"name": "day", "scene": day}}))["id"] == 1
+            device.wait_idle()
+            assert sorted(device.namespace["presets"]) == [0, 1]
+            # storing applies nothing
+            assert device.display.strand_list[0].animation_name == "rainbow_comet"
+
+            await led.do_command({"recall_preset": "night"})
+            device.wait_idle()
+            assert [strand.animation_name for strand in device.display.strand_list] == ["solid", "pulse", "rainbow_comet"]
+
+            await led.do_command({"stream_pixels": {"1": [[9, 9, 9]] * 30}})
+            await led.do_command({"recall_preset": 1})
+            device.wait_idle()
+            assert device.display.strand_list[0].animation_name == "blink"
+            # strand 1 was left alone by day, the frame streamed to it is not sent again
+            sent = transport.messages_sent
+            await led.do_command({"stream_pixels": {"1": [[9, 9, 9]] * 30}})
+            assert transport.messages_sent == sent
+
+            # storing a name again keeps its id
+            night = {"0": {"set_animation": "comet"}}
+            assert (await led.do_command({"store_preset": {"name": "night", "scene": night}}))["id"] == 0
+            assert await led.do_command({"delete_preset": "day"}) == {}
+            device.wait_idle()
+            assert sorted(device.namespace["presets"]) == [0]
+            assert await led.do_command({"list_presets": {}}) == {"presets": {"night": 0}}
+            with pytest.raises(ValueError):
+                await led.do_command({"recall_preset": "day"})
+        finally:
+            await led.close()
+
+    asyncio.run(main())
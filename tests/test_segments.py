@@ -0,0 +1,39 @@
+import asyncio
+
+SEGMENTS = [
+    {"name": "left", "runs": [{"strand": 0, "start": 0, "end": 10}]},
+    {"name": "across", "runs": [{"strand": 0, "start": 5, "end": 30}, {"strand": 1, "reverse": True}]},
+    {"name": "right", "runs": [{"strand": 2, "start": 20}]},
+]
+
+
+def test_the_last_addressed_of_overlapping_strands_and_segments_shows(device, make_led):
+    async def main():
+        led = make_led(protocol="binary", segments=SEGMENTS)
+        display = device.display
+        steps = []
+        try:
+            for command in (
+                {"left": {"set_animation": "solid", "color": "red"}},
+                {"across": {"set_animation": "pulse"}},
+                {"1": {"set_animation": "blink"}},
+                {"right": {"set_animation": "solid", "color": "blue"}},
+            ):
+                await led.do_command(command)
+                device.wait_idle()
+                steps.append(list(display.showing))
+            return steps, display.overlaps, display.strand_list[3].strand[0]
+        finally:
+            await led.close()
+
+    steps, overlaps, left_pixel = asyncio.run(main())
+    # strands 0-2 then the segments left, across and right
+    assert overlaps == [[3, 4], [4], [5], [0, 4], [0, 1, 3], [2]]
+    assert steps == [
+        [False, True, True, True, False, False],
+        [False, False, True, False, True, False],
+        [False, True, True, False, False, False],
+        [False, True, False, False, False, True],
+    ]
+    # a stopped segment is dark
+    assert left_pixel == (0, 0, 0)
@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+import pytest
+
+from emulator import FakeSMBus
+import ledproto
+from transport import MESSAGE_CHUNK_SIZE, REGISTER, BusPool, I2CTransport, SerialTransport, Transport, message_chunks
+
+
+class LatencyBus(FakeSMBus):
+    """FakeSMBus that records every write instead of handing it to a firmware, each transaction takes latency seconds."""
+
+    def __init__(self, latency: float, smbus_only: bool = False) -> None:
+        super().__init__(smbus_only)
+        self.latency = latency
+        self.writes = []
+        self.closed = False
+
+    def _write(self, address: int, data: bytes) -> None:
+        time.sleep(self.latency)
+        self.writes.append((address, bytes(data)))
+        self.transactions += 1
+        self.write_bytes += len(data)
+
+    def _read(self, address: int, size: int) -> bytes:
+        time.sleep(self.latency)
+        self.transactions += 1
+        self.read_bytes += size
+        return bytes(size)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def message(tag: int, size: int) -> bytes:
+    return bytes((tag,)) * size
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_write_does_not_block_the_event_loop():
+    bus = LatencyBus(0.2)
+    transport = I2CTransport(bus, 0x40)
+
+    async def main():
+        gaps = []
+        sending = asyncio.ensure_future(asyncio.gather(*(transport.send(message(i, 10)) for i in range(3))))
+        last = time.monotonic()
+        while not sending.done():
+            await asyncio.sleep(0.005)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+        await sending
+        return gaps
+
+    try:
+        gaps = run(main())
+    finally:
+        transport.close()
+    # 0.6 s of bus time went by while the loop kept ticking every few milliseconds
+    assert len(gaps) > 20
+    assert max(gaps) < 0.1
+    assert len(bus.writes) == 3
+
+
+def test_writes_keep_their_order():
+    bus = LatencyBus(0.001)
+    transport = I2CTransport(bus, 0x40)
+
+    async def main():
+        await asyncio.gather(*(transport.send(message(i, 5)) for i in range(20)))
+
+    try:
+        run(main())
+    finally:
+        transport.close()
+    assert [data[1] for _, data in bus.writes] == list(range(20))
+    assert all(data[0] == REGISTER for _, data in bus.writes)
+
+
+def test_block_writes_split_messages_into_chunks():
+    bus = LatencyBus(0, smbus_only=True)
+    transport = I2CTransport(bus, 0x40)
+    try:
+        transport.send_blocking(message(7, 100))
+    finally:
+        transport.close()
+    chunks = [data for _, data in bus.writes]
+    assert [len(chunk) - 1 for chunk in chunks] == [MESSAGE_CHUNK_SIZE] * 3 + [100 - 3 * MESSAGE_CHUNK_SIZE]
+    assert b"".join(chunk[1:] for chunk in chunks) == message(7, 100)
+
+
+def test_chunks_never_end_between_two_frames():
+    frames = bytes(ledproto.encode_brightness(0.5) * 20)
+    length = ledproto.frame_length(frames)
+    for size in range(length, 3 * length + 2):
+        chunks = list(message_chunks(frames, size))
+        assert b"".join(chunks) == frames
+        assert all(0 < len(chunk) <= size for chunk in chunks)
+        ends = [sum(len(chunk) for chunk in chunks[: i + 1]) for i in range(len(chunks) - 1)]
+        assert all(end % length for end in ends)
+
+
+def test_shared_bus_never_interleaves_messages():
+    pool = BusPool(lambda number: LatencyBus(0.002, smbus_only=True))
+    shared = pool.acquire(1)
+    assert pool.acquire(1) is shared
+    transports = [I2CTransport(shared.bus, address, bus_lock=shared.lock) for address in (0x40, 0x41)]
+
+    async def main():
+        # every message takes four block writes, each device gets three at once
+        await asyncio.gather(
+            *(
+                transport.send(message(device << 4 | i, 4 * MESSAGE_CHUNK_SIZE))
+                for device, transport in enumerate(transports)
+                for i in range(3)
+            )
+        )
+
+    try:
+        run(main())
+    finally:
+        for transport in transports:
+            transport.close(close_bus=False)
+    # the message tag of every block write, each message has to be one contiguous run
+    tags = [data[1] for _, data in shared.bus.writes]
+    runs = [tag for i, tag in enumerate(tags) if i == 0 or tags[i - 1] != tag]
+    assert len(tags) == 6 * 4
+    assert len(runs) == 6
+    # and every device's messages arrive in the order they were sent, to its address
+    for device, transport in enumerate(transports):
+        assert [tag for tag in runs if tag >> 4 == device] == [device << 4 | i for i in range(3)]
+        assert {address for address, data in shared.bus.writes if data[1] >> 4 == device} == {transport.address}
+
+    shared.release()
+    assert not shared.bus.closed
+    shared.release()
+    assert shared.bus.closed
+    assert pool.stats() == {"open_buses": 0, "buses_opened": 1}
+
+
+def test_timed_out_message_is_not_written():
+    bus = LatencyBus(0.2)
+    transport = I2CTransport(bus, 0x40)
+
+    async def main():
+        first = asyncio.ensure_future(transport.send(message(1, 5)))
+        with pytest.raises(asyncio.TimeoutError):
+            await transport.send(message(2, 5), timeout=0.05)
+        await first
+
+    try:
+        run(main())
+    finally:
+        transport.close()
+    assert [data[1] for _, data in bus.writes] == [1]
+
+
+def test_transports_have_to_implement_the_io():
+    class WriteOnly(Transport):
+        def write(self, payload: bytes) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnly("write only")
+
+
+def test_uart_status_poll_raises_connection_error():
+    class Port:
+        port = "/dev/ttyACM0"
+
+        def close(self) -> None:
+            pass
+
+    async def main():
+        transport = SerialTransport(Port())
+        try:
+            with pytest.raises(ConnectionError):
+                await transport.poll_status()
+        finally:
+            transport.close()
+
+    run(main())